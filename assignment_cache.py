@@ -0,0 +1,113 @@
+"""
+Per-assignment cache of the static grading inputs.
+
+Every submission message carries the full rubric and activity instruction of
+its assignment. Sanitizing the instruction, serializing the rubric, building
+the response schema and the criterion/level lookup table, and assembling the
+prompt prefix only depend on those, so they are done once per assignment
+version and shared by all of its submissions.
+"""
+import json, threading
+from collections import OrderedDict
+from prompt_builder import build_prompt_prefix
+from rubric_schema import build_response_schema, levels_by_criterion
+from job_state_store import fingerprint
+from metrics import ASSIGNMENT_CACHE_LOOKUPS
+
+
+class AssignmentContext:
+    """
+    The static grading inputs of one version of an assignment. Treat as read-only:
+    instances are shared by all submissions of the assignment.
+
+    Attributes:
+        criteria (list[dict]): Rubric criteria from the submission message.
+        activity_instruction (str): The sanitized activity instruction.
+        rubric (str): The rubric serialized for the prompt.
+        levels (dict[str, set[str]]): Level IDs of each criterion ID, for validating reviews.
+        response_schema (dict): Response schema built from the rubric.
+        prompt_prefix (str): Everything in the prompt before the student code.
+        prefix_key (str): Stable hash of `prompt_prefix`, e.g. to group submissions for batch grading.
+        context_hash (str): Fingerprint of the rubric and sanitized instruction, used to
+            detect that a resubmission is graded against a changed assignment.
+    """
+
+    def __init__(self, criteria: list[dict], activity_instruction: str, output_template: str):
+        """
+        Args:
+            criteria (list[dict]): Rubric criteria from the submission message.
+            activity_instruction (str): The sanitized activity instruction.
+            output_template (str): Expected format of the model's response.
+        """
+        self.criteria = criteria
+        self.activity_instruction = activity_instruction
+        self.rubric = json.dumps(criteria)
+        self.levels = levels_by_criterion(criteria)
+        self.response_schema = build_response_schema(criteria)
+        self.prompt_prefix = build_prompt_prefix(self.rubric, activity_instruction, output_template)
+        self.prefix_key = fingerprint(self.prompt_prefix)
+        self.context_hash = fingerprint([criteria, activity_instruction])
+
+
+class AssignmentCache:
+    """
+    Process-local LRU cache of `AssignmentContext` per assignment ID. Thread-safe.
+
+    Each entry records the content hash of the raw rubric and instruction it was
+    built from. A message whose hash differs (the teacher edited the assignment)
+    rebuilds the entry, so it never serves stale content.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        Args:
+            max_entries (int, optional): Assignments kept before the least recently used is evicted.
+                0 disables caching: every lookup builds a fresh context.
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # assignmentid -> (content_hash, AssignmentContext)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(criteria: list[dict], activity_instruction: str | None) -> str:
+        """
+        Hash the raw assignment content of a submission message.
+
+        Args:
+            criteria (list[dict]): Rubric criteria from the submission message.
+            activity_instruction (str, optional): The activity instruction before sanitizing.
+
+        Returns:
+            str: A stable SHA-256 hex digest.
+        """
+        return fingerprint([criteria, activity_instruction])
+
+    def get(self, assignmentid, content_hash: str, build) -> AssignmentContext:
+        """
+        Return the context of an assignment, building it if missing or stale.
+
+        Args:
+            assignmentid: The Moodle assignment ID.
+            content_hash (str): `content_hash` of the submission's rubric and instruction.
+            build (callable): Called without arguments to build the context on a miss.
+
+        Returns:
+            AssignmentContext: The cached or newly built context.
+        """
+        key = str(assignmentid)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == content_hash:
+                self._entries.move_to_end(key)
+                ASSIGNMENT_CACHE_LOOKUPS.labels("hit").inc()
+                return entry[1]
+
+        ASSIGNMENT_CACHE_LOOKUPS.labels("stale" if entry is not None else "miss").inc()
+        context = build()  # Outside the lock; concurrent misses build the same context
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (content_hash, context)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return context
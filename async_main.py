@@ -0,0 +1,440 @@
+import os, json, time, signal, asyncio, logging
+import aio_pika, httpx
+from http_client import create_async_client
+import moodle_service
+from moodle_service import MoodleService
+from status_report_service import StatusReportService, SUPABASE_API_URL
+from metrics import (
+    track_stage, track_peak_memory, record_repo_files, start_metrics_server, worker_status,
+    SUBMISSIONS, STAGES_SKIPPED, REGRADES, STARTUP_SECONDS
+)
+from scheduling import FairScheduler, scheduling_key, queue_arguments
+from retry_topology import (
+    declare_retry_topology_async, failure_destination, dead_letter_queue_name, RETRY_MAX_ATTEMPTS, ATTEMPT_HEADER
+)
+from job_state_store import fingerprint, STAGE_FILES, STAGE_REVIEW, STAGE_GRADE_SAVED, STAGE_REPORTED
+from regrade_store import (
+    file_hashes, is_small_change, update_file_hashes, admitted_changes, REGRADE_FULL, REGRADE_INCREMENTAL, REGRADE_UNCHANGED
+)
+from github_repository import GitHubRepository
+
+# Reuses the configuration, logging setup and shared caches of the blocking worker
+from main import (
+    MQ_HOST, MQ_PORT, MQ_USERNAME, MQ_PASS, QUEUE, METRICS_PORT, QUEUE_DEPTH_INTERVAL, GITHUB_MAX_CONCURRENCY,
+    WORKER_ID, DRAIN_TIMEOUT, FAIR_SCHEDULING, INCREMENTAL_MAX_CHANGED_FILES, INCREMENTAL_MAX_CHANGED_LINES, regrade_store,
+    load_graded_state, save_graded_state, GITHUB_API_URL, WARMUP, WARMUP_TIMEOUT, sanitize, warm_up,
+    create_repository, load_assignment, create_grader, analyze, load_checkpoint, save_checkpoint, status_reporter, moodle_outbox,
+    batch_grader,
+)
+
+# ---------------------------------------------------------
+# Async Worker Configuration
+# ---------------------------------------------------------
+
+# Submissions in flight at once; also the RabbitMQ prefetch count
+ASYNC_CONCURRENCY = max(1, int(os.getenv("ASYNC_CONCURRENCY", "32")))
+
+# With FAIR_SCHEDULING, messages prefetched beyond ASYNC_CONCURRENCY wait in the fair scheduler
+ASYNC_SCHEDULER_PREFETCH = max(ASYNC_CONCURRENCY, int(os.getenv("ASYNC_SCHEDULER_PREFETCH", str(ASYNC_CONCURRENCY * 4))))
+
+# Connection pool size per client, shared by all in-flight submissions
+ASYNC_HTTP_POOL_SIZE = int(os.getenv("ASYNC_HTTP_POOL_SIZE", "100"))
+
+logger = logging.getLogger(__name__)
+
+# Only show WARNING and ERROR from the AMQP client
+logging.getLogger("aio_pika").setLevel(logging.WARNING)
+logging.getLogger("aiormq").setLevel(logging.WARNING)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+async def send_status_report(submission_data: dict, status: str, details: str, http_client: httpx.AsyncClient) -> None:
+    """Queue a status report for the background bulk insert, or POST it when buffering is disabled."""
+    details = f"{details} [worker: {WORKER_ID}]"
+    with track_stage("status_report"):
+        if status_reporter is not None:
+            status_reporter.report(submission_data, status, details)
+        else:
+            await StatusReportService.send_report_async(submission_data, status, details, client=http_client)
+
+
+async def fetch_submission_files(repo: GitHubRepository, previous: dict | None, http_client: httpx.AsyncClient) -> dict:
+    """Asynchronous version of `main.fetch_submission_files`."""
+    head_sha = await repo.get_head_commit_sha_async(http_client) if regrade_store is not None else None
+    if previous is not None:
+        base_sha = previous["commit_sha"]
+        try:
+            if head_sha != base_sha:
+                status, changes = await repo.compare_commits_async(http_client, base_sha, head_sha)
+            else:
+                status, changes = "identical", []
+        except Exception as e:
+            logger.warning("Failed to compare with the previously graded commit, regrading in full: %s", e)
+            status, changes = None, []
+
+        if status in ("ahead", "identical") and is_small_change(changes, INCREMENTAL_MAX_CHANGED_FILES, INCREMENTAL_MAX_CHANGED_LINES):
+            changed_files = await repo.get_changed_files_async(
+                http_client, changes, head_sha, max_concurrency=GITHUB_MAX_CONCURRENCY
+            )
+            hashes = update_file_hashes(previous["files"], changes, changed_files)
+            mode = REGRADE_UNCHANGED if hashes == previous["files"] else REGRADE_INCREMENTAL
+            return {"mode": mode, "commit_sha": head_sha, "files": changed_files, "file_hashes": hashes,
+                    "changes": admitted_changes(changes, changed_files)}
+        logger.info("🔁 Change since the graded commit %s is too large or not linear (%s, %d files); regrading in full.",
+                    base_sha[:7], status, len(changes))
+
+    repo_files = await repo.get_files_async(http_client, max_concurrency=GITHUB_MAX_CONCURRENCY, commit_sha=head_sha)
+    return {"mode": REGRADE_FULL, "commit_sha": repo.commit_sha, "files": repo_files,
+            "file_hashes": file_hashes(repo_files), "changes": []}
+
+
+async def process_submission(body: bytes, http_client: httpx.AsyncClient, moodle_client: httpx.AsyncClient) -> bool:
+    """
+    Grade a single submission and report its status, without blocking the event loop.
+
+    This is the coroutine counterpart of `main.process_submission` and runs the
+    same stages: GitHub fetch, LLM review, Moodle update and status report, and
+    resumes from the same job state checkpoints.
+
+    Args:
+        body (bytes): The JSON-encoded submission data.
+        http_client (httpx.AsyncClient): Shared client for GitHub and Supabase.
+        moodle_client (httpx.AsyncClient): Shared client for Moodle.
+
+    Returns:
+        bool: True if the message should be acknowledged, False if it should be requeued.
+    """
+    submission_data = None
+    try:
+        # Parse message from JSON
+        with track_stage("json_parse"):
+            submission_data = json.loads(body)
+
+        # Extract relevant fields
+        assignmentid = submission_data.get('assignmentid')
+        userid = submission_data.get('userid')
+
+        # Clean potentially unsafe HTML input from Moodle; the assignment's is only sanitized when it changes
+        with track_stage("sanitize"):
+            github_link = sanitize(submission_data.get('onlinetext'))
+            assignment = load_assignment(submission_data)
+        activity_instruction = assignment.activity_instruction
+
+        job_key, completed = await asyncio.to_thread(load_checkpoint, submission_data)
+        if STAGE_REPORTED in completed:
+            logger.info("⏩ Submission %s was already graded and reported; acknowledging duplicate.", job_key)
+            STAGES_SKIPPED.labels("all").inc()
+            return True
+
+        review_result = completed.get(STAGE_REVIEW)
+        if review_result is not None:
+            logger.info("⏩ Resuming submission %s with its stored review; skipping GitHub fetch and AI review.", job_key)
+            STAGES_SKIPPED.labels("github_fetch").inc()
+            STAGES_SKIPPED.labels("llm").inc()
+        else:
+            context_hash = assignment.context_hash
+            student_key, previous = await asyncio.to_thread(load_graded_state, submission_data, github_link, context_hash)
+
+            logger.info("🔍 Fetching repository files from url: %s", github_link)
+            repo = create_repository(github_link)
+            with track_stage("github_fetch"):
+                fetched = await fetch_submission_files(repo, previous, http_client)
+            repo_files = fetched["files"]
+            record_repo_files(repo_files)
+            if repo.skipped_files:
+                logger.info("🗂️ Skipped %d files before download.", len(repo.skipped_files))
+            await asyncio.to_thread(save_checkpoint, job_key, STAGE_FILES, {
+                "file_hash": fingerprint(fetched["file_hashes"]), "file_count": len(fetched["file_hashes"]),
+                "commit_sha": fetched["commit_sha"]
+            })
+
+            if fetched["mode"] == REGRADE_UNCHANGED:
+                logger.info("⏩ No gradable changes since the graded commit %s; reusing its review.", previous["commit_sha"][:7])
+                review_result = previous["review"]
+                valid = True
+            else:
+                if fetched["mode"] == REGRADE_INCREMENTAL:
+                    logger.info("🤖 Running incremental AI code review of %d changed files...", len(fetched["changes"]))
+                    code_grader = create_grader(repo_files, assignment,
+                                                previous_review=previous["review"], changes=fetched["changes"])
+                else:
+                    analysis = await asyncio.to_thread(analyze, repo_files, activity_instruction)
+                    logger.info("🤖 Running AI code review...")
+                    code_grader = create_grader(repo_files, assignment, analysis=analysis)
+                if batch_grader is not None:
+                    review_result = await batch_grader.grade_async(code_grader)
+                else:
+                    review_result = await code_grader.get_structured_review_async()
+                valid = not code_grader.validate_review(review_result)
+
+            if valid:
+                REGRADES.labels(fetched["mode"]).inc()
+                await asyncio.to_thread(save_checkpoint, job_key, STAGE_REVIEW, review_result)
+                await asyncio.to_thread(save_graded_state, student_key, {
+                    "repo": github_link, "commit_sha": fetched["commit_sha"], "files": fetched["file_hashes"],
+                    "review": review_result, "context_hash": context_hash
+                })
+
+        review_hash = fingerprint(review_result)
+        if completed.get(STAGE_GRADE_SAVED, {}).get("review_hash") == review_hash:
+            logger.info("⏩ Grade for submission %s is already saved in Moodle; not posting it again.", job_key)
+            STAGES_SKIPPED.labels("moodle_post").inc()
+        else:
+            logger.info("🎓 Sending grading results to Moodle...")
+            with track_stage("moodle_post"):
+                if moodle_outbox is not None:
+                    await asyncio.to_thread(
+                        moodle_outbox.enqueue, assignmentid, userid, review_result, context=submission_data
+                    )
+                else:
+                    await MoodleService.save_grade_async(assignmentid, userid, review_result, moodle_client)
+            await asyncio.to_thread(save_checkpoint, job_key, STAGE_GRADE_SAVED, {"review_hash": review_hash})
+        logger.info("✅ Submission processed successfully.")
+        SUBMISSIONS.labels("graded").inc()
+
+        try:
+            await send_status_report(submission_data, "success", "Autograde completed successfully.", http_client)
+            await asyncio.to_thread(save_checkpoint, job_key, STAGE_REPORTED, {"status": "success"})
+            logger.info("📝 Sent status report to Autograder Dashboard.")
+        except Exception as sub_e:
+            logger.warning("📝 Failed to send status report to Autograder Dashboard: %s", sub_e)
+
+        return True
+
+    except Exception as e:
+        logger.exception("❌ Error processing submission: %s", e)
+
+        # Send autograding report to Autograder Dashboard
+        try:
+            await send_status_report(submission_data, "fail", f"Error autograding submission. {e}", http_client)
+            logger.info("📝 Sent failure status report for manual intervention.")
+            SUBMISSIONS.labels("failed").inc()
+            return True
+        except Exception as sub_e:
+            logger.error("📝 Failed to send failure status report: %s", sub_e)
+            logger.info("🔄 Requeuing task...")
+            SUBMISSIONS.labels("requeued").inc()
+            return False
+
+
+async def warm_up_async(http_client: httpx.AsyncClient, moodle_client: httpx.AsyncClient) -> dict[str, float]:
+    """
+    Asyncio counterpart of `main.warm_up`: opens the first connections of the
+    shared httpx clients, and runs the sanitizer and LLM steps on a thread.
+
+    Returns:
+        dict[str, float]: Seconds taken by each step that completed.
+    """
+    async def timed(name: str, request) -> tuple[str, float | None]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(request, WARMUP_TIMEOUT)
+        except Exception as e:
+            logger.warning("🔥 Warm-up of %s failed: %s", name, e or type(e).__name__)
+            return name, None
+        return name, time.perf_counter() - started
+
+    checks = [timed("github", http_client.head(GITHUB_API_URL))]
+    if moodle_service.MOODLE_API_URL:
+        checks.append(timed("moodle", moodle_client.head(moodle_service.MOODLE_API_URL)))
+    if SUPABASE_API_URL:
+        checks.append(timed("supabase", http_client.head(SUPABASE_API_URL)))
+
+    durations, *results = await asyncio.gather(asyncio.to_thread(warm_up, include_http=False), *checks)
+    durations.update((name, seconds) for name, seconds in results if seconds is not None)
+    return durations
+
+
+async def main() -> None:
+    """
+    Asyncio entry point: consumes submissions with aio-pika and grades up to
+    `ASYNC_CONCURRENCY` of them concurrently on a single event loop.
+
+    HTTP clients are created once and shared, so connections to GitHub, Moodle
+    and Supabase are kept alive across submissions.
+
+    Like the threaded worker, it reports ready only after connecting and
+    running `warm_up_async`.
+
+    On SIGTERM the consumer is cancelled and in-flight submissions get up to
+    `DRAIN_TIMEOUT` seconds to finish and be settled before the connection closes.
+
+    With `FAIR_SCHEDULING`, up to `ASYNC_SCHEDULER_PREFETCH` messages are held
+    and a `FairScheduler` decides which of them take the `ASYNC_CONCURRENCY`
+    processing slots (highest priority first, round-robin across courses).
+    Messages still waiting for a slot are requeued when draining.
+    """
+    verify_ssl = moodle_service.ENV != 'development'
+    started = time.perf_counter()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)  # /healthz answers while starting; /readyz waits for consuming
+        logger.info("📈 Serving metrics on port %d at /metrics", METRICS_PORT)
+
+    async with create_async_client(pool_size=ASYNC_HTTP_POOL_SIZE) as http_client, \
+               create_async_client(verify=verify_ssl, pool_size=ASYNC_HTTP_POOL_SIZE) as moodle_client:
+        try:
+            # Connect to RabbitMQ
+            connection = await aio_pika.connect_robust(
+                host=MQ_HOST,
+                port=int(MQ_PORT or 5672),
+                login=MQ_USERNAME,
+                password=MQ_PASS
+            )
+        except Exception as e:
+            logger.exception(f"Failed to connect to RabbitMQ: {e}")
+            raise SystemExit(1)
+
+        async with connection:
+            channel = await connection.channel()
+
+            # Never hold more unacknowledged messages than we work on at once
+            await channel.set_qos(prefetch_count=ASYNC_SCHEDULER_PREFETCH if FAIR_SCHEDULING else ASYNC_CONCURRENCY)
+
+            # Ensure the target queue exists
+            queue = await channel.declare_queue(QUEUE, durable=True, arguments=queue_arguments())
+            if RETRY_MAX_ATTEMPTS > 0:
+                await declare_retry_topology_async(channel, QUEUE)
+            logger.info("✅ Connected to RabbitMQ at %s, listening on queue: %s", MQ_HOST, QUEUE)
+            STARTUP_SECONDS.labels("connect").set(time.perf_counter() - started)
+            worker_status.configure(WORKER_ID, ASYNC_CONCURRENCY, liveness_timeout=max(60.0, 4 * QUEUE_DEPTH_INTERVAL))
+
+            if WARMUP:
+                warm_up_started = time.perf_counter()
+                durations = await warm_up_async(http_client, moodle_client)
+                STARTUP_SECONDS.labels("warm_up").set(time.perf_counter() - warm_up_started)
+                logger.info("🔥 Warm-up done: %s",
+                            ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(durations.items())) or "nothing")
+
+            draining = asyncio.Event()
+            settled = asyncio.Event()  # Set whenever no delivery is awaiting ack/nack
+            settled.set()
+            unsettled = 0
+            scheduler = FairScheduler() if FAIR_SCHEDULING else None
+            free_slots = ASYNC_CONCURRENCY
+
+            def dispatch():
+                """Start the next scheduled submissions while processing slots are free."""
+                nonlocal free_slots
+                while free_slots > 0:
+                    turn = scheduler.get()
+                    if turn is None:
+                        return
+                    free_slots -= 1
+                    turn.set_result(None)
+
+            async def retry_later(message: aio_pika.abc.AbstractIncomingMessage):
+                """Move a failed message to its delayed retry queue, or the dead-letter queue."""
+                destination, headers = failure_destination(QUEUE, message.headers)
+                try:
+                    await channel.default_exchange.publish(
+                        aio_pika.Message(
+                            message.body, headers=headers, content_type=message.content_type, priority=message.priority,
+                            delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                        ),
+                        routing_key=destination, mandatory=True
+                    )
+                except Exception as e:
+                    logger.error("Failed to schedule retry, requeuing the submission: %s", e)
+                    await message.nack(requeue=True)
+                    return
+                await message.ack()
+
+                if destination == dead_letter_queue_name(QUEUE):
+                    logger.error("☠️ Submission failed %d times; moved to dead-letter queue %s.", RETRY_MAX_ATTEMPTS, destination)
+                    SUBMISSIONS.labels("dead_lettered").inc()
+                else:
+                    logger.info("⏳ Submission will be retried via %s (attempt %d of %d).",
+                                destination, headers[ATTEMPT_HEADER] + 1, RETRY_MAX_ATTEMPTS)
+
+            async def on_message(message: aio_pika.abc.AbstractIncomingMessage):
+                """Process one delivery; aio-pika runs each callback as its own task."""
+                nonlocal unsettled, free_slots
+                logger.info("📦 New submission received...")
+                unsettled += 1
+                settled.clear()
+                try:
+                    if scheduler is not None:
+                        # Wait for a processing slot; the turn is cancelled if the worker drains first
+                        turn = asyncio.get_running_loop().create_future()
+                        course, priority = scheduling_key(message.body, message.priority)
+                        scheduler.put(course, turn, priority)
+                        dispatch()
+                        try:
+                            await turn
+                        except asyncio.CancelledError:
+                            await message.nack(requeue=True)
+                            return
+
+                    worker_status.start_work()
+                    try:
+                        with track_peak_memory():
+                            success = await process_submission(message.body, http_client, moodle_client)
+                    finally:
+                        worker_status.finish_work()
+                        if scheduler is not None:
+                            free_slots += 1
+                            dispatch()
+                    if success:
+                        await message.ack()
+                    elif RETRY_MAX_ATTEMPTS > 0:
+                        await retry_later(message)
+                    else:
+                        await message.nack(requeue=True)
+                finally:
+                    unsettled -= 1
+                    if unsettled == 0:
+                        settled.set()
+
+            async def sample_queue_depth():
+                """Periodically record the number of ready messages with a passive declare."""
+                while True:
+                    worker_status.heartbeat()  # Stops if the event loop is blocked
+                    try:
+                        declared = await channel.declare_queue(QUEUE, passive=True)
+                        worker_status.set_queue_depth(declared.declaration_result.message_count)
+                    except Exception as e:
+                        logger.warning("Failed to sample queue depth: %s", e)
+                    await asyncio.sleep(QUEUE_DEPTH_INTERVAL)
+
+            if METRICS_PORT:
+                depth_task = asyncio.create_task(sample_queue_depth())  # noqa: F841 (keep a reference)
+
+            if status_reporter is not None:
+                status_reporter.start()  # Replays reports left unsent by a previous run
+            if moodle_outbox is not None:
+                moodle_outbox.start()  # Resumes grades left undelivered by a previous run
+
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, draining.set)
+            consumer_tag = await queue.consume(on_message, consumer_tag=f"autograder-{WORKER_ID}")
+            worker_status.set_connected(True)
+            STARTUP_SECONDS.labels("total").set(time.perf_counter() - started)
+            logger.info("🚀 Ready in %.2fs.", time.perf_counter() - started)
+            logger.info("📡 Waiting for new submissions (concurrency: %d). Press CTRL+C to stop.", ASYNC_CONCURRENCY)
+            try:
+                await draining.wait()  # Run until SIGTERM or cancelled
+
+                logger.info("🚰 SIGTERM received: draining %d in-flight submissions (timeout %.0fs)...",
+                            unsettled, DRAIN_TIMEOUT)
+                worker_status.start_draining()
+                await queue.cancel(consumer_tag)
+                if scheduler is not None:
+                    for turn in scheduler.drain():
+                        turn.cancel()  # Requeued by its on_message task
+                try:
+                    await asyncio.wait_for(settled.wait(), DRAIN_TIMEOUT)
+                    logger.info("🚰 Drain complete; all in-flight submissions settled.")
+                except asyncio.TimeoutError:
+                    logger.warning("🚰 Drain timed out; %d submissions will be redelivered.", unsettled)
+            finally:
+                worker_status.set_connected(False)
+                if moodle_outbox is not None:
+                    await asyncio.to_thread(moodle_outbox.close)
+                if status_reporter is not None:
+                    await asyncio.to_thread(status_reporter.close)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("🛑 Interrupted by user. Shutting down gracefully...")
@@ -0,0 +1,162 @@
+import asyncio, logging, threading
+from concurrent.futures import Future
+from llm_code_grader import LLMCodeGrader
+from metrics import track_stage, record_llm_usage
+
+logger = logging.getLogger(__name__)
+
+BATCH_INSTRUCTIONS = """### Batch grading
+- The code of {count} different students is given below, each introduced by a line "=== SUBMISSION <key> ===".
+- Grade every submission independently, as if it were the only one; never compare students.
+- Respond **only** with one JSON object that maps each submission key to that student's review in the response template format, e.g. {{"{first_key}": {{...}}, ...}}.
+"""
+
+
+class BatchGrader:
+    """
+    Grades several submissions of the same assignment with a single LLM call.
+
+    Submissions whose prompts share the same prefix (intro, task definition,
+    rubric, activity instructions and response template) are collected for up
+    to `window_seconds` or until `max_batch_size` are waiting. The shared
+    prefix is then sent once, followed by each student's code under its own
+    key, and the model's combined answer is split back into one review per
+    student. Any student missing from the answer, or whose review does not
+    match the rubric, is handed back to its own worker to be graded alone, so
+    those calls run in parallel instead of one after another on the timer thread.
+
+    Batching only happens when several submissions are in flight at once,
+    i.e. with a worker concurrency greater than one. Batches are graded with
+    the backend's blocking API on a timer thread, also for the async worker.
+    """
+
+    def __init__(self, window_seconds: float = 2.0, max_batch_size: int = 8):
+        """
+        Args:
+            window_seconds (float, optional): How long the first submission of a batch
+                waits for others to join.
+            max_batch_size (int, optional): Batch size that triggers grading immediately.
+        """
+        self.window_seconds = window_seconds
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending = {}  # prefix hash -> list of (grader, future)
+        self._timers = {}  # prefix hash -> window timer of the pending batch
+        self._lock = threading.Lock()
+
+    def grade(self, grader: LLMCodeGrader):
+        """
+        Grade a submission, possibly together with others of the same assignment.
+
+        Blocks until the review is available. Cached reviews are returned
+        immediately without joining a batch.
+
+        Args:
+            grader (LLMCodeGrader): Grader with the submission's prompt assembled.
+
+        Returns:
+            dict | str: The parsed review, as returned by `LLMCodeGrader.get_structured_review`.
+        """
+        cached_review = grader.get_cached_review()
+        if cached_review is not None:
+            return cached_review
+        review = self.submit(grader).result()
+        return review if review is not None else grader.get_structured_review()
+
+    async def grade_async(self, grader: LLMCodeGrader):
+        """
+        Asynchronous version of `grade`: the event loop is free while the batch waits and is graded.
+
+        Args:
+            grader (LLMCodeGrader): Grader with the submission's prompt assembled.
+
+        Returns:
+            dict | str: The parsed review, as returned by `LLMCodeGrader.get_structured_review`.
+        """
+        cached_review = await asyncio.to_thread(grader.get_cached_review)
+        if cached_review is not None:
+            return cached_review
+        # A submission that fills its batch grades it in the submitting thread, so submit off the loop
+        future = await asyncio.to_thread(self.submit, grader)
+        review = await asyncio.wrap_future(future)
+        return review if review is not None else await grader.get_structured_review_async()
+
+    def submit(self, grader: LLMCodeGrader) -> Future:
+        """
+        Queue a grader for batch grading.
+
+        Args:
+            grader (LLMCodeGrader): Grader with the submission's prompt assembled.
+
+        Returns:
+            Future: Resolves to the submission's review, or to None if the batch did not
+                produce a valid one and the caller has to grade the submission on its own.
+        """
+        future = Future()
+        group_key = grader.prefix_key
+
+        with self._lock:
+            group = self._pending.setdefault(group_key, [])
+            group.append((grader, future))
+            if len(group) == 1:
+                # The timer is bound to this batch, so it cannot cut short the window of a later one
+                timer = self._timers[group_key] = threading.Timer(self.window_seconds, self._flush,
+                                                                  args=(group_key, group))
+                timer.daemon = True
+                timer.start()
+            ready = len(group) >= self.max_batch_size
+
+        if ready:
+            self._flush(group_key, group)
+        return future
+
+    def _flush(self, group_key: str, batch: list[tuple[LLMCodeGrader, Future]]) -> None:
+        """Take a pending batch, unless it was flushed already, and grade it."""
+        with self._lock:
+            if self._pending.get(group_key) is not batch:
+                return  # Already flushed because it filled up before the window closed
+            del self._pending[group_key]
+            timer = self._timers.pop(group_key)
+        timer.cancel()  # No-op when called from the timer itself
+
+        try:
+            if len(batch) == 1:
+                batch[0][1].set_result(None)  # Nothing to batch with; its worker grades it
+                return
+            self._grade_batch(batch)
+        except Exception as e:
+            logger.exception("Batch grading failed: %s", e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _grade_batch(self, batch: list[tuple[LLMCodeGrader, Future]]) -> None:
+        """Send one combined prompt for the batch and hand each student their review."""
+        keys = [f"submission_{i + 1}" for i in range(len(batch))]
+        first_grader = batch[0][0]
+
+        sections = [first_grader.prompt_prefix, BATCH_INSTRUCTIONS.format(count=len(batch), first_key=keys[0])]
+        for key, (grader, _) in zip(keys, batch):
+            sections.append(f"=== SUBMISSION {key} ===\n{grader.code_content}")
+        prompt = "\n".join(sections)
+
+        logger.info("📚 Grading a batch of %d submissions in one LLM call.", len(batch))
+        reviews = {}
+        try:
+            with track_stage("llm_call_batch"):
+                # The keyed answer has no fixed schema; each review is validated against its rubric after the split
+                response = first_grader.backend.generate(prompt, json_output=True)
+            record_llm_usage(response)
+            reviews = first_grader.parse_response_text(response.text)
+        except Exception as e:
+            logger.warning("Batch LLM call failed, grading submissions individually: %s", e)
+
+        for key, (grader, future) in zip(keys, batch):
+            review = reviews.get(key) if isinstance(reviews, dict) else None
+            if isinstance(review, str):
+                review = grader.parse_response_text(review)
+            if review is not None and not grader.validate_review(review):
+                grader.store_review(review, response.backend)
+                future.set_result(review)
+            else:
+                logger.info("Submission %s missing or invalid in batch response; grading it individually.", key)
+                future.set_result(None)
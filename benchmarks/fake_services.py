@@ -0,0 +1,187 @@
+"""
+Local stand-ins for the services the autograder talks to, for offline benchmarks.
+
+- FakeGitHubServer: Contents API, tarball and commit lookup for synthetic repositories.
+- FakeSinkServer: accepts any POST (Moodle REST, Supabase PostgREST) and records it.
+- FakeChannel: records acks/nacks the way a pika channel would receive them.
+
+The LLM is replaced by `grader_backends.FakeBackend` (LLM_BACKENDS=fake).
+"""
+import io, json, time, base64, random, tarfile, hashlib, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    """Request handler base that simulates latency and stays quiet."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _BackgroundServer:
+    """A ThreadingHTTPServer running on a daemon thread on a free local port."""
+
+    def __init__(self, handler_class):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def generate_repository(owner: str, repo: str, files_per_repo: int = 20, file_size: int = 2000) -> dict[str, str]:
+    """
+    Deterministically generate a synthetic repository for `owner/repo`.
+
+    Returns:
+        dict[str, str]: Mapping of file path to content.
+    """
+    rng = random.Random(f"{owner}/{repo}")
+    files = {"README.md": f"# {repo}\n\nSubmission by {owner}.\n"}
+    for i in range(files_per_repo - 1):
+        directory = rng.choice(["", "src/", "src/utils/", "tests/"])
+        body = "".join(
+            f"def function_{i}_{j}(a, b):\n    return a + b * {j}\n\n" for j in range(max(1, file_size // 40))
+        )
+        files[f"{directory}module_{i}.py"] = body[:file_size]
+    return files
+
+
+class FakeGitHubServer(_BackgroundServer):
+    """
+    Serves `/repos/{owner}/{repo}/contents/...`, `/tarball[/{ref}]` and `/commits/{ref}`
+    for synthetic repositories generated on demand.
+    """
+
+    def __init__(self, files_per_repo: int = 20, file_size: int = 2000, latency: float = 0.0):
+        repos = {}
+        lock = threading.Lock()
+        self.requests = 0
+
+        def get_repo(owner, repo):
+            with lock:
+                key = (owner, repo)
+                if key not in repos:
+                    repos[key] = generate_repository(owner, repo, files_per_repo, file_size)
+                return repos[key]
+
+        outer = self
+
+        class Handler(_QuietHandler):
+            def do_GET(self):
+                outer.requests += 1
+                path = self.path.split("?", 1)[0]
+                parts = path.strip("/").split("/")
+                if len(parts) < 4 or parts[0] != "repos":
+                    return self._send(404, b"{}")
+
+                owner, repo, endpoint, rest = parts[1], parts[2], parts[3], parts[4:]
+                files = get_repo(owner, repo)
+                sha = hashlib.sha1(json.dumps(files, sort_keys=True).encode()).hexdigest()
+
+                if endpoint == "commits":
+                    return self._send(200, sha.encode(), "text/plain")
+                if endpoint == "tarball":
+                    return self._send(200, self._tarball(owner, repo, sha, files), "application/x-gzip")
+                if endpoint == "contents":
+                    return self._contents(owner, repo, "/".join(rest), files)
+                return self._send(404, b"{}")
+
+            def do_HEAD(self):
+                return self._send(200, b"")
+
+            def _contents(self, owner, repo, target, files):
+                base = f"http://{self.headers.get('Host')}/repos/{owner}/{repo}/contents"
+                if target in files:
+                    body = {"encoding": "base64", "content": base64.b64encode(files[target].encode()).decode()}
+                    return self._send(200, json.dumps(body).encode())
+
+                prefix = f"{target}/" if target else ""
+                entries = {}
+                for path, content in files.items():
+                    if not path.startswith(prefix):
+                        continue
+                    name = path[len(prefix):].split("/", 1)[0]
+                    item_path = prefix + name
+                    is_dir = "/" in path[len(prefix):]
+                    entries[name] = {
+                        "name": name, "path": item_path, "type": "dir" if is_dir else "file",
+                        "size": 0 if is_dir else len(content.encode()), "url": f"{base}/{item_path}"
+                    }
+                if not entries:
+                    return self._send(404, b"{}")
+                return self._send(200, json.dumps([entries[n] for n in sorted(entries)]).encode())
+
+            @staticmethod
+            def _tarball(owner, repo, sha, files):
+                buffer = io.BytesIO()
+                with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+                    for path, content in sorted(files.items()):
+                        data = content.encode()
+                        info = tarfile.TarInfo(f"{owner}-{repo}-{sha[:7]}/{path}")
+                        info.size = len(data)
+                        archive.addfile(info, io.BytesIO(data))
+                return buffer.getvalue()
+
+        Handler.latency = latency
+        super().__init__(Handler)
+
+
+class FakeSinkServer(_BackgroundServer):
+    """Accepts every POST with a 200 JSON response and records the request paths."""
+
+    def __init__(self, latency: float = 0.0):
+        self.posts = []
+        outer = self
+
+        class Handler(_QuietHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                outer.posts.append(self.path.split("?", 1)[0])
+                return self._send(200, b"{}")
+
+            def do_HEAD(self):
+                return self._send(200, b"")
+
+        Handler.latency = latency
+        super().__init__(Handler)
+
+
+class FakeChannel:
+    """Records message settlements like a pika channel. Thread-safe."""
+
+    def __init__(self):
+        self.acked = 0
+        self.nacked = 0
+        self._lock = threading.Lock()
+
+    def basic_ack(self, delivery_tag: int):
+        with self._lock:
+            self.acked += 1
+
+    def basic_nack(self, delivery_tag: int, requeue: bool = True):
+        with self._lock:
+            self.nacked += 1
@@ -0,0 +1,185 @@
+"""
+Offline throughput/latency benchmark of the grading pipeline.
+
+Replays a corpus of recorded submission messages (the README message format)
+through `main.process_submission`, dispatched on a worker pool the same way
+`main.main()` does, against local fake GitHub, LLM, Moodle and Supabase
+services. No network access or credentials are needed.
+
+Usage (from the repository root):
+    python -m benchmarks.pipeline_benchmark --repeat 10 --concurrency 8 --llm-latency 2
+    python -m benchmarks.pipeline_benchmark --concurrency 1 --files-per-repo 200 --memory
+"""
+import os, sys, json, time, argparse, resource, threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_services import FakeGitHubServer, FakeSinkServer, FakeChannel
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus", "submissions.jsonl")
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """Return the pct-th percentile (nearest-rank) of the samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL file of submission messages")
+    parser.add_argument("--repeat", type=int, default=5, help="times to replay the corpus")
+    parser.add_argument("--concurrency", type=int, default=4, help="worker pool size (WORKER_CONCURRENCY)")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="mean fake LLM latency in seconds")
+    parser.add_argument("--github-latency", type=float, default=0.02, help="fake GitHub latency per request")
+    parser.add_argument("--moodle-latency", type=float, default=0.05, help="fake Moodle/Supabase latency per request")
+    parser.add_argument("--files-per-repo", type=int, default=20, help="files in each synthetic repository")
+    parser.add_argument("--file-size", type=int, default=2000, help="bytes per synthetic file")
+    parser.add_argument("--fetch-mode", default="contents", choices=("contents", "tarball"))
+    parser.add_argument("--memory", action="store_true",
+                        help="trace allocations and report the peak memory per submission (MEMORY_PROFILING)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment settings for the worker (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, github: FakeGitHubServer, sink: FakeSinkServer) -> None:
+    """Point the worker configuration at the fake services. Must run before importing `main`."""
+    os.environ.update({
+        "GITHUB_API_URL": github.url,
+        "GITHUB_TOKEN": "benchmark-token",
+        "GITHUB_FETCH_MODE": args.fetch_mode,
+        "MOODLE_API_URL": f"{sink.url}/moodle/webservice/rest/server.php",
+        "MOODLE_API_TOKEN": "benchmark-token",
+        "SUPABASE_API_URL": f"{sink.url}/supabase/rest/v1",
+        "SUPABASE_API_KEY": "benchmark-key",
+        "LLM_BACKENDS": "fake",
+        "FAKE_LLM_LATENCY": str(args.llm_latency),
+        "WORKER_CONCURRENCY": str(args.concurrency),
+        "METRICS_PORT": "0",
+        "JOB_STATE_DB": "",  # Replays reuse submission IDs; checkpoints would skip them
+        "STATUS_REPORT_JOURNAL": "",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        "MEMORY_PROFILING": "true" if args.memory else "false",
+    })
+    for setting in args.env:
+        key, _, value = setting.partition("=")
+        os.environ[key] = value
+
+
+def run(args) -> dict:
+    """Run the benchmark and return the report."""
+    github = FakeGitHubServer(args.files_per_repo, args.file_size, latency=args.github_latency).start()
+    sink = FakeSinkServer(latency=args.moodle_latency).start()
+    configure_environment(args, github, sink)
+
+    # Imported late so the worker modules read the benchmark environment
+    import metrics, main
+
+    stage_samples = defaultdict(list)
+    samples_lock = threading.Lock()
+
+    def on_stage(stage, seconds):
+        with samples_lock:
+            stage_samples[stage].append(seconds)
+
+    metrics.add_stage_listener(on_stage)
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = [line.strip().encode("utf-8") for line in f if line.strip()]
+    messages = corpus * args.repeat
+
+    channel = FakeChannel()
+    end_to_end = []
+
+    def work(delivery_tag: int, body: bytes):
+        start = time.perf_counter()
+        with metrics.track_peak_memory():
+            success = main.process_submission(body)
+        elapsed = time.perf_counter() - start
+        with samples_lock:
+            end_to_end.append(elapsed)
+        if success:
+            channel.basic_ack(delivery_tag)
+        else:
+            channel.basic_nack(delivery_tag, requeue=True)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="grader") as executor:
+        for delivery_tag, body in enumerate(messages, start=1):
+            executor.submit(work, delivery_tag, body)
+    wall_time = time.perf_counter() - started
+    if main.status_reporter is not None:
+        main.status_reporter.close()  # Deliver the buffered dashboard reports before counting POSTs
+
+    github.stop()
+    sink.stop()
+
+    def summarize(samples):
+        return {
+            "count": len(samples),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        }
+
+    return {
+        "submissions": len(messages),
+        "concurrency": args.concurrency,
+        "fetch_mode": args.fetch_mode,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_per_s": round(len(messages) / wall_time, 3) if wall_time else 0.0,
+        "acked": channel.acked,
+        "nacked": channel.nacked,
+        "github_requests": github.requests,
+        "moodle_supabase_posts": len(sink.posts),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "submission_peak_memory_mb": submission_peak_memory_mb(),
+        "end_to_end": summarize(end_to_end),
+        "stages": {stage: summarize(samples) for stage, samples in sorted(stage_samples.items())},
+    }
+
+
+def submission_peak_memory_mb() -> float | None:
+    """Return the mean traced peak memory per submission in MB, or None unless --memory was given."""
+    from prometheus_client import REGISTRY
+
+    count = REGISTRY.get_sample_value("autograder_submission_peak_memory_bytes_count")
+    if not count:
+        return None
+    return round(REGISTRY.get_sample_value("autograder_submission_peak_memory_bytes_sum") / count / 1024 / 1024, 2)
+
+
+def print_report(report: dict) -> None:
+    """Print the report as a readable table."""
+    print(f"Submissions:      {report['submissions']} (acked {report['acked']}, nacked {report['nacked']})")
+    print(f"Concurrency:      {report['concurrency']}  fetch mode: {report['fetch_mode']}")
+    print(f"Wall time:        {report['wall_time_s']} s")
+    print(f"Throughput:       {report['throughput_per_s']} submissions/s")
+    print(f"GitHub requests:  {report['github_requests']}  Moodle/Supabase POSTs: {report['moodle_supabase_posts']}")
+    print(f"Peak RSS:         {report['peak_rss_mb']} MB")
+    if report["submission_peak_memory_mb"] is not None:
+        print(f"Peak memory:      {report['submission_peak_memory_mb']} MB per submission (mean, traced)")
+    print()
+    print(f"{'stage':<20}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    rows = list(report["stages"].items()) + [("end_to_end", report["end_to_end"])]
+    for stage, stats in rows:
+        print(f"{stage:<20}{stats['count']:>8}{stats['p50_ms']:>12}{stats['p95_ms']:>12}{stats['p99_ms']:>12}")
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Cold-start benchmark of the grading worker.
+
+Starts a fresh interpreter per run and measures how long `import main` takes,
+which heavy modules that import loads, and how long `main.warm_up` takes
+against local fake GitHub, LLM, Moodle and Supabase services. No network
+access or credentials are needed.
+
+Usage (from the repository root):
+    python -m benchmarks.startup_benchmark --runs 10
+"""
+import os, sys, json, argparse, subprocess
+
+from benchmarks.fake_services import FakeGitHubServer, FakeSinkServer
+from benchmarks.pipeline_benchmark import percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the worker should only load when it needs them
+HEAVY_MODULES = ("pika", "aio_pika", "bleach", "httpx", "google.generativeai", "grpc")
+
+# Runs in each child interpreter and prints one JSON line
+PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+modules, heavy = len(sys.modules), [name for name in {heavy!r} if name in sys.modules]
+steps = main.warm_up() if {warm_up} else {{}}
+print(json.dumps({{
+    "import_s": imported - started,
+    "warm_up_s": time.perf_counter() - imported,
+    "steps": steps,
+    "modules": modules,
+    "heavy": heavy,
+}}))
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument("--no-warm-up", action="store_true", help="only measure the import")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment settings for the worker (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def worker_environment(args, github: FakeGitHubServer, sink: FakeSinkServer) -> dict:
+    """Return the environment of the child interpreters, pointed at the fake services."""
+    env = dict(os.environ)
+    env.update({
+        "GITHUB_API_URL": github.url,
+        "GITHUB_TOKEN": "benchmark-token",
+        "MOODLE_API_URL": f"{sink.url}/moodle/webservice/rest/server.php",
+        "MOODLE_API_TOKEN": "benchmark-token",
+        "SUPABASE_API_URL": f"{sink.url}/supabase/rest/v1",
+        "SUPABASE_API_KEY": "benchmark-key",
+        "LLM_BACKENDS": "fake",
+        "METRICS_PORT": "0",
+        "JOB_STATE_DB": "",
+        "STATUS_REPORT_JOURNAL": "",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    for setting in args.env:
+        key, _, value = setting.partition("=")
+        env[key] = value
+    return env
+
+
+def run(args) -> dict:
+    """Run the benchmark and return the report."""
+    github = FakeGitHubServer().start()
+    sink = FakeSinkServer().start()
+    env = worker_environment(args, github, sink)
+    probe = PROBE.format(warm_up=not args.no_warm_up, heavy=HEAVY_MODULES)
+
+    samples = []
+    try:
+        for _ in range(max(1, args.runs)):
+            result = subprocess.run(
+                [sys.executable, "-c", probe], cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+            )
+            samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    finally:
+        github.stop()
+        sink.stop()
+
+    def summarize(values):
+        return {
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "max_ms": round(max(values) * 1000, 1),
+        }
+
+    step_names = sorted({name for sample in samples for name in sample["steps"]})
+    return {
+        "runs": len(samples),
+        "modules": samples[-1]["modules"],
+        "heavy_modules_after_import": samples[-1]["heavy"],
+        "import": summarize([sample["import_s"] for sample in samples]),
+        "warm_up": summarize([sample["warm_up_s"] for sample in samples]),
+        "warm_up_steps": {
+            name: summarize([sample["steps"][name] for sample in samples if name in sample["steps"]])
+            for name in step_names
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    """Print the report as a readable table."""
+    print(f"Runs:             {report['runs']}")
+    print(f"Modules loaded:   {report['modules']}")
+    print(f"Heavy modules:    {', '.join(report['heavy_modules_after_import']) or 'none'}")
+    print()
+    print(f"{'phase':<20}{'p50 ms':>12}{'max ms':>12}")
+    rows = [("import main", report["import"]), ("warm_up", report["warm_up"])]
+    rows += [(f"  {name}", stats) for name, stats in report["warm_up_steps"].items()]
+    for phase, stats in rows:
+        print(f"{phase:<20}{stats['p50_ms']:>12}{stats['max_ms']:>12}")
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Process-wide configuration loading.
+
+The .env file is read once, by the first module that imports this one; every
+module then reads its own settings with `os.getenv` at import time as before.
+"""
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file (existing environment variables take precedence)
+load_dotenv()
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """
+    Read a boolean setting ("1", "true" or "yes", case-insensitive).
+
+    Args:
+        name (str): Environment variable name.
+        default (bool, optional): Value used when the variable is not set.
+
+    Returns:
+        bool: The setting.
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
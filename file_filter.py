@@ -0,0 +1,203 @@
+import fnmatch, posixpath, hashlib
+
+# Directories holding dependencies, build output or tooling state rather than student code
+DEFAULT_EXCLUDED_DIRS = (
+    "node_modules", "bower_components", "vendor", ".git", ".svn", ".hg",
+    "venv", ".venv", "env", "__pycache__", ".pytest_cache", ".mypy_cache", ".tox",
+    "dist", "build", "target", "out", "coverage", ".next", ".nuxt", ".gradle",
+    ".idea", ".vscode", ".ipynb_checkpoints",
+)
+
+# Binary, media, archive and data files that carry no gradable source code
+DEFAULT_EXCLUDED_EXTENSIONS = (
+    # Images and media
+    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".webp", ".tiff", ".psd", ".svg",
+    ".mp3", ".wav", ".ogg", ".mp4", ".mov", ".avi", ".webm",
+    # Fonts and documents
+    ".ttf", ".otf", ".woff", ".woff2", ".eot", ".pdf", ".doc", ".docx", ".ppt", ".pptx", ".xls", ".xlsx",
+    # Archives and compiled artifacts
+    ".zip", ".tar", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".jar", ".war",
+    ".exe", ".dll", ".so", ".dylib", ".o", ".a", ".class", ".pyc", ".pyo", ".whl", ".egg",
+    # Datasets and serialized models
+    ".csv", ".tsv", ".parquet", ".feather", ".sqlite", ".sqlite3", ".db",
+    ".pkl", ".pickle", ".npy", ".npz", ".h5", ".hdf5", ".joblib", ".pt", ".pth", ".onnx",
+    # Generated front-end output
+    ".map", ".min.js", ".min.css", ".lock",
+)
+
+# Lockfiles and OS noise matched by exact file name
+DEFAULT_EXCLUDED_FILES = (
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+    "composer.lock", "Gemfile.lock", "Cargo.lock", "go.sum", ".DS_Store", "Thumbs.db",
+)
+
+DEFAULT_MAX_FILE_BYTES = 100_000
+
+
+class FileFilter:
+    """
+    Decides which repository files are worth sending to the grader.
+
+    Files are excluded by directory, extension, exact name, size and optional
+    gitignore-style patterns (e.g. "*.log", "docs/", "data/**/*.json").
+    The same filter is used before download in `GitHubRepository`, so excluded
+    files are never fetched, and again when the prompt is assembled.
+    """
+
+    def __init__(self, max_file_bytes: int | None = DEFAULT_MAX_FILE_BYTES,
+                 exclude_patterns: list[str] | tuple = (),
+                 excluded_dirs: tuple = DEFAULT_EXCLUDED_DIRS,
+                 excluded_extensions: tuple = DEFAULT_EXCLUDED_EXTENSIONS,
+                 excluded_files: tuple = DEFAULT_EXCLUDED_FILES):
+        """
+        Initialize the file filter.
+
+        Args:
+            max_file_bytes (int, optional): Files larger than this are skipped. None disables the limit.
+            exclude_patterns (list[str], optional): Extra gitignore-style patterns to exclude.
+            excluded_dirs (tuple, optional): Directory names excluded wherever they appear.
+            excluded_extensions (tuple, optional): File suffixes excluded (case-insensitive).
+            excluded_files (tuple, optional): Exact file names excluded.
+        """
+        self.max_file_bytes = max_file_bytes
+        self.exclude_patterns = [p.strip() for p in exclude_patterns if p and p.strip()]
+        self.excluded_dirs = set(excluded_dirs)
+        self.excluded_extensions = tuple(ext.lower() for ext in excluded_extensions)
+        self.excluded_files = set(excluded_files)
+
+    @classmethod
+    def from_settings(cls, max_file_bytes: int | None, patterns: str | None) -> "FileFilter":
+        """
+        Build a filter from environment-style settings.
+
+        Args:
+            max_file_bytes (int): Size limit per file; 0 or None disables it.
+            patterns (str): Comma-separated gitignore-style patterns.
+
+        Returns:
+            FileFilter: The configured filter.
+        """
+        return cls(
+            max_file_bytes=max_file_bytes or None,
+            exclude_patterns=(patterns or "").split(",")
+        )
+
+    def fingerprint(self) -> str:
+        """
+        Return a short, stable hash of the filter rules, for use in cache keys.
+
+        Returns:
+            str: The first 16 hex digits of a SHA-256 over all rules.
+        """
+        rules = repr((
+            self.max_file_bytes, self.exclude_patterns, sorted(self.excluded_dirs),
+            self.excluded_extensions, sorted(self.excluded_files)
+        ))
+        return hashlib.sha256(rules.encode("utf-8")).hexdigest()[:16]
+
+    def is_excluded_dir(self, path: str) -> bool:
+        """
+        Check whether a directory (and everything below it) should be skipped.
+
+        Args:
+            path (str): Directory path relative to the repository root.
+
+        Returns:
+            bool: True if the directory should not be traversed.
+        """
+        path = path.strip("/")
+        if any(part in self.excluded_dirs for part in path.split("/")):
+            return True
+        return any(self._matches(path, pattern, is_dir=True) for pattern in self.exclude_patterns)
+
+    def exclusion_reason(self, path: str, size: int | None = None) -> str | None:
+        """
+        Explain why a file would be excluded.
+
+        Args:
+            path (str): File path relative to the repository root.
+            size (int, optional): File size in bytes, if known.
+
+        Returns:
+            str | None: A short reason ("excluded_dir", "excluded_type", "pattern",
+                "too_large"), or None if the file should be kept.
+        """
+        path = path.strip("/")
+        name = posixpath.basename(path)
+        directory = posixpath.dirname(path)
+
+        if directory and self.is_excluded_dir(directory):
+            return "excluded_dir"
+        if name in self.excluded_files or name.lower().endswith(self.excluded_extensions):
+            return "excluded_type"
+        if any(self._matches(path, pattern) for pattern in self.exclude_patterns):
+            return "pattern"
+        if self.max_file_bytes is not None and size is not None and size > self.max_file_bytes:
+            return "too_large"
+        return None
+
+    def should_include(self, path: str, size: int | None = None) -> bool:
+        """
+        Check whether a file should be downloaded and graded.
+
+        Args:
+            path (str): File path relative to the repository root.
+            size (int, optional): File size in bytes, if known.
+
+        Returns:
+            bool: True if the file should be kept.
+        """
+        return self.exclusion_reason(path, size) is None
+
+    @staticmethod
+    def is_binary(content: str | bytes) -> bool:
+        """
+        Heuristically detect binary content (NUL bytes in the first 8 KB).
+
+        Args:
+            content (str | bytes): Raw or decoded file content.
+
+        Returns:
+            bool: True if the content looks binary.
+        """
+        sample = content[:8192]
+        return (b"\0" in sample) if isinstance(sample, bytes) else ("\0" in sample)
+
+    @staticmethod
+    def _matches(path: str, pattern: str, is_dir: bool = False) -> bool:
+        """
+        Match a path against a gitignore-style pattern.
+
+        Supported forms: "name" / "*.ext" (any path component), "dir/" (directories
+        only), "**/x" (any depth), and other patterns containing "/", which are
+        anchored at the repo root.
+        """
+        dir_only = pattern.endswith("/")
+        anchored = "/" in pattern.rstrip("/")  # A leading or inner slash anchors the pattern
+        pattern = pattern.strip("/")
+        if not pattern:
+            return False
+
+        if not anchored:
+            parts = path.split("/")
+            # A directory pattern applies to every directory component; for files, ignore the file name
+            candidates = parts if (is_dir or not dir_only) else parts[:-1]
+            return any(fnmatch.fnmatchcase(part, pattern) for part in candidates)
+
+        if dir_only and not is_dir:
+            path = posixpath.dirname(path)
+
+        # "**/x" matches at any depth; anything else containing "/" is anchored at the root
+        floating = pattern.startswith("**/")
+        if floating:
+            pattern = pattern[3:]
+        variants = {pattern.replace("**", "*"), pattern.replace("/**/", "/").replace("**", "*")}
+
+        # Match the path itself or any of its parent directories
+        while path:
+            parts = path.split("/")
+            candidates = ["/".join(parts[i:]) for i in range(len(parts))] if floating else [path]
+            if any(fnmatch.fnmatchcase(c, v) for c in candidates for v in variants):
+                return True
+            path = posixpath.dirname(path)
+        return False
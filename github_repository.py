@@ -1,28 +1,125 @@
-import requests, base64
-from urllib.parse import urlparse
+import requests, base64, tarfile, tempfile, posixpath, asyncio, time, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import TYPE_CHECKING
+from http_client import get_session
+from urllib.parse import urlparse, quote
+from repository_cache import RepositoryCache
+from file_filter import FileFilter
+
+if TYPE_CHECKING:
+    import httpx  # Only the async methods use it; the sync worker never imports it
+
+GITHUB_API_URL = "https://api.github.com"
+
+# Supported strategies for downloading repository files
+FETCH_MODE_CONTENTS = "contents"  # one request per directory listing and per file
+FETCH_MODE_TARBALL = "tarball"    # a single archive download, unpacked in memory
+FETCH_MODES = (FETCH_MODE_CONTENTS, FETCH_MODE_TARBALL)
+
+# GitHub rate limit handling: waits longer than this fail fast instead of stalling a worker
+RATE_LIMIT_MAX_WAIT = 60  # seconds
+RATE_LIMIT_RETRIES = 3
+
+# Tarballs downloaded by the async client are buffered in memory up to this size, then on disk
+TARBALL_SPOOL_BYTES = 8 * 1024 * 1024
+
+# Rate limits apply per token, so a limit hit by one request pauses all requests in the process
+_rate_limit_lock = threading.Lock()
+_rate_limited_until = 0.0
+
+
+def _rate_limit_wait() -> float:
+    """Return how many seconds to hold off before the next GitHub request."""
+    return max(0.0, _rate_limited_until - time.time())
+
+
+def _record_rate_limit(response) -> float | None:
+    """
+    Inspect a GitHub response for rate limiting and pause further requests if needed.
+
+    Handles secondary rate limits (403/429 with `Retry-After`) and an exhausted
+    primary limit (`X-RateLimit-Remaining: 0`, waiting until `X-RateLimit-Reset`).
+    Works with both `requests` and `httpx` responses.
+
+    Returns:
+        float | None: Seconds to wait before retrying this request, or None if it
+            was not rejected by a rate limit.
+    """
+    global _rate_limited_until
+
+    delay = None
+    retry_after = response.headers.get("Retry-After")
+    exhausted = response.headers.get("X-RateLimit-Remaining") == "0"
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            delay = RATE_LIMIT_MAX_WAIT  # HTTP-date form; treat as a long wait
+    elif exhausted:
+        reset = response.headers.get("X-RateLimit-Reset")
+        delay = max(0.0, float(reset) - time.time()) + 1 if reset else RATE_LIMIT_MAX_WAIT
+
+    if delay is not None:
+        with _rate_limit_lock:
+            _rate_limited_until = max(_rate_limited_until, time.time() + min(delay, RATE_LIMIT_MAX_WAIT))
+
+    if response.status_code in (403, 429) and (retry_after or exhausted):
+        return delay
+    return None
 
 class GitHubRepository:
     """
     Represents a GitHub repository and provides methods to interact with
     its contents via the GitHub REST API. 
     """
-    def __init__(self, repo_url: str, token: str | None = None):
+    def __init__(self, repo_url: str, token: str | None = None,
+                 fetch_mode: str = FETCH_MODE_CONTENTS, api_url: str = GITHUB_API_URL,
+                 cache: RepositoryCache | None = None, file_filter: FileFilter | None = None,
+                 max_workers: int = 8, max_total_bytes: int | None = None):
         """
         Initialize a GitHubRepository instance.
 
         Args:
             repo_url (str): Full GitHub repository URL, e.g. "https://github.com/user/repo"
             token (str, optional): A GitHub Personal Access Token (PAT) for higher rate limits.
+            fetch_mode (str, optional): How `get_files` downloads the repository, either
+                "contents" (walk the Contents API) or "tarball" (one archive download).
+            api_url (str, optional): Base URL of the GitHub REST API. Override it to point
+                at GitHub Enterprise or a local stand-in server.
+            cache (RepositoryCache, optional): Cache of file sets keyed by commit SHA.
+                When given, `get_files` only downloads the repository if its HEAD
+                commit has not been fetched before.
+            file_filter (FileFilter, optional): Rules for files that should not be
+                downloaded at all (binaries, vendored directories, oversized files).
+            max_workers (int, optional): Concurrent requests used to walk the Contents API.
+            max_total_bytes (int, optional): Cap on the bytes downloaded per repository.
+                Files that no longer fit are skipped ("repo_too_large"). None means unlimited.
+
+        Raises:
+            ValueError: If the URL or the fetch mode is invalid.
         """
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(f"Invalid fetch mode '{fetch_mode}'. Expected one of: {', '.join(FETCH_MODES)}")
+
         self.repo_url = repo_url.rstrip("/") # Normalize the URL (remove trailing slash)
         self.owner, self.repo_name = self._parse_repo_url(repo_url)
-        self.api_base = f"https://api.github.com/repos/{self.owner}/{self.repo_name}"
+        self.api_base = f"{api_url.rstrip('/')}/repos/{self.owner}/{self.repo_name}"
+        self.fetch_mode = fetch_mode
+        self.cache = cache
+        self.file_filter = file_filter
+        self.max_workers = max(1, max_workers)
+        self.max_total_bytes = max_total_bytes
+        self.skipped_files = []  # [{"path", "reason"}] left out by the filter during the last fetch
+        self._bytes_left = None  # Remaining per-repository byte allowance of the current fetch
+        self.commit_sha = None  # Commit the last `get_files` call resolved to, if known
 
-        # Initialize a persistent session
-        self.session = requests.Session()
-        self.session.headers.update({"Accept": "application/vnd.github.v3+json"})
+        # Request headers, sent with every call on the shared sessions and async clients
+        self.headers = {"Accept": "application/vnd.github.v3+json"}
         if token:
-            self.session.headers.update({"Authorization": f"token {token}"})
+            self.headers["Authorization"] = f"token {token}"
+
+        # Process-wide pooled session; auth headers are sent per request since it is shared
+        self.session = get_session("github")
 
 
     def _parse_repo_url(self, repo_url: str) -> tuple[str, str]:
@@ -45,69 +142,301 @@ class GitHubRepository:
 
 
 
-    def get_files(self):
+    def get_files(self, commit_sha: str | None = None):
         """
         Fetch all files (recursively) from the repository and return their names,
         paths, and contents.
 
+        If a cache is configured, the HEAD commit SHA is looked up first (one
+        lightweight request) and a cached file set for that commit is reused.
+
+        Args:
+            commit_sha (str, optional): Commit to fetch, if already resolved.
+                Defaults to the HEAD of the default branch.
+
         Returns:
             list[dict]: A list of file metadata with structure:
                 {
                     "name": str,     # filename
                     "path": str,     # file path in repo
+                    "size": int,     # content size in bytes
                     "content": str   # raw file content
                 }
 
         Raises:
             Exception: If any API call fails.
         """
-        files = []
+        if self.cache is None:
+            self.commit_sha = commit_sha
+            return self._fetch_files(ref=commit_sha)
 
-        def add_to_list(content_item: dict):
-            """
-            Fetch the actual content of a file and append it to the results list.
+        self.commit_sha = commit_sha or self.get_head_commit_sha()
+        cache_key = self._cache_key(self.commit_sha)
 
-            For each file, fetch content (Base64 encoded) from GitHub API
-            """
-            file_resp = self.session.get(content_item.get('url'))
-            if file_resp.status_code != 200:
-                raise Exception(f"Failed to fetch content for {content_item.get('path')}: {file_resp.status_code}")
-        
-            data = file_resp.json()
-            if data.get("encoding") == "base64":
-                decoded_content = base64.b64decode(data.get('content')).decode("utf-8", errors="ignore")
-            else:
-                decoded_content = data.get("content", "")
-            
-            files.append({
-                "name": content_item.get('name'),
-                "path": content_item.get('path'),
-                "content": decoded_content
-            })
-
-        # Recursively process all files and directories
-        self._process_content_items(add_to_list)
+        files = self.cache.get(cache_key)
+        if files is None:
+            files = self._fetch_files(ref=self.commit_sha)
+            self.cache.put(cache_key, files)
         return files
 
 
-    def _process_content_items(self, handle_content_item, content_path=""):
+    def _cache_key(self, commit_sha: str) -> str:
+        """Build the repository cache key for a commit, including the filter rules in effect."""
+        cache_key = RepositoryCache.make_key(self.owner, self.repo_name, commit_sha)
+        if self.file_filter is not None:
+            # Different filter rules produce different file sets for the same commit
+            cache_key = f"{cache_key}#{self.file_filter.fingerprint()}"
+        if self.max_total_bytes is not None:
+            cache_key = f"{cache_key}#max{self.max_total_bytes}"
+        return cache_key
+
+
+    def _fetch_files(self, ref: str | None = None):
+        """
+        Download all files using the configured fetch mode.
+
+        Args:
+            ref (str, optional): Commit SHA, branch or tag to fetch. Defaults to the default branch.
+
+        Returns:
+            list[dict]: File metadata in the same structure as `get_files`.
+        """
+        return list(self._iter_fetched_files(ref))
+
+
+    def _iter_fetched_files(self, ref: str | None = None):
+        """Start a fetch (resetting skips and the byte allowance) and yield its files."""
+        self.skipped_files = []
+        self._bytes_left = self.max_total_bytes
+        if self.fetch_mode == FETCH_MODE_TARBALL:
+            return self._iter_files_from_tarball(ref)
+        return self._iter_files_from_contents(ref)
+
+
+    def get_head_commit_sha(self, ref: str = "HEAD") -> str:
+        """
+        Resolve a ref to its commit SHA without downloading any commit details.
+
+        Args:
+            ref (str, optional): Branch, tag or "HEAD" (the default branch).
+
+        Returns:
+            str: The 40-character commit SHA.
+
+        Raises:
+            Exception: If the API request fails.
+        """
+        response = self._get(f"{self.api_base}/commits/{ref}", headers={"Accept": "application/vnd.github.sha"})
+        if response.status_code != 200:
+            raise Exception(f"Failed to resolve commit for {ref}: {response.status_code} - {response.text}")
+        return response.text.strip()
+
+
+    def compare_commits(self, base_sha: str, head_sha: str) -> tuple[str, list[dict]]:
+        """
+        List what changed between two commits, using a single Compare API request.
+
+        Changes to files rejected by the file filter are left out.
+
+        Args:
+            base_sha (str): The earlier commit, e.g. the one graded last time.
+            head_sha (str): The later commit.
+
+        Returns:
+            tuple[str, list[dict]]: The comparison status ("ahead", "identical",
+                "behind" or "diverged") and the changed files as returned by GitHub:
+                {"filename", "status", "additions", "deletions", "patch", "previous_filename"}.
+
+        Raises:
+            Exception: If the API request fails.
+        """
+        response = self._get(f"{self.api_base}/compare/{base_sha}...{head_sha}")
+        if response.status_code != 200:
+            raise Exception(f"Failed to compare {base_sha}...{head_sha}: {response.status_code} - {response.text}")
+        data = response.json()
+        return data.get("status"), self._gradable_changes(data.get("files") or [])
+
+
+    def get_changed_files(self, changes: list[dict], ref: str) -> list[dict]:
+        """
+        Download the new content of changed files, concurrently.
+
+        The compare API gives no file sizes, so each file is checked against the
+        file filter, the binary heuristic and the per-repository byte cap once
+        downloaded; files failing them are left out and recorded in `skipped_files`.
+
+        Args:
+            changes (list[dict]): Changed files from `compare_commits`.
+            ref (str): The commit to read them at.
+
+        Returns:
+            list[dict]: File metadata in the same structure as `get_files`, in the
+                order of `changes`. Removed and skipped files are not included.
+
+        Raises:
+            Exception: If any API call fails.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="github-fetch") as pool:
+            futures = [
+                pool.submit(self._fetch_file_at, change.get("filename"), ref)
+                for change in changes if change.get("status") != "removed"
+            ]
+            return self._admit_changed_files([future.result() for future in futures])
+
+
+    def _fetch_file_at(self, path: str, ref: str) -> dict:
+        """
+        Fetch one file by path at a given commit through the Contents API.
+
+        Raises:
+            Exception: If the API request fails.
+        """
+        response = self._get(f"{self.api_base}/contents/{quote(path)}", params={"ref": ref})
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch content for {path}: {response.status_code}")
+        data = response.json()
+        return self._to_file(data, data)
+
+
+    def _admit_changed_files(self, files: list[dict]) -> list[dict]:
+        """Keep the downloaded changed files that pass the filter and byte cap, in order, recording the rest."""
+        self.skipped_files = []
+        self._bytes_left = self.max_total_bytes
+        admitted = []
+        for file in files:
+            path, size = file.get("path"), file.get("size")
+            if self._excluded(path, size) or self._over_cap(path, size):
+                continue
+            if self.file_filter is not None and self.file_filter.is_binary(file.get("content") or ""):
+                self.skipped_files.append({"path": path, "reason": "binary"})
+                continue
+            admitted.append(file)
+        return admitted
+
+
+    def _gradable_changes(self, changes: list[dict]) -> list[dict]:
+        """Drop compare entries for files the file filter excludes."""
+        if self.file_filter is None:
+            return changes
+        return [change for change in changes if self.file_filter.should_include(change.get("filename") or "")]
+
+
+    def _get(self, url: str, headers: dict | None = None, **kwargs) -> requests.Response:
+        """
+        Issue a GET request on the shared session with this repository's headers.
+
+        Rate-limited responses (403/429 with `Retry-After`, or an exhausted
+        `X-RateLimit-Remaining`) are retried after the indicated wait, and every
+        thread of the process holds off until then, since limits are per token.
+
+        Args:
+            url (str): The URL to fetch.
+            headers (dict, optional): Headers overriding the repository defaults.
+            **kwargs: Passed on to `requests.Session.get`.
+
+        Returns:
+            requests.Response: The response.
+        """
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            time.sleep(_rate_limit_wait())
+            response = self.session.get(url, headers={**self.headers, **(headers or {})}, **kwargs)
+            delay = _record_rate_limit(response)
+            if delay is None or delay > RATE_LIMIT_MAX_WAIT or attempt == RATE_LIMIT_RETRIES:
+                return response
+            response.close()
+        return response
+
+
+    def _iter_files_from_contents(self, ref: str | None = None):
+        """
+        Fetch all files by walking the Contents API, one request per directory
+        listing and one per file.
+
+        Directory listings and file downloads run concurrently on a pool of
+        `max_workers` threads. Without a byte cap, each file download starts as
+        soon as its directory has been listed; with one, downloads start once the
+        whole tree is listed, so the cap is charged in depth-first order and the
+        same files are kept on every run. Files are yielded in the order of a
+        sequential depth-first walk, so prompts stay stable from run to run.
+
+        Args:
+            ref (str, optional): Commit SHA, branch or tag to fetch. Defaults to the default branch.
+
+        Yields:
+            dict: File metadata in the same structure as `get_files`.
+
+        Raises:
+            Exception: If any API call fails.
         """
-        Recursively process content items in the repository.
+        listings = {}      # directory path -> listing items
+        file_futures = {}  # file path -> Future of its file entry
+        accepted = set()   # paths of listed files that passed the file filter
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="github-fetch")
+        try:
+            pending = {pool.submit(self._list_directory, "", ref)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    content_path, contents = future.result()
+                    listings[content_path] = contents
+
+                    for content in contents:
+                        if content.get('type') == 'file':
+                            if self._excluded(content.get('path'), content.get('size')):
+                                continue
+                            accepted.add(content.get('path'))
+                            if self._bytes_left is None:
+                                file_futures[content.get('path')] = pool.submit(self._fetch_file, content)
+                        elif content.get('type') == 'dir':
+                            if self.file_filter is not None and self.file_filter.is_excluded_dir(content.get('path')):
+                                self.skipped_files.append({"path": content.get('path'), "reason": "excluded_dir"})
+                                continue
+                            pending.add(pool.submit(self._list_directory, content.get('path'), ref))
+
+            def walk_order(content_path: str):
+                """Yield the listed files that passed the filter, in depth-first listing order."""
+                for content in listings.get(content_path, []):
+                    if content.get('type') == 'file' and content.get('path') in accepted:
+                        yield content
+                    elif content.get('type') == 'dir':
+                        yield from walk_order(content.get('path'))
+
+            if self._bytes_left is not None:
+                for content in walk_order(""):
+                    if not self._over_cap(content.get('path'), content.get('size')):
+                        file_futures[content.get('path')] = pool.submit(self._fetch_file, content)
+
+            # Yield in depth-first listing order, as the sequential walk produced it,
+            # releasing each file once it has been handed over
+            for content in walk_order(""):
+                future = file_futures.pop(content.get('path'), None)
+                if future is not None:
+                    yield future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+    def _list_directory(self, content_path: str = "", ref: str | None = None) -> tuple[str, list[dict]]:
+        """
+        List the items of one directory in the repository.
 
         Args:
-            handle_content_item (callable): Function that takes a content item dict
-                and handles it (e.g. adds it to a list).
             content_path (str, optional): Subdirectory path within the repo.
                 Defaults to the repo root.
+            ref (str, optional): Commit SHA, branch or tag to list. Defaults to the default branch.
+
+        Returns:
+            tuple[str, list[dict]]: The directory path and its content items.
 
         Raises:
-            Exception: If an API request fails.
+            Exception: If the API request fails.
         """
         baseurl = f"{self.api_base}/contents"
         url = f"{baseurl}/{content_path}"
 
         # Fetch directory contents from GitHub API
-        response = self.session.get(url)
+        response = self._get(url, params={"ref": ref} if ref else None)
         if response.status_code != 200:
             raise Exception(f"Failed to list filepaths: {response.status_code} - {response.text}")
         
@@ -116,13 +445,288 @@ class GitHubRepository:
         # GitHub API returns a single dict if the path is a file, not a list
         if isinstance(contents, dict):
             contents = [contents]
+        return content_path, contents
+
+
+    def _fetch_file(self, content_item: dict) -> dict:
+        """
+        Fetch the actual content of a file listed by the Contents API.
+
+        Raises:
+            Exception: If the API request fails.
+        """
+        file_resp = self._get(content_item.get('url'))
+        if file_resp.status_code != 200:
+            raise Exception(f"Failed to fetch content for {content_item.get('path')}: {file_resp.status_code}")
+        return self._to_file(content_item, file_resp.json())
+
+
+    def _iter_files_from_tarball(self, ref: str | None = None):
+        """
+        Fetch all files with a single tarball download.
+
+        The archive is streamed straight from the response and unpacked one
+        member at a time, so nothing is written to disk, only one API request is
+        spent and the archive is never held in memory as a whole.
+
+        Args:
+            ref (str, optional): Commit SHA, branch or tag to fetch. Defaults to the default branch.
+
+        Yields:
+            dict: File metadata in the same structure as `get_files`.
+
+        Raises:
+            Exception: If the archive cannot be downloaded.
+        """
+        url = f"{self.api_base}/tarball/{ref}" if ref else f"{self.api_base}/tarball"
+        response = self._get(url, stream=True)
+        if response.status_code != 200:
+            raise Exception(f"Failed to download repository archive: {response.status_code} - {response.text}")
+
+        with response:
+            response.raw.decode_content = True  # undo any transport-level compression only
+            yield from self._iter_tarball(response.raw)
+
+
+    def _extract_tarball(self, fileobj) -> list[dict]:
+        """Read all regular files out of a tar stream; see `_iter_tarball`."""
+        return list(self._iter_tarball(fileobj))
+
+
+    def _iter_tarball(self, fileobj):
+        """
+        Read regular files out of a (gzipped) tar stream as produced by GitHub.
+
+        GitHub wraps the repository in a single top-level directory
+        (e.g. "owner-repo-<sha>/"), which is stripped from every path.
+        Files rejected by the file filter are skipped without being read.
+        Each file's bytes are decoded to text once and then released.
+
+        Args:
+            fileobj: A readable binary stream of the tar archive.
+
+        Yields:
+            dict: File metadata in the same structure as `get_files`.
+        """
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+
+                path = member.name.split("/", 1)[1] if "/" in member.name else member.name
+                if self._excluded(path, member.size) or self._over_cap(path, member.size):
+                    continue
+
+                extracted = archive.extractfile(member)
+                raw_content = extracted.read() if extracted else b""
+                if self.file_filter is not None and self.file_filter.is_binary(raw_content):
+                    self.skipped_files.append({"path": path, "reason": "binary"})
+                    continue
+                yield {
+                    "name": posixpath.basename(path),
+                    "path": path,
+                    "size": len(raw_content),
+                    "content": raw_content.decode("utf-8", errors="ignore")
+                }
+
+
+    @staticmethod
+    def _to_file(content_item: dict, data: dict) -> dict:
+        """
+        Build a file entry from a directory listing item and its Contents API response.
+
+        For each file, content is Base64 encoded by the GitHub API.
+        """
+        if data.get("encoding") == "base64":
+            raw_content = base64.b64decode(data.get('content'))
+            size, decoded_content = len(raw_content), raw_content.decode("utf-8", errors="ignore")
+        else:
+            size, decoded_content = content_item.get("size"), data.get("content", "")
+
+        return {
+            "name": content_item.get('name'),
+            "path": content_item.get('path'),
+            "size": size,
+            "content": decoded_content
+        }
+
+
+    def _excluded(self, path: str, size: int | None) -> bool:
+        """
+        Check a file against the file filter before downloading it, recording the skip.
+
+        Returns:
+            bool: True if the filter rejects the file.
+        """
+        reason = self.file_filter.exclusion_reason(path, size) if self.file_filter is not None else None
+        if reason:
+            self.skipped_files.append({"path": path, "reason": reason})
+        return reason is not None
+
+
+    def _over_cap(self, path: str, size: int | None) -> bool:
+        """
+        Charge a file against the per-repository byte cap, recording the skip if it does not fit.
+
+        Callers charge files in a deterministic order (archive order, or the
+        depth-first listing order), so a repository over the cap keeps the same
+        files on every run.
+
+        Returns:
+            bool: True if the file should not be downloaded.
+        """
+        if self._bytes_left is None or size is None:
+            return False
+        if size > self._bytes_left:
+            self.skipped_files.append({"path": path, "reason": "repo_too_large"})
+            return True
+        self._bytes_left -= size
+        return False
+
+
+    # ---------------------------------------------------------
+    # Asynchronous API (used by the asyncio worker)
+    # ---------------------------------------------------------
+    async def get_files_async(self, client: "httpx.AsyncClient", max_concurrency: int = 8, commit_sha: str | None = None):
+        """
+        Asynchronous version of `get_files`.
+
+        In contents mode, directory listings and file downloads are issued
+        concurrently (bounded by `max_concurrency`), while the returned list keeps
+        the same order as the sequential walk.
+
+        Args:
+            client (httpx.AsyncClient): Shared client whose connection pool is reused across repositories.
+            max_concurrency (int, optional): Maximum number of GitHub requests in flight.
+            commit_sha (str, optional): Commit to fetch, if already resolved.
+
+        Returns:
+            list[dict]: File metadata in the same structure as `get_files`.
+
+        Raises:
+            Exception: If any API call fails.
+        """
+        if self.cache is None:
+            self.commit_sha = commit_sha
+            return await self._fetch_files_async(client, max_concurrency, ref=commit_sha)
+
+        self.commit_sha = commit_sha or await self.get_head_commit_sha_async(client)
+        cache_key = self._cache_key(self.commit_sha)
+
+        files = await asyncio.to_thread(self.cache.get, cache_key)
+        if files is None:
+            files = await self._fetch_files_async(client, max_concurrency, ref=self.commit_sha)
+            await asyncio.to_thread(self.cache.put, cache_key, files)
+        return files
+
+
+    async def get_head_commit_sha_async(self, client: "httpx.AsyncClient", ref: str = "HEAD") -> str:
+        """Asynchronous version of `get_head_commit_sha`."""
+        response = await client.get(
+            f"{self.api_base}/commits/{ref}",
+            headers={**self.headers, "Accept": "application/vnd.github.sha"}
+        )
+        if response.status_code != 200:
+            raise Exception(f"Failed to resolve commit for {ref}: {response.status_code} - {response.text}")
+        return response.text.strip()
+
+
+    async def compare_commits_async(self, client: "httpx.AsyncClient", base_sha: str, head_sha: str) -> tuple[str, list[dict]]:
+        """Asynchronous version of `compare_commits`."""
+        response = await client.get(f"{self.api_base}/compare/{base_sha}...{head_sha}", headers=self.headers)
+        if response.status_code != 200:
+            raise Exception(f"Failed to compare {base_sha}...{head_sha}: {response.status_code} - {response.text}")
+        data = response.json()
+        return data.get("status"), self._gradable_changes(data.get("files") or [])
+
+
+    async def get_changed_files_async(self, client: "httpx.AsyncClient", changes: list[dict], ref: str,
+                                      max_concurrency: int = 8) -> list[dict]:
+        """Asynchronous version of `get_changed_files`."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch(path: str) -> dict:
+            async with semaphore:
+                response = await client.get(f"{self.api_base}/contents/{quote(path)}", params={"ref": ref}, headers=self.headers)
+            if response.status_code != 200:
+                raise Exception(f"Failed to fetch content for {path}: {response.status_code}")
+            data = response.json()
+            return self._to_file(data, data)
+
+        return self._admit_changed_files(list(await asyncio.gather(*(
+            fetch(change.get("filename")) for change in changes if change.get("status") != "removed"
+        ))))
+
+
+    async def _fetch_files_async(self, client: "httpx.AsyncClient", max_concurrency: int, ref: str | None = None):
+        """Download all files using the configured fetch mode, asynchronously."""
+        self.skipped_files = []
+        self._bytes_left = self.max_total_bytes
+        if self.fetch_mode == FETCH_MODE_TARBALL:
+            url = f"{self.api_base}/tarball/{ref}" if ref else f"{self.api_base}/tarball"
+            with tempfile.SpooledTemporaryFile(max_size=TARBALL_SPOOL_BYTES) as archive:
+                async with client.stream("GET", url, headers=self.headers, follow_redirects=True) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise Exception(f"Failed to download repository archive: {response.status_code} - {response.text}")
+                    async for chunk in response.aiter_bytes():
+                        archive.write(chunk)
+                archive.seek(0)
+                # Decompression is CPU-bound; keep it off the event loop
+                return await asyncio.to_thread(self._extract_tarball, archive)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def get_json(url: str, params: dict | None = None):
+            async with semaphore:
+                for attempt in range(RATE_LIMIT_RETRIES + 1):
+                    await asyncio.sleep(_rate_limit_wait())
+                    response = await client.get(url, params=params, headers=self.headers)
+                    delay = _record_rate_limit(response)
+                    if delay is None or delay > RATE_LIMIT_MAX_WAIT or attempt == RATE_LIMIT_RETRIES:
+                        return response
+
+        async def fetch_file(content_item: dict) -> dict:
+            file_resp = await get_json(content_item.get('url'))
+            if file_resp.status_code != 200:
+                raise Exception(f"Failed to fetch content for {content_item.get('path')}: {file_resp.status_code}")
+            return self._to_file(content_item, file_resp.json())
+
+        async def listed(content: dict) -> list[tuple]:
+            # Without a cap the download starts right away; with one it waits for the ordered pass below
+            return [(content, None if self._bytes_left is not None else asyncio.ensure_future(fetch_file(content)))]
+
+        async def walk(content_path: str = "") -> list[tuple]:
+            """List a directory tree; returns (listing item, download task or None) in depth-first order."""
+            response = await get_json(f"{self.api_base}/contents/{content_path}", {"ref": ref} if ref else None)
+            if response.status_code != 200:
+                raise Exception(f"Failed to list filepaths: {response.status_code} - {response.text}")
+
+            contents = response.json()
+            if isinstance(contents, dict):
+                contents = [contents]
+
+            tasks = []
+            for content in contents:
+                if content.get('type') == 'file':
+                    if not self._excluded(content.get('path'), content.get('size')):
+                        tasks.append(listed(content))
+                elif content.get('type') == 'dir':
+                    if self.file_filter is not None and self.file_filter.is_excluded_dir(content.get('path')):
+                        self.skipped_files.append({"path": content.get('path'), "reason": "excluded_dir"})
+                        continue
+                    tasks.append(walk(content.get('path')))
+
+            # gather() preserves task order, so the result matches the sequential walk
+            return [entry for group in await asyncio.gather(*tasks) for entry in group]
 
-        # Iterate over all items (files or directories)
-        for content in contents:
-            if content.get('type') == 'file':
-                handle_content_item(content)
-            elif content.get('type') == 'dir':
-                self._process_content_items(handle_content_item, content.get('path'),)
+        entries = await walk()
+        if self._bytes_left is None:
+            return list(await asyncio.gather(*(download for _, download in entries)))
+        # Charge the cap in depth-first order, so a repository over it keeps the same files on every run
+        return list(await asyncio.gather(*(
+            fetch_file(content) for content, _ in entries if not self._over_cap(content.get('path'), content.get('size'))
+        )))
 
 
     def get_repo_details(self):
@@ -135,7 +739,7 @@ class GitHubRepository:
         Raises:
             Exception: If the API request fails.
         """
-        response = self.session.get(self.api_base)
+        response = self._get(self.api_base)
         if response.status_code != 200:
             raise Exception(f"Failed to fetch repository details: {response.status_code} - {response.text}")
         return response.json()
@@ -0,0 +1,890 @@
+"""
+Pluggable LLM backends for the code grader.
+
+- GeminiBackend: Google Gemini through `google-generativeai`.
+- OpenAICompatibleBackend: any `/chat/completions` endpoint (OpenAI, Azure, vLLM, Ollama, ...).
+- FakeBackend: answers locally with a valid review for the prompt's rubric, for tests and benchmarks.
+- FailoverBackend: tries backends in priority order and routes around slow or failing ones.
+
+Every backend paces itself with a TokenBucketLimiter so the worker stays
+under the provider's requests/min and tokens/min quotas instead of
+collecting 429s.
+
+Backends are configured with LLM_BACKENDS, a comma-separated list of
+"<provider>:<model>" entries in priority order, e.g.
+"gemini:gemini-2.5-flash,gemini:gemini-2.5-flash-lite,openai:gpt-4o-mini".
+Later entries are used when earlier ones are rate limited, erroring or slow.
+
+Responses are streamed by default: every call has a hard deadline, output is
+capped at LLM_MAX_OUTPUT_TOKENS, and a JSON response is cut off as soon as
+its top-level object closes instead of waiting for whatever the model adds
+after it.
+"""
+import os, re, json, time, random, asyncio, threading
+import requests
+from collections import deque
+from config import env_flag
+from http_client import get_session, create_async_client
+from prompt_builder import estimate_tokens
+from metrics import LLM_REQUESTS, LLM_EARLY_STOPS
+
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+
+# Backends in priority order, as "<provider>:<model>"
+LLM_BACKENDS = os.getenv('LLM_BACKENDS', f'gemini:{GEMINI_MODEL}')
+
+# Client-side quota per backend; 0 means unlimited
+LLM_REQUESTS_PER_MINUTE = float(os.getenv('LLM_REQUESTS_PER_MINUTE', '0'))
+LLM_TOKENS_PER_MINUTE = float(os.getenv('LLM_TOKENS_PER_MINUTE', '0'))
+LLM_RATE_LIMIT_PAUSE = float(os.getenv('LLM_RATE_LIMIT_PAUSE', '10'))  # seconds a backend rests after a 429
+
+# A backend is skipped for LLM_FAILOVER_COOLDOWN seconds once its recent p95 latency
+# or error rate over the last LLM_FAILOVER_WINDOW calls crosses these thresholds
+LLM_FAILOVER_P95_SECONDS = float(os.getenv('LLM_FAILOVER_P95_SECONDS', '60'))
+LLM_FAILOVER_ERROR_RATE = float(os.getenv('LLM_FAILOVER_ERROR_RATE', '0.5'))
+LLM_FAILOVER_WINDOW = int(os.getenv('LLM_FAILOVER_WINDOW', '20'))
+LLM_FAILOVER_COOLDOWN = float(os.getenv('LLM_FAILOVER_COOLDOWN', '120'))
+
+# Hard per-call deadline and output cap; 0 disables them
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '120'))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', '8192'))
+
+# Consume responses incrementally and stop once the JSON object is complete
+LLM_STREAMING = env_flag('LLM_STREAMING', True)
+
+# Latency of the fake backend, in seconds
+FAKE_LLM_LATENCY = float(os.getenv('FAKE_LLM_LATENCY', '1.0'))
+
+
+class RateLimitError(Exception):
+    """Raised by a backend when the provider rejects a request for exceeding its quota."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTimeoutError(Exception):
+    """Raised when an LLM call does not finish within its deadline."""
+
+
+class LLMResponse:
+    """Provider-independent result of a generation request."""
+
+    def __init__(self, text: str, prompt_tokens: int | None = None, output_tokens: int | None = None,
+                 backend: str | None = None):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.backend = backend
+
+
+class JsonObjectScanner:
+    """
+    Finds where the first top-level JSON object of a streamed text ends.
+
+    Text before the opening brace (such as a ```json fence) is skipped, and
+    braces inside strings are ignored.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.offset = 0  # Characters consumed by earlier chunks
+
+    def feed(self, chunk: str) -> int | None:
+        """
+        Scan the next chunk of text.
+
+        Args:
+            chunk (str): The next piece of the response.
+
+        Returns:
+            int | None: Length of the text up to and including the object's closing
+                brace, counted from the start of the stream, or None if it is still open.
+        """
+        for i, char in enumerate(chunk):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = self.started
+            elif char == "{":
+                self.depth += 1
+                self.started = True
+            elif char == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return self.offset + i + 1
+        self.offset += len(chunk)
+        return None
+
+
+# ---------------------------------------------------------
+# Rate Limiting
+# ---------------------------------------------------------
+class TokenBucketLimiter:
+    """
+    Client-side limiter for requests/min and tokens/min with adaptive backoff.
+
+    Each request takes one request token and its estimated prompt tokens from
+    two buckets that refill continuously at the configured rates. When the
+    provider still answers with a 429, the backend is paused and its rates are
+    halved; every successful call restores 5% of the configured rate.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        """
+        Args:
+            requests_per_minute (float, optional): Request quota; 0 means unlimited.
+            tokens_per_minute (float, optional): Token quota; 0 means unlimited.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._scale = 1.0  # Fraction of the configured rates currently allowed
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute,
+                                 self._requests + elapsed * self.requests_per_minute / 60 * self._scale)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + elapsed * self.tokens_per_minute / 60 * self._scale)
+
+    def _reserve(self, tokens: int) -> float:
+        """Take capacity for a request if available; otherwise return how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+
+            # A single prompt larger than the whole bucket may still go out once the bucket is full
+            tokens = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+            wait = 0.0
+            if self.requests_per_minute and self._requests < 1:
+                wait = max(wait, (1 - self._requests) * 60 / (self.requests_per_minute * self._scale))
+            if self.tokens_per_minute and self._tokens < tokens:
+                wait = max(wait, (tokens - self._tokens) * 60 / (self.tokens_per_minute * self._scale))
+            if wait > 0:
+                return wait
+
+            if self.requests_per_minute:
+                self._requests -= 1
+            self._tokens -= tokens
+            return 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Block until a request of the given size fits in the quota.
+
+        Args:
+            tokens (int, optional): Estimated tokens of the request.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        waited = 0.0
+        while (wait := self._reserve(tokens)) > 0:
+            time.sleep(wait)
+            waited += wait
+        return waited
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """Asynchronous version of `acquire` that does not block the event loop."""
+        waited = 0.0
+        while (wait := self._reserve(tokens)) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        return waited
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int | None) -> None:
+        """Correct the token bucket once the provider reports the real token count."""
+        if actual_tokens is None or not self.tokens_per_minute:
+            return
+        with self._lock:
+            self._tokens -= actual_tokens - min(estimated_tokens, self.tokens_per_minute)
+
+    def is_paused(self) -> bool:
+        """Return True while the backend is resting after a rate limit response."""
+        return time.monotonic() < self._paused_until
+
+    def on_rate_limited(self, retry_after: float | None = None) -> None:
+        """Pause requests and halve the allowed rates after the provider returned a 429."""
+        with self._lock:
+            self._scale = max(0.1, self._scale / 2)
+            pause = retry_after if retry_after is not None else LLM_RATE_LIMIT_PAUSE
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def on_success(self) -> None:
+        """Gradually restore the configured rates after a successful call."""
+        with self._lock:
+            self._scale = min(1.0, self._scale + 0.05)
+
+
+# ---------------------------------------------------------
+# Backends
+# ---------------------------------------------------------
+class GraderBackend:
+    """
+    Base class of LLM backends.
+
+    Subclasses implement `_generate` and `_generate_async`; the public methods
+    add rate limiting, the call deadline and metrics around them. Streaming
+    subclasses feed their text chunks through `_collect_stream` or
+    `_collect_stream_async`, which stop early once the JSON object is complete.
+    """
+
+    provider = "base"
+
+    def __init__(self, model: str, limiter: TokenBucketLimiter | None = None):
+        """
+        Args:
+            model (str): Model name at the provider.
+            limiter (TokenBucketLimiter, optional): Quota for this backend. None means unlimited.
+        """
+        self.model = model
+        self.limiter = limiter or TokenBucketLimiter()
+
+    @property
+    def name(self) -> str:
+        """Identifier of the backend, "<provider>:<model>"."""
+        return f"{self.provider}:{self.model}"
+
+    def generate(self, prompt: str, json_output: bool = True, response_schema: dict | None = None) -> LLMResponse:
+        """
+        Generate a completion for the prompt.
+
+        Args:
+            prompt (str): The full prompt.
+            json_output (bool, optional): Ask the provider for a JSON response.
+            response_schema (dict, optional): Schema the JSON response must follow.
+
+        Returns:
+            LLMResponse: The generated text and token usage.
+
+        Raises:
+            RateLimitError: If the provider rejected the request for exceeding its quota.
+            LLMTimeoutError: If the call did not finish within LLM_TIMEOUT seconds.
+            Exception: Any other provider or network error.
+        """
+        estimated_tokens = estimate_tokens(prompt)
+        self.limiter.acquire(estimated_tokens)
+        # Waiting for quota does not count. The deadline bounds the request and the stream while they
+        # are in flight; a response that has fully arrived is kept even if it finished just past it.
+        deadline = time.monotonic() + LLM_TIMEOUT if LLM_TIMEOUT else None
+        try:
+            response = self._generate(prompt, json_output, response_schema, deadline)
+        except Exception as e:
+            self._on_error(e)
+            raise
+        self._on_success(response, estimated_tokens)
+        return response
+
+    async def generate_async(self, prompt: str, json_output: bool = True,
+                             response_schema: dict | None = None) -> LLMResponse:
+        """Asynchronous version of `generate`."""
+        estimated_tokens = estimate_tokens(prompt)
+        await self.limiter.acquire_async(estimated_tokens)
+        try:
+            response = await asyncio.wait_for(
+                self._generate_async(prompt, json_output, response_schema), LLM_TIMEOUT or None
+            )
+        except asyncio.TimeoutError:
+            error = LLMTimeoutError(f"LLM call exceeded its {LLM_TIMEOUT:g}s deadline.")
+            self._on_error(error)
+            raise error
+        except Exception as e:
+            self._on_error(e)
+            raise
+        self._on_success(response, estimated_tokens)
+        return response
+
+    def is_available(self) -> bool:
+        """Return False while the backend should not be sent requests (e.g. after a 429)."""
+        return not self.limiter.is_paused()
+
+    def _on_success(self, response: LLMResponse, estimated_tokens: int) -> None:
+        response.backend = self.name
+        self.limiter.on_success()
+        self.limiter.record_usage(estimated_tokens, response.prompt_tokens)
+        LLM_REQUESTS.labels(self.name, "success").inc()
+
+    def _on_error(self, error: Exception) -> None:
+        if isinstance(error, RateLimitError):
+            self.limiter.on_rate_limited(error.retry_after)
+            LLM_REQUESTS.labels(self.name, "rate_limited").inc()
+        elif isinstance(error, LLMTimeoutError):
+            LLM_REQUESTS.labels(self.name, "timeout").inc()
+        else:
+            LLM_REQUESTS.labels(self.name, "error").inc()
+
+    @staticmethod
+    def _remaining(deadline: float | None) -> float | None:
+        """Seconds left until the deadline, or None without one."""
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeoutError(f"LLM call exceeded its {LLM_TIMEOUT:g}s deadline.")
+        return remaining
+
+    def _collect_stream(self, chunks, json_output: bool, deadline: float | None) -> tuple[str, bool]:
+        """
+        Join streamed text chunks, enforcing the deadline between chunks.
+
+        Args:
+            chunks (Iterable[str]): Text pieces as they arrive.
+            json_output (bool): Stop as soon as the first JSON object is complete.
+            deadline (float | None): `time.monotonic()` value the call must finish by.
+
+        Returns:
+            tuple[str, bool]: The text, and whether the stream was stopped early.
+        """
+        scanner = JsonObjectScanner() if json_output else None
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            end = scanner.feed(chunk) if scanner else None
+            if end is not None:
+                LLM_EARLY_STOPS.labels(self.name).inc()
+                return "".join(parts)[:end], True
+            self._remaining(deadline)
+        return "".join(parts), False
+
+    async def _collect_stream_async(self, chunks, json_output: bool) -> tuple[str, bool]:
+        """Asynchronous version of `_collect_stream`; the deadline is enforced by `generate_async`."""
+        scanner = JsonObjectScanner() if json_output else None
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            end = scanner.feed(chunk) if scanner else None
+            if end is not None:
+                LLM_EARLY_STOPS.labels(self.name).inc()
+                return "".join(parts)[:end], True
+        return "".join(parts), False
+
+    def warm_up(self) -> None:
+        """
+        Prepare for the first request: load the provider SDK and open its connection.
+
+        Called once at worker startup so the first submission does not pay for it.
+
+        Raises:
+            Exception: If the provider cannot be reached.
+        """
+
+    def _generate(self, prompt: str, json_output: bool, response_schema: dict | None,
+                  deadline: float | None) -> LLMResponse:
+        raise NotImplementedError
+
+    async def _generate_async(self, prompt: str, json_output: bool, response_schema: dict | None) -> LLMResponse:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self.model}')"
+
+
+class GeminiBackend(GraderBackend):
+    """Google Gemini through the `google-generativeai` SDK."""
+
+    provider = "gemini"
+    _configured = False
+    _configure_lock = threading.Lock()
+
+    def __init__(self, model: str, api_key: str | None = None, limiter: TokenBucketLimiter | None = None):
+        """
+        Args:
+            model (str): Gemini model name, e.g. "gemini-2.5-flash".
+            api_key (str, optional): API key; defaults to GEMINI_API_KEY.
+            limiter (TokenBucketLimiter, optional): Quota for this backend.
+        """
+        super().__init__(model, limiter)
+        import google.generativeai as genai
+
+        # The SDK is configured once, when the first Gemini backend is created rather than at import
+        with GeminiBackend._configure_lock:
+            if not GeminiBackend._configured:
+                genai.configure(api_key=api_key or GEMINI_API_KEY)
+                GeminiBackend._configured = True
+        self._genai = genai
+        self._model = genai.GenerativeModel(model)
+
+    def warm_up(self) -> None:
+        # A metadata lookup opens the gRPC channel and checks the key without using generation quota
+        self._genai.get_model(f"models/{self.model}", request_options={"timeout": 10, "retry": None})
+
+    def _generation_config(self, json_output: bool, response_schema: dict | None):
+        options = {}
+        if LLM_MAX_OUTPUT_TOKENS:
+            options["max_output_tokens"] = LLM_MAX_OUTPUT_TOKENS
+        if json_output:
+            options["response_mime_type"] = "application/json"
+            if response_schema is not None:
+                options["response_schema"] = response_schema
+        return self._genai.GenerationConfig(**options)
+
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        try:
+            return chunk.text
+        except ValueError:
+            return ""  # A chunk without text parts, e.g. one carrying only the finish reason
+
+    @staticmethod
+    def _cancel(response) -> None:
+        """Stop a streaming call whose answer is already complete, so no more tokens are generated."""
+        cancel = getattr(getattr(response, "_iterator", None), "cancel", None)
+        if cancel is not None:
+            cancel()
+
+    def _request_options(self, deadline: float | None) -> dict:
+        """
+        Bound the call by the deadline. The SDK's own retries are disabled: they would
+        restart the timeout on every attempt, and the grader already retries and fails over.
+        """
+        options = {"retry": None}
+        if deadline is not None:
+            options["timeout"] = self._remaining(deadline)
+        return options
+
+    @staticmethod
+    def _to_response(text: str, last_response) -> LLMResponse:
+        usage = getattr(last_response, "usage_metadata", None)
+        return LLMResponse(
+            text,
+            prompt_tokens=getattr(usage, "prompt_token_count", None) or None,
+            output_tokens=getattr(usage, "candidates_token_count", None) or None
+        )
+
+    @staticmethod
+    def _translate_error(error: Exception) -> Exception:
+        """Turn the SDK's quota and deadline errors into RateLimitError and LLMTimeoutError."""
+        from google.api_core import exceptions as google_exceptions
+        if isinstance(error, google_exceptions.ResourceExhausted):
+            return RateLimitError(f"Gemini quota exceeded: {error}")
+        if isinstance(error, google_exceptions.DeadlineExceeded):
+            return LLMTimeoutError(f"Gemini call exceeded its deadline: {error}")
+        return error
+
+    def _generate(self, prompt, json_output, response_schema, deadline):
+        try:
+            response = self._model.generate_content(
+                prompt, generation_config=self._generation_config(json_output, response_schema),
+                stream=LLM_STREAMING,
+                request_options=self._request_options(deadline)
+            )
+            if not LLM_STREAMING:
+                return self._to_response(response.text, response)
+
+            last_chunk = None
+
+            def texts():
+                nonlocal last_chunk
+                for chunk in response:
+                    last_chunk = chunk
+                    yield self._chunk_text(chunk)
+
+            text, stopped_early = self._collect_stream(texts(), json_output, deadline)
+            if stopped_early:
+                self._cancel(response)
+            return self._to_response(text, last_chunk)
+        except (RateLimitError, LLMTimeoutError):
+            raise
+        except Exception as e:
+            raise self._translate_error(e) from e
+
+    async def _generate_async(self, prompt, json_output, response_schema):
+        try:
+            response = await self._model.generate_content_async(
+                prompt, generation_config=self._generation_config(json_output, response_schema),
+                stream=LLM_STREAMING, request_options=self._request_options(None)
+            )
+            if not LLM_STREAMING:
+                return self._to_response(response.text, response)
+
+            last_chunk = None
+
+            async def texts():
+                nonlocal last_chunk
+                async for chunk in response:
+                    last_chunk = chunk
+                    yield self._chunk_text(chunk)
+
+            text, stopped_early = await self._collect_stream_async(texts(), json_output)
+            if stopped_early:
+                self._cancel(response)
+            return self._to_response(text, last_chunk)
+        except Exception as e:
+            raise self._translate_error(e) from e
+
+
+class OpenAICompatibleBackend(GraderBackend):
+    """Any endpoint implementing the OpenAI `/chat/completions` API, with server-sent event streaming."""
+
+    provider = "openai"
+
+    def __init__(self, model: str, base_url: str | None = None, api_key: str | None = None,
+                 limiter: TokenBucketLimiter | None = None):
+        """
+        Args:
+            model (str): Model name at the endpoint.
+            base_url (str, optional): API root such as "https://api.openai.com/v1"; defaults to OPENAI_BASE_URL.
+            api_key (str, optional): Bearer token; defaults to OPENAI_API_KEY.
+            limiter (TokenBucketLimiter, optional): Quota for this backend.
+        """
+        super().__init__(model, limiter)
+        self.base_url = (base_url or OPENAI_BASE_URL).rstrip('/')
+        self.url = f"{self.base_url}/chat/completions"
+        self.headers = {"Content-Type": "application/json"}
+        if api_key or OPENAI_API_KEY:
+            self.headers["Authorization"] = f"Bearer {api_key or OPENAI_API_KEY}"
+        self._async_client = None
+
+    def warm_up(self) -> None:
+        # Listing models opens a pooled keep-alive connection and checks the key
+        response = get_session("llm").get(f"{self.base_url}/models", headers=self.headers, timeout=10)
+        response.close()
+
+    def _payload(self, prompt: str, json_output: bool, response_schema: dict | None) -> dict:
+        payload = {"model": self.model, "messages": [{"role": "user", "content": prompt}]}
+        if LLM_MAX_OUTPUT_TOKENS:
+            payload["max_tokens"] = LLM_MAX_OUTPUT_TOKENS
+        if LLM_STREAMING:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        if response_schema is not None:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "review", "schema": response_schema, "strict": False}
+            }
+        elif json_output:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
+
+    @staticmethod
+    def _check_status(status_code: int, headers, body_text: str) -> None:
+        if status_code == 429:
+            retry_after = headers.get("Retry-After")
+            raise RateLimitError(
+                f"Rate limited by LLM endpoint: {body_text[:200]}",
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        if status_code >= 400:
+            raise Exception(f"LLM endpoint request failed: {status_code} - {body_text[:500]}")
+
+    @staticmethod
+    def _to_response(body_text: str) -> LLMResponse:
+        body = json.loads(body_text)
+        usage = body.get("usage") or {}
+        return LLMResponse(
+            body["choices"][0]["message"]["content"],
+            prompt_tokens=usage.get("prompt_tokens"),
+            output_tokens=usage.get("completion_tokens")
+        )
+
+    @staticmethod
+    def _parse_event(line: str, usage: dict) -> str:
+        """Return the text delta of one server-sent event line, collecting usage if present."""
+        if not line.startswith("data:"):
+            return ""
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            return ""
+        event = json.loads(data)
+        usage.update(event.get("usage") or {})
+        choices = event.get("choices") or []
+        return (choices[0].get("delta") or {}).get("content") or "" if choices else ""
+
+    def _generate(self, prompt, json_output, response_schema, deadline):
+        try:
+            response = get_session("llm").post(
+                self.url, headers=self.headers, json=self._payload(prompt, json_output, response_schema),
+                stream=LLM_STREAMING, timeout=self._remaining(deadline)
+            )
+        except requests.Timeout as e:
+            raise LLMTimeoutError(f"LLM endpoint did not respond in time: {e}") from e
+        with response:
+            if not LLM_STREAMING or response.status_code >= 400:
+                self._check_status(response.status_code, response.headers, response.text)
+                return self._to_response(response.text)
+
+            usage = {}
+            lines = response.iter_lines(decode_unicode=True)
+            text, _ = self._collect_stream(
+                (self._parse_event(line, usage) for line in lines), json_output, deadline
+            )
+        # Leaving the block closes the connection, which stops generation after an early stop
+        return LLMResponse(text, prompt_tokens=usage.get("prompt_tokens"), output_tokens=usage.get("completion_tokens"))
+
+    async def _generate_async(self, prompt, json_output, response_schema):
+        if self._async_client is None:
+            self._async_client = create_async_client()
+        payload = self._payload(prompt, json_output, response_schema)
+        async with self._async_client.stream("POST", self.url, headers=self.headers, json=payload) as response:
+            if not LLM_STREAMING or response.status_code >= 400:
+                body_text = (await response.aread()).decode("utf-8", errors="replace")
+                self._check_status(response.status_code, response.headers, body_text)
+                return self._to_response(body_text)
+
+            usage = {}
+
+            async def texts():
+                async for line in response.aiter_lines():
+                    yield self._parse_event(line, usage)
+
+            text, _ = await self._collect_stream_async(texts(), json_output)
+        return LLMResponse(text, prompt_tokens=usage.get("prompt_tokens"), output_tokens=usage.get("completion_tokens"))
+
+
+class FakeBackend(GraderBackend):
+    """
+    Local stand-in that answers after a configurable delay with a valid review:
+    the first level of every rubric criterion found in the prompt. Prompts with
+    several "=== SUBMISSION <key> ===" sections (batch grading) get one review per key.
+    The review is streamed in small chunks and the call deadline applies.
+    """
+
+    provider = "fake"
+
+    _CRITERION_PATTERN = re.compile(r'"criterionid":\s*"?(\w+)"?.*?"levels":\s*\[\s*\{\s*"id":\s*"?(\w+)"?', re.S)
+    _SUBMISSION_PATTERN = re.compile(r"^=== SUBMISSION (\S+) ===$", re.M)
+    _CHUNK_SIZE = 64
+
+    def __init__(self, model: str = "fake", latency: float | None = None, jitter: float = 0.2,
+                 limiter: TokenBucketLimiter | None = None):
+        """
+        Args:
+            model (str, optional): Name reported for the backend.
+            latency (float, optional): Mean response time in seconds; defaults to FAKE_LLM_LATENCY.
+            jitter (float, optional): Standard deviation as a fraction of the latency.
+            limiter (TokenBucketLimiter, optional): Quota for this backend.
+        """
+        super().__init__(model, limiter)
+        self.latency = FAKE_LLM_LATENCY if latency is None else latency
+        self.jitter = jitter
+
+    def _delay(self) -> float:
+        return max(0.0, random.gauss(self.latency, self.latency * self.jitter))
+
+    def _review_text(self, prompt: str) -> str:
+        criteria = [
+            {"criterionid": criterion, "levelid": level, "remark": "Meets expectations."}
+            for criterion, level in self._CRITERION_PATTERN.findall(prompt)
+        ]
+        review = {"criteria_results": criteria, "feedback_comment": "Good work."}
+        submission_keys = self._SUBMISSION_PATTERN.findall(prompt)
+        if submission_keys:
+            review = {key: review for key in submission_keys}
+        return json.dumps(review)
+
+    def _chunks(self, text: str) -> list[str]:
+        return [text[i:i + self._CHUNK_SIZE] for i in range(0, len(text), self._CHUNK_SIZE)]
+
+    def _generate(self, prompt, json_output, response_schema, deadline):
+        remaining = self._remaining(deadline)
+        delay = self._delay()
+        if remaining is not None and delay > remaining:
+            time.sleep(remaining)
+            raise LLMTimeoutError(f"LLM call exceeded its {LLM_TIMEOUT:g}s deadline.")
+        time.sleep(delay)
+        text, _ = self._collect_stream(self._chunks(self._review_text(prompt)), json_output, deadline)
+        return LLMResponse(text, prompt_tokens=estimate_tokens(prompt), output_tokens=estimate_tokens(text))
+
+    async def _generate_async(self, prompt, json_output, response_schema):
+        await asyncio.sleep(self._delay())
+
+        async def texts():
+            for chunk in self._chunks(self._review_text(prompt)):
+                yield chunk
+
+        text, _ = await self._collect_stream_async(texts(), json_output)
+        return LLMResponse(text, prompt_tokens=estimate_tokens(prompt), output_tokens=estimate_tokens(text))
+
+
+class FailoverBackend(GraderBackend):
+    """
+    Sends each request to the first healthy backend in priority order.
+
+    A backend is skipped while it is paused after a rate limit, and for a
+    cooldown period once the p95 latency or error rate of its recent calls
+    crosses the configured thresholds. A failed request is retried on the
+    next backend. If every backend is unhealthy, all are tried in order.
+    """
+
+    provider = "failover"
+
+    def __init__(self, backends: list[GraderBackend], p95_threshold: float = LLM_FAILOVER_P95_SECONDS,
+                 error_rate_threshold: float = LLM_FAILOVER_ERROR_RATE, window: int = LLM_FAILOVER_WINDOW,
+                 cooldown: float = LLM_FAILOVER_COOLDOWN):
+        """
+        Args:
+            backends (list[GraderBackend]): Backends in priority order.
+            p95_threshold (float, optional): Recent p95 latency in seconds that trips a backend.
+            error_rate_threshold (float, optional): Recent error rate (0-1) that trips a backend.
+            window (int, optional): Number of recent calls considered per backend.
+            cooldown (float, optional): Seconds a tripped backend is skipped.
+        """
+        if not backends:
+            raise ValueError("FailoverBackend needs at least one backend.")
+        super().__init__(backends[0].model)
+        self.backends = backends
+        self.p95_threshold = p95_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.cooldown = cooldown
+        self._samples = {id(backend): deque(maxlen=window) for backend in backends}  # (seconds, ok)
+        self._tripped_until = {id(backend): 0.0 for backend in backends}
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        # The primary backend names the chain; responses name the backend that actually answered
+        return self.backends[0].name
+
+    def _record(self, backend: GraderBackend, seconds: float, ok: bool) -> None:
+        """Record a call and trip the backend if its recent calls are too slow or failing."""
+        with self._lock:
+            samples = self._samples[id(backend)]
+            samples.append((seconds, ok))
+            if len(samples) < max(5, samples.maxlen // 4):
+                return  # Too few calls to judge
+
+            latencies = sorted(s for s, _ in samples)
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            error_rate = sum(1 for _, success in samples if not success) / len(samples)
+            if p95 > self.p95_threshold or error_rate > self.error_rate_threshold:
+                self._tripped_until[id(backend)] = time.monotonic() + self.cooldown
+                samples.clear()  # Judge the backend afresh after the cooldown
+                LLM_REQUESTS.labels(backend.name, "tripped").inc()
+
+    def _candidates(self) -> list[GraderBackend]:
+        """Healthy backends first, in priority order, then the rest as a last resort."""
+        now = time.monotonic()
+        healthy = [b for b in self.backends if b.is_available() and self._tripped_until[id(b)] <= now]
+        return healthy + [b for b in self.backends if b not in healthy]
+
+    def is_available(self) -> bool:
+        return any(backend.is_available() for backend in self.backends)
+
+    def warm_up(self) -> None:
+        """Warm up every backend; fails only if none of them can be reached."""
+        errors = []
+        for backend in self.backends:
+            try:
+                backend.warm_up()
+            except Exception as e:
+                errors.append(f"{backend.name}: {e}")
+        if len(errors) == len(self.backends):
+            raise Exception(f"No LLM backend could be warmed up: {'; '.join(errors)}")
+
+    def generate(self, prompt: str, json_output: bool = True, response_schema: dict | None = None) -> LLMResponse:
+        last_error = None
+        for backend in self._candidates():
+            start = time.perf_counter()
+            try:
+                response = backend.generate(prompt, json_output, response_schema)
+            except Exception as e:
+                self._record(backend, time.perf_counter() - start, ok=False)
+                last_error = e
+                continue
+            self._record(backend, time.perf_counter() - start, ok=True)
+            return response
+        raise last_error
+
+    async def generate_async(self, prompt: str, json_output: bool = True,
+                             response_schema: dict | None = None) -> LLMResponse:
+        last_error = None
+        for backend in self._candidates():
+            start = time.perf_counter()
+            try:
+                response = await backend.generate_async(prompt, json_output, response_schema)
+            except Exception as e:
+                self._record(backend, time.perf_counter() - start, ok=False)
+                last_error = e
+                continue
+            self._record(backend, time.perf_counter() - start, ok=True)
+            return response
+        raise last_error
+
+    def __repr__(self):
+        return f"FailoverBackend({self.backends})"
+
+
+# ---------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------
+def create_backend(spec: str) -> GraderBackend:
+    """
+    Create a backend from a "<provider>:<model>" spec with the configured quota.
+
+    Args:
+        spec (str): e.g. "gemini:gemini-2.5-flash", "openai:gpt-4o-mini" or "fake".
+
+    Returns:
+        GraderBackend: The backend.
+
+    Raises:
+        ValueError: If the provider is unknown.
+    """
+    provider, _, model = spec.strip().partition(":")
+    provider = provider.lower()
+    limiter = TokenBucketLimiter(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+    if provider == "gemini":
+        return GeminiBackend(model or GEMINI_MODEL, limiter=limiter)
+    if provider == "openai":
+        if not model:
+            raise ValueError("An OpenAI-compatible backend needs a model, e.g. 'openai:gpt-4o-mini'.")
+        return OpenAICompatibleBackend(model, limiter=limiter)
+    if provider == "fake":
+        return FakeBackend(model or "fake", limiter=limiter)
+    raise ValueError(f"Unknown LLM provider '{provider}'. Expected one of: gemini, openai, fake")
+
+
+def create_backend_chain(specs: str) -> GraderBackend:
+    """
+    Create the backend for a comma-separated list of specs.
+
+    Args:
+        specs (str): Backends in priority order, e.g. "gemini:gemini-2.5-flash,openai:gpt-4o-mini".
+
+    Returns:
+        GraderBackend: The single backend, or a FailoverBackend over all of them.
+    """
+    backends = [create_backend(spec) for spec in specs.split(",") if spec.strip()]
+    if not backends:
+        raise ValueError("LLM_BACKENDS is empty.")
+    return backends[0] if len(backends) == 1 else FailoverBackend(backends)
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_default_backend() -> GraderBackend:
+    """
+    Return the process-wide backend configured by LLM_BACKENDS.
+
+    It is created on first use so quotas and health are shared by every
+    grader in the process.
+    """
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = create_backend_chain(LLM_BACKENDS)
+        return _default_backend
@@ -0,0 +1,133 @@
+import os, threading
+import requests
+from typing import TYPE_CHECKING
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import config  # noqa: F401 (loads .env before the settings below are read)
+
+if TYPE_CHECKING:
+    import httpx
+
+# Connection pool and resilience settings shared by every outbound HTTP client
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))          # keep-alive connections per host
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))            # seconds, connect and read
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.5"))  # seconds, doubled per retry
+
+# Transient upstream failures worth retrying
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+# Services whose callers handle rate limits themselves with a bounded wait (see github_repository._get
+# and RATE_LIMIT_MAX_WAIT). urllib3 would otherwise sleep for the whole Retry-After inside the request.
+CALLER_RATE_LIMITED_SERVICES = ("github",)
+
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies a default timeout to every request.
+
+    `requests` waits forever unless a timeout is passed on each call; mounting
+    this adapter makes the configured timeout the default for a whole session.
+    """
+
+    def __init__(self, *args, timeout: float = HTTP_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def create_session(pool_size: int = HTTP_POOL_SIZE, timeout: float = HTTP_TIMEOUT,
+                   retries: int = HTTP_RETRIES, backoff: float = HTTP_RETRY_BACKOFF,
+                   rate_limits: bool = True) -> requests.Session:
+    """
+    Create a `requests.Session` with keep-alive pooling, a default timeout and retries.
+
+    Connection failures are retried for every method. Retryable status codes
+    are only retried for idempotent methods, so a POST is never sent twice
+    after the server has received it.
+
+    Args:
+        pool_size (int, optional): Maximum pooled connections per host.
+        timeout (float, optional): Default connect/read timeout in seconds.
+        retries (int, optional): Maximum retries per request.
+        backoff (float, optional): Exponential backoff factor in seconds.
+        rate_limits (bool, optional): Also retry 429 responses and wait out any `Retry-After`
+            header. Pass False when the caller handles rate limits itself.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=tuple(code for code in RETRY_STATUS_CODES if rate_limits or code != 429),
+        respect_retry_after_header=rate_limits,
+        raise_on_status=False
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout, max_retries=retry,
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(name: str, pool_size: int | None = None) -> requests.Session:
+    """
+    Return the process-wide session for a named upstream service, creating it on first use.
+
+    Each service ("github", "moodle", "supabase", ...) gets its own pool, so a
+    slow upstream cannot exhaust connections meant for another. Sessions are
+    safe to share between worker threads.
+
+    Args:
+        name (str): Name of the upstream service.
+        pool_size (int, optional): Pool size if the session is created by this call.
+            Defaults to HTTP_POOL_SIZE.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = _sessions[name] = create_session(
+                    pool_size=pool_size or HTTP_POOL_SIZE,
+                    rate_limits=name not in CALLER_RATE_LIMITED_SERVICES
+                )
+    return session
+
+
+def create_async_client(verify: bool = True, pool_size: int = HTTP_POOL_SIZE,
+                        timeout: float = HTTP_TIMEOUT, retries: int = HTTP_RETRIES) -> "httpx.AsyncClient":
+    """
+    Create an `httpx.AsyncClient` with the same pooling and timeout settings, for the asyncio worker.
+
+    httpx only retries connection failures; status-based retries are left to the caller.
+
+    Args:
+        verify (bool, optional): Whether to verify TLS certificates.
+        pool_size (int, optional): Maximum pooled connections.
+        timeout (float, optional): Default timeout in seconds.
+        retries (int, optional): Connection retries.
+
+    Returns:
+        httpx.AsyncClient: The configured client. The caller is responsible for closing it.
+    """
+    import httpx  # Deferred: only the asyncio worker needs it
+
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    transport = httpx.AsyncHTTPTransport(verify=verify, retries=retries, limits=limits)
+    return httpx.AsyncClient(transport=transport, timeout=timeout)
@@ -0,0 +1,119 @@
+import json, time, hashlib, sqlite3, threading
+from scheduling import is_regrade
+
+# Pipeline stages recorded for a submission, in processing order
+STAGE_FILES = "files"              # repository fetched: {"file_hash", "file_count", "commit_sha"}
+STAGE_REVIEW = "review"            # valid review produced: the parsed review
+STAGE_GRADE_SAVED = "grade_saved"  # grade posted to Moodle: {"review_hash"}
+STAGE_REPORTED = "reported"        # success status report sent: {"status"}
+
+
+def fingerprint(data) -> str:
+    """Return a stable SHA-256 hex digest of JSON-serializable data."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class JobStateStore:
+    """
+    Persistent record of the pipeline stages completed for each submission.
+
+    When a message is redelivered (e.g. after the Moodle POST or the status
+    report failed), the worker resumes at the first incomplete stage instead
+    of fetching the repository and calling the LLM again, and never posts the
+    same grade to Moodle twice.
+
+    Jobs are keyed by the submission's `submissionid` and `timecreated`, so a
+    resubmission by the student is a new job. An instructor regrade of the same
+    submission is a separate job too: it is keyed by its "requestid", or not
+    checkpointed at all without one. State lives in a SQLite file and can be
+    shared by several worker processes on the same host.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float | None = None):
+        """
+        Args:
+            path (str): Path of the SQLite database file. Created if missing.
+            ttl_seconds (float, optional): How long job state is kept. None means forever.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS job_state ("
+                "job_key TEXT NOT NULL, stage TEXT NOT NULL, output TEXT, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (job_key, stage))"
+            )
+        self.purge_expired()
+
+    @staticmethod
+    def make_key(submission: dict) -> str | None:
+        """
+        Build the job key of a submission message.
+
+        Args:
+            submission (dict): The parsed submission message.
+
+        Returns:
+            str | None: "<submissionid>:<timecreated>", "<submissionid>:<timecreated>:regrade:<requestid>"
+                for a regrade, or None if a part is missing.
+        """
+        submission_id = submission.get("submissionid")
+        time_created = submission.get("timecreated")
+        if submission_id in (None, "") or time_created in (None, ""):
+            return None
+        if is_regrade(submission):
+            # The submission itself was graded already; only a request ID tells redeliveries from new regrades
+            request_id = submission.get("requestid")
+            return f"{submission_id}:{time_created}:regrade:{request_id}" if request_id not in (None, "") else None
+        return f"{submission_id}:{time_created}"
+
+    def completed_stages(self, job_key: str) -> dict[str, dict]:
+        """
+        Return the stages already completed for a job.
+
+        Args:
+            job_key (str): Key from `make_key`.
+
+        Returns:
+            dict[str, dict]: Stage name mapped to the output recorded for it.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT stage, output FROM job_state WHERE job_key = ?", (job_key,)
+            ).fetchall()
+        return {stage: json.loads(output) if output else {} for stage, output in rows}
+
+    def record(self, job_key: str, stage: str, output: dict | None = None) -> None:
+        """
+        Mark a stage of a job as completed, replacing any earlier record of it.
+
+        Args:
+            job_key (str): Key from `make_key`.
+            stage (str): One of the STAGE_* names.
+            output (dict, optional): Data needed to resume after this stage.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO job_state (job_key, stage, output, updated_at) VALUES (?, ?, ?, ?)",
+                (job_key, stage, json.dumps(output) if output is not None else None, time.time())
+            )
+
+    def purge_expired(self) -> int:
+        """
+        Delete jobs whose last update is older than the TTL.
+
+        Returns:
+            int: Number of stage records removed.
+        """
+        if self.ttl_seconds is None:
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM job_state WHERE job_key IN "
+                "(SELECT job_key FROM job_state GROUP BY job_key HAVING MAX(updated_at) < ?)",
+                (cutoff,)
+            )
+        return cursor.rowcount
@@ -1,26 +1,49 @@
-import google.generativeai as genai
-import os, json, ast
-from dotenv import load_dotenv
+import os, json, ast, asyncio, logging
+from config import env_flag
+from grader_backends import GraderBackend, get_default_backend
+from review_cache import ReviewCache
+from file_filter import FileFilter
+from prompt_builder import build_prompt_prefix, code_section_parts, incremental_section_parts
+from static_analysis import analysis_section_parts
+from rubric_schema import build_response_schema, validate_review
+from job_state_store import fingerprint
+from assignment_cache import AssignmentContext
+from metrics import track_stage, record_llm_usage, LLM_RETRIES
 
-# Load environment variables from .env file
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# Load Gemini API configuration
-API_KEY = os.getenv('GEMINI_API_KEY')
-MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+# Ask the model for JSON matching a schema built from the rubric, instead of relying on the prompt alone
+STRUCTURED_OUTPUT = env_flag('STRUCTURED_OUTPUT', True)
 
-# Configure Google Generative AI
-genai.configure(api_key=API_KEY)
+# Extra LLM calls allowed when a response is invalid; the retry asks the model to repair its answer
+STRUCTURED_OUTPUT_RETRIES = max(0, int(os.getenv('STRUCTURED_OUTPUT_RETRIES', '2')))
+
+REPAIR_INSTRUCTIONS = """
+### Correction
+Your previous response could not be used:
+{errors}
+
+Previous response:
+{response}
+
+Respond again with the complete, corrected review, **only** as JSON in the response template format.
+"""
 
 
 class LLMCodeGrader:
     """
     Automatically evaluates and reviews student code submissions using
-    a Large Language Model (Gemini). The class builds a structured prompt
-    that includes a rubric, activity instructions, and student code files.
+    a Large Language Model (Gemini by default, see `grader_backends`). The class
+    builds a structured prompt that includes a rubric, activity instructions,
+    and student code files.
     """
 
-    def __init__(self, files: list[dict], rubric: str, activity_instruction: str, output_template: str):
+    def __init__(self, files: list[dict], rubric: str, activity_instruction: str, output_template: str,
+                 cache: ReviewCache | None = None, token_budget: int | None = None,
+                 file_filter: FileFilter | None = None, criteria: list[dict] | None = None,
+                 backend: GraderBackend | None = None, previous_review: dict | None = None,
+                 changes: list[dict] | None = None, analysis: dict | None = None,
+                 assignment: AssignmentContext | None = None):
 
         """
         Initialize the LLMCodeGrader.
@@ -35,44 +58,79 @@ class LLMCodeGrader:
             rubric (str): Grading rubric text describing evaluation criteria.
             activity_instruction (str): Instructions for the coding activity.
             output_template (str): Expected format or JSON schema for output.
+            cache (ReviewCache, optional): Cache of parsed reviews. Identical prompts
+                sent to the same model reuse the cached review instead of calling the LLM.
+            token_budget (int, optional): Maximum estimated tokens for the student code
+                section. Files are ranked by relevance and the least relevant are
+                truncated or dropped to fit. None means unlimited.
+            file_filter (FileFilter, optional): Rules for skipping binary, vendored and
+                generated files. None keeps every file.
+            criteria (list[dict], optional): The rubric criteria as structured data. When
+                given, responses are requested in a schema built from them and checked
+                to select one existing level for every criterion.
+            backend (GraderBackend, optional): LLM backend to grade with. Defaults to the
+                process-wide backend configured by LLM_BACKENDS.
+            previous_review (dict, optional): Review of the student's previously graded
+                version. When given, this is an incremental regrade: `files` holds only
+                the changed files and the prompt shows the previous review and the diff.
+            changes (list[dict], optional): Changed files from `GitHubRepository.compare_commits`,
+                for an incremental regrade.
+            analysis (dict, optional): Result of `static_analysis.analyze_submission`. Its
+                findings are added to the prompt, and files that do not fit the token
+                budget are shown as an outline. Ignored for an incremental regrade.
+            assignment (AssignmentContext, optional): Precomputed prompt prefix, response
+                schema and level lookup of the assignment (see `assignment_cache`), used
+                instead of building them from `rubric`, `activity_instruction`,
+                `output_template` and `criteria`, which must be the ones it was built from.
         """
         
         self.files = files
         self.rubric = rubric
         self.activity_instruction = activity_instruction
         self.output_template = output_template
-        self.model = genai.GenerativeModel(MODEL)
-        
-        
-        # === Construct Prompt Sections ===
-        prompt_intro = "You are an expert programming instructor and automatic grader."
-        prompt_task_definition = """
-### Task definition
-- Grade the following student's code using the given rubric guide and the weightings set for each criterion.
-- Apply each criterion fairly.
-- You may simulate test cases mentally; do not run code.
-- Be concise and constructive.
-"""
-        prompt_rubric_guide = f"### Rubric\n{self.rubric}"
-        prompt_activity_instruction = f"###Activity Instructions for the learner\n{self.activity_instruction}"
-        prompt_repsponse_guide = f"### Response Template\nRespond **only** using the following format:\n{self.output_template}"
-        prompt_code_content = f"### Student Code:\n{self.get_file_contents()}"
-
-        # === Combine all parts into the final prompt ===
-        self.prompt = (
-            f"{prompt_intro}\n"
-            f"{prompt_task_definition}\n"
-            f"{prompt_rubric_guide}\n"
-            f"{prompt_activity_instruction}\n"
-            f"{prompt_repsponse_guide}\n"
-            f"{prompt_code_content}\n"
-        )
+        self.cache = cache
+        self.token_budget = token_budget
+        self.file_filter = file_filter
+        self.criteria = criteria
+        self.previous_review = previous_review
+        self.changes = changes or []
+        self.analysis = analysis
+        self.assignment = assignment
+        self.prompt_report = None  # What made it into the prompt; filled in by get_file_contents
+        self.backend = backend or get_default_backend()
+
+        # The prefix is identical for every student of an assignment; only the code differs
+        if assignment is not None:
+            self.response_schema = assignment.response_schema if STRUCTURED_OUTPUT else None
+            self.prompt_prefix = assignment.prompt_prefix
+        else:
+            self.response_schema = build_response_schema(criteria) if STRUCTURED_OUTPUT and criteria is not None else None
+            self.prompt_prefix = build_prompt_prefix(self.rubric, self.activity_instruction, self.output_template)
+        # One join straight from the file contents, so the student code is copied exactly once
+        self.prompt = "".join([self.prompt_prefix, "### Student Code:\n", *self._code_section_parts(), "\n"])
+
+    @property
+    def prefix_key(self) -> str:
+        """Stable hash of `prompt_prefix`; equal for graders of the same assignment version."""
+        if self.assignment is not None:
+            return self.assignment.prefix_key
+        return fingerprint(self.prompt_prefix)
+
+    @property
+    def code_content(self) -> str:
+        """The part of the prompt after `prompt_prefix`: the student code section."""
+        return self.prompt[len(self.prompt_prefix):]
 
     def get_file_contents(self):
         """
         Combine all file contents into a readable Markdown-style text block
         for inclusion in the prompt.
 
+        Files are filtered and fitted into the token budget; what was included,
+        truncated or dropped is recorded in `self.prompt_report`. For an
+        incremental regrade the previous review and the diff come first; with
+        a static analysis its findings, and outlines of left-out files, follow.
+
         Returns:
             str: Concatenated text of all files in the format:
                 <path>
@@ -80,28 +138,212 @@ class LLMCodeGrader:
                 <content>
                 ```
         """
-        file_contents_in_text = ''
-        for file in self.files:
-            file_contents_in_text += f"\n\n{file.get('path')}\n```\n{file.get('content')}\n```\n"
+        return "".join(self._code_section_parts())
+
+    def _code_section_parts(self) -> list[str]:
+        """Select the pieces of the student code section and record `self.prompt_report`."""
+        if self.previous_review is not None:
+            parts, self.prompt_report = incremental_section_parts(
+                self.previous_review, self.changes, self.files,
+                token_budget=self.token_budget,
+                file_filter=self.file_filter
+            )
+            return parts
+
+        if self.analysis is not None:
+            parts, self.prompt_report = analysis_section_parts(
+                self.analysis, self.files,
+                activity_instruction=self.activity_instruction,
+                token_budget=self.token_budget,
+                file_filter=self.file_filter
+            )
+            return parts
 
-        return file_contents_in_text
+        parts, self.prompt_report = code_section_parts(
+            self.files,
+            activity_instruction=self.activity_instruction,
+            token_budget=self.token_budget,
+            file_filter=self.file_filter
+        )
+        return parts
     
     def get_structured_review(self):
         """
-        Generate a code review and grade response from the Gemini model.
+        Generate a code review and grade response from the LLM backend.
+
+        If a cache is configured and this exact prompt was already reviewed by the
+        same model, the stored review is returned without calling the model.
+        Only valid reviews are cached.
+
+        Responses that cannot be parsed or do not match the rubric are retried up
+        to `STRUCTURED_OUTPUT_RETRIES` times with a repair prompt listing the
+        problems; only the LLM call is repeated.
 
         Returns:
-            str: The text output generated by the model.
+            dict | str: The parsed review, or an "Error: ..." string if no valid
+                review was produced.
         """
-        try:
-            response = self.model.generate_content(self.prompt)
-            response_text = response.text
+        cache_key = self._cache_key()
+        cached_review = self._get_cached_review(cache_key)
+        if cached_review is not None:
+            return cached_review
+
+        prompt = self.prompt
+        error = None
+        for attempt in range(STRUCTURED_OUTPUT_RETRIES + 1):
+            try:
+                with track_stage("llm_call"):
+                    response = self.backend.generate(prompt, STRUCTURED_OUTPUT, self.response_schema)
+                record_llm_usage(response)
+                response_text = response.text
+            except Exception as e:
+                logger.warning("LLM call failed (attempt %d of %d): %s", attempt + 1, STRUCTURED_OUTPUT_RETRIES + 1, e)
+                error = str(e)
+                LLM_RETRIES.labels("api_error").inc()
+                continue
+
+            review, problems = self._process_response_text(response_text, self._cache_key(response.backend))
+            if not problems:
+                return review
+            error = "Invalid review: " + " ".join(problems)
+            prompt = self._repair_prompt(response_text, problems)
+            LLM_RETRIES.labels("invalid_response").inc()
+
+        return f"Error: {error}"
+
+    async def get_structured_review_async(self):
+        """
+        Asynchronous version of `get_structured_review`, using the backend's async API
+        so the event loop is free while the model generates.
+
+        Returns:
+            dict | str: The parsed review, or an "Error: ..." string if no valid
+                review was produced.
+        """
+        cache_key = self._cache_key()
+        cached_review = await asyncio.to_thread(self._get_cached_review, cache_key)
+        if cached_review is not None:
+            return cached_review
+
+        prompt = self.prompt
+        error = None
+        for attempt in range(STRUCTURED_OUTPUT_RETRIES + 1):
+            try:
+                with track_stage("llm_call"):
+                    response = await self.backend.generate_async(prompt, STRUCTURED_OUTPUT, self.response_schema)
+                record_llm_usage(response)
+                response_text = response.text
+            except Exception as e:
+                logger.warning("LLM call failed (attempt %d of %d): %s", attempt + 1, STRUCTURED_OUTPUT_RETRIES + 1, e)
+                error = str(e)
+                LLM_RETRIES.labels("api_error").inc()
+                continue
+
+            review, problems = await asyncio.to_thread(
+                self._process_response_text, response_text, self._cache_key(response.backend)
+            )
+            if not problems:
+                return review
+            error = "Invalid review: " + " ".join(problems)
+            prompt = self._repair_prompt(response_text, problems)
+            LLM_RETRIES.labels("invalid_response").inc()
+
+        return f"Error: {error}"
+
+    def get_cached_review(self) -> dict | None:
+        """
+        Return the cached review for this exact prompt without calling the model.
+
+        Returns:
+            dict | None: The cached review, or None on a miss or if caching is disabled.
+        """
+        return self._get_cached_review(self._cache_key())
+
+    def store_review(self, review, backend_name: str | None = None) -> None:
+        """
+        Cache a review produced for this grader's prompt by another code path,
+        such as batch grading. Invalid reviews are not stored.
+
+        Args:
+            review (dict): The parsed review.
+            backend_name (str, optional): `LLMResponse.backend` of the backend that wrote it.
+                Defaults to this grader's backend.
+        """
+        cache_key = self._cache_key(backend_name)
+        if cache_key and not self.validate_review(review):
+            self.cache.set(cache_key, review)
+
+    def validate_review(self, review) -> list[str]:
+        """
+        Check a parsed review before it is cached or sent to Moodle.
+
+        With rubric criteria, every criterion must be graded once with one of its
+        own levels; without them, the response only has to be a parsed JSON object.
+
+        Args:
+            review: The parsed model response.
+
+        Returns:
+            list[str]: Problems found, empty if the review is valid.
+        """
+        if self.criteria is not None:
+            levels = self.assignment.levels if self.assignment is not None else None
+            return validate_review(review, self.criteria, levels)
+        if not isinstance(review, dict) or "error" in review:
+            return ["The response must be a single JSON object."]
+        return []
+
+    def parse_response_text(self, response_text: str):
+        """
+        Strip a ```json fence from model output and parse it.
+
+        Args:
+            response_text (str): Raw model output.
+
+        Returns:
+            dict: Parsed JSON/dict data or error information.
+        """
+        with track_stage("response_parse"):
             if response_text.startswith("```json"):
                 response_text = response_text[7:].rsplit("```", 1)[0].strip()
             return self._safe_parse_text_to_json(response_text)
-        except Exception as e:
-            print(f"Gemini model call failed. {e}")
-            return f"Error: {str(e)}"
+
+    def _cache_key(self, backend_name: str | None = None) -> str | None:
+        """
+        Return the review cache key for this prompt, or None if caching is disabled.
+
+        Lookups use this grader's backend (the primary of a failover chain), while
+        reviews are stored under the backend that actually wrote them, so a review
+        by a fallback model is never served as the primary model's.
+        """
+        if not self.cache:
+            return None
+        return ReviewCache.make_key(backend_name or self.backend.name, self.prompt)
+
+    def _get_cached_review(self, cache_key: str | None) -> dict | None:
+        """Look up a previously stored review for this prompt."""
+        return self.cache.get(cache_key) if cache_key else None
+
+    def _repair_prompt(self, response_text: str, problems: list[str]) -> str:
+        """Build a follow-up prompt asking the model to fix its previous response."""
+        return self.prompt + REPAIR_INSTRUCTIONS.format(
+            errors="\n".join(f"- {problem}" for problem in problems),
+            response=response_text[:5000]
+        )
+
+    def _process_response_text(self, response_text: str, cache_key: str | None):
+        """
+        Parse and validate the model output, caching valid reviews.
+
+        Returns:
+            tuple[dict, list[str]]: The parsed review or error information, and
+                the validation problems (empty if the review is valid).
+        """
+        review = self.parse_response_text(response_text)
+        problems = self.validate_review(review)
+        if cache_key and not problems:
+            self.cache.set(cache_key, review)
+        return review, problems
 
 
     def get_prompt(self):
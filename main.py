@@ -1,12 +1,31 @@
-import os, sys, json, pika, bleach, logging
-from dotenv import load_dotenv
+import os, sys, json, time, signal, socket, logging, functools, tracemalloc
+from concurrent.futures import ThreadPoolExecutor, wait
+from config import env_flag
 from moodle_service import MoodleService
 from github_repository import GitHubRepository
+from repository_cache import RepositoryCache
+from review_cache import create_review_cache
+from file_filter import FileFilter
+from batch_grader import BatchGrader
+from job_state_store import JobStateStore, fingerprint, STAGE_FILES, STAGE_REVIEW, STAGE_GRADE_SAVED, STAGE_REPORTED
+from regrade_store import (
+    RegradeStore, file_hashes, is_small_change, update_file_hashes, admitted_changes, REGRADE_FULL, REGRADE_INCREMENTAL, REGRADE_UNCHANGED
+)
+from http_client import get_session, HTTP_POOL_SIZE
+from scheduling import FairScheduler, scheduling_key, queue_arguments
+from retry_topology import declare_retry_topology, failure_destination, dead_letter_queue_name, RETRY_MAX_ATTEMPTS, ATTEMPT_HEADER
+from metrics import (
+    track_stage, track_peak_memory, record_repo_files, start_metrics_server, worker_status,
+    SUBMISSIONS, PROMPT_CHARS, STAGES_SKIPPED, REGRADES, STARTUP_SECONDS
+)
+from grader_backends import get_default_backend
 from llm_code_grader import LLMCodeGrader
-from status_report_service import StatusReportService
-
-# Load environment variables from .env file
-load_dotenv()
+from static_analysis import analyze_submission
+from assignment_cache import AssignmentCache, AssignmentContext
+from moodle_service import MOODLE_API_URL, ENV
+from status_report_service import StatusReportService, SUPABASE_API_URL
+from status_reporter import BufferedStatusReporter
+from moodle_outbox import MoodleOutbox
 
 # Message queue and GitHub configuration
 MQ_HOST = os.getenv("MQ_HOST")
@@ -15,6 +34,90 @@ MQ_USERNAME = os.getenv("MQ_USERNAME")
 MQ_PASS = os.getenv("MQ_PASS")
 QUEUE = os.getenv("QUEUE")
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com')
+GITHUB_FETCH_MODE = os.getenv('GITHUB_FETCH_MODE', 'contents')
+GITHUB_MAX_CONCURRENCY = int(os.getenv('GITHUB_MAX_CONCURRENCY', '8'))  # parallel requests per repository
+
+# On-disk cache of repository files keyed by commit SHA (disabled unless a directory is set)
+REPO_CACHE_DIR = os.getenv('REPO_CACHE_DIR')
+REPO_CACHE_MAX_MB = int(os.getenv('REPO_CACHE_MAX_MB', '512'))
+
+# Cache of parsed LLM reviews so duplicate deliveries and identical resubmissions skip the model
+REVIEW_CACHE_BACKEND = os.getenv('REVIEW_CACHE_BACKEND', 'none')  # none | memory | sqlite
+REVIEW_CACHE_TTL = float(os.getenv('REVIEW_CACHE_TTL', '86400'))
+REVIEW_CACHE_MAX_ENTRIES = int(os.getenv('REVIEW_CACHE_MAX_ENTRIES', '1000'))
+REVIEW_CACHE_PATH = os.getenv('REVIEW_CACHE_PATH', '/tmp/review_cache.sqlite3')
+
+# Completed stages per submission, so redeliveries resume instead of refetching and regrading (empty disables it)
+JOB_STATE_DB = os.getenv('JOB_STATE_DB', '/tmp/autograder_jobs.sqlite3')
+JOB_STATE_TTL = float(os.getenv('JOB_STATE_TTL', str(7 * 24 * 3600)))
+
+# Incremental regrading: resubmissions with small changes are graded from the previous review plus the diff
+INCREMENTAL_REGRADE = env_flag('INCREMENTAL_REGRADE', False)
+INCREMENTAL_MAX_CHANGED_FILES = int(os.getenv('INCREMENTAL_MAX_CHANGED_FILES', '10'))
+INCREMENTAL_MAX_CHANGED_LINES = int(os.getenv('INCREMENTAL_MAX_CHANGED_LINES', '300'))  # added + deleted
+REGRADE_STATE_DB = os.getenv('REGRADE_STATE_DB', '/tmp/autograder_regrade.sqlite3')
+REGRADE_STATE_TTL = float(os.getenv('REGRADE_STATE_TTL', str(180 * 24 * 3600)))
+
+# Sanitized instruction, rubric lookups and prompt prefix kept per assignment (0 rebuilds them for every submission)
+ASSIGNMENT_CACHE_MAX_ENTRIES = int(os.getenv('ASSIGNMENT_CACHE_MAX_ENTRIES', '256'))
+
+# Prompt size controls: files skipped before download, and the token budget for student code
+FILE_MAX_BYTES = int(os.getenv('FILE_MAX_BYTES', '100000'))
+REPO_MAX_BYTES = int(os.getenv('REPO_MAX_BYTES', '5000000'))  # per repository; 0 disables the cap
+
+# Local analysis of Python submissions (signatures, syntax errors, complexity, required names) added to the
+# prompt; optionally runs the submission's own tests in a resource-limited subprocess (see `static_analysis`)
+STATIC_ANALYSIS = env_flag('STATIC_ANALYSIS', False)
+STATIC_ANALYSIS_RUN_TESTS = env_flag('STATIC_ANALYSIS_RUN_TESTS', False)
+FILE_EXCLUDE_PATTERNS = os.getenv('FILE_EXCLUDE_PATTERNS', '')  # comma-separated, gitignore-style
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '200000')) or None
+
+# Dashboard status reports are queued and bulk-inserted by a background thread (false = one POST per report)
+STATUS_REPORT_BUFFERED = env_flag('STATUS_REPORT_BUFFERED', True)
+STATUS_REPORT_BATCH_SIZE = int(os.getenv('STATUS_REPORT_BATCH_SIZE', '50'))
+STATUS_REPORT_FLUSH_SECONDS = float(os.getenv('STATUS_REPORT_FLUSH_SECONDS', '5'))
+STATUS_REPORT_JOURNAL = os.getenv('STATUS_REPORT_JOURNAL', '/tmp/autograder_status_journal.jsonl')  # empty = memory only
+
+# Moodle grade delivery through a local outbox: grades are queued and sent by a background thread,
+# batched per assignment with mod_assign_save_grades (false = one blocking request per submission)
+MOODLE_OUTBOX = env_flag('MOODLE_OUTBOX', False)
+MOODLE_OUTBOX_DB = os.getenv('MOODLE_OUTBOX_DB', '/tmp/autograder_moodle_outbox.sqlite3')  # one file per worker
+MOODLE_BATCH_SIZE = int(os.getenv('MOODLE_BATCH_SIZE', '20'))
+MOODLE_OUTBOX_FLUSH_SECONDS = float(os.getenv('MOODLE_OUTBOX_FLUSH_SECONDS', '2'))
+MOODLE_OUTBOX_MAX_ATTEMPTS = int(os.getenv('MOODLE_OUTBOX_MAX_ATTEMPTS', '8'))
+
+# Batch grading: submissions of the same assignment in flight together share one LLM call
+BATCH_GRADING = env_flag("BATCH_GRADING", False)
+BATCH_WINDOW_SECONDS = float(os.getenv("BATCH_WINDOW_SECONDS", "2"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+
+# Trace Python allocations to report each submission's peak memory (costs some CPU; for sizing workers)
+MEMORY_PROFILING = env_flag("MEMORY_PROFILING", False)
+
+# Prometheus metrics endpoint (0 disables it) and how often the queue depth is sampled
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8000"))
+QUEUE_DEPTH_INTERVAL = float(os.getenv("QUEUE_DEPTH_INTERVAL", "15"))
+
+# Number of submissions graded concurrently. The RabbitMQ prefetch count is
+# matched to it so the broker never hands this worker more than it can process.
+WORKER_CONCURRENCY = max(1, int(os.getenv("WORKER_CONCURRENCY", "1")))
+
+# Fair scheduling: prefetch more submissions than are graded at once and pick the next one
+# by priority, round-robin across courses (see `scheduling`)
+FAIR_SCHEDULING = env_flag("FAIR_SCHEDULING", False)
+SCHEDULER_PREFETCH = max(WORKER_CONCURRENCY, int(os.getenv("SCHEDULER_PREFETCH", str(WORKER_CONCURRENCY * 4))))
+
+# Identity of this replica in logs, dashboard reports and the RabbitMQ consumer tag
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# On SIGTERM, seconds to let in-flight submissions finish before closing the connection.
+# Keep it below the orchestrator's termination grace period.
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "90"))
+
+# Before reporting ready, load deferred modules and open the LLM, GitHub, Moodle and dashboard connections
+WARMUP = env_flag("WARMUP", True)
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "20"))
 
 # ---------------------------------------------------------
 # Logging Configuration
@@ -24,7 +127,7 @@ LOG_FILE = os.getenv("LOG_FILE", "autograder.log")
 
 logging.basicConfig(
     level=LOG_LEVEL,
-    format="%(asctime)s [%(levelname)s] %(message)s",
+    format=f"%(asctime)s [%(levelname)s] [{WORKER_ID}] [%(threadName)s] %(message)s",
     handlers=[
         logging.FileHandler(f"/tmp/{LOG_FILE}"),
         logging.StreamHandler(sys.stdout)
@@ -36,6 +139,500 @@ logger = logging.getLogger(__name__)
 # Only show WARNING and ERROR from Pika
 logging.getLogger("pika").setLevel(logging.WARNING)
 
+if MEMORY_PROFILING:
+    tracemalloc.start()
+
+# Shared by all worker threads. Every worker may walk a repository with several requests at once.
+get_session("github", pool_size=max(HTTP_POOL_SIZE, WORKER_CONCURRENCY * GITHUB_MAX_CONCURRENCY))
+repo_cache = RepositoryCache(REPO_CACHE_DIR, max_bytes=REPO_CACHE_MAX_MB * 1024 * 1024) if REPO_CACHE_DIR else None
+file_filter = FileFilter.from_settings(FILE_MAX_BYTES, FILE_EXCLUDE_PATTERNS)
+batch_grader = BatchGrader(BATCH_WINDOW_SECONDS, BATCH_MAX_SIZE) if BATCH_GRADING else None
+job_store = JobStateStore(JOB_STATE_DB, ttl_seconds=JOB_STATE_TTL) if JOB_STATE_DB else None
+regrade_store = RegradeStore(REGRADE_STATE_DB, ttl_seconds=REGRADE_STATE_TTL) if INCREMENTAL_REGRADE and REGRADE_STATE_DB else None
+status_reporter = BufferedStatusReporter(
+    STATUS_REPORT_JOURNAL or None, batch_size=STATUS_REPORT_BATCH_SIZE, flush_interval=STATUS_REPORT_FLUSH_SECONDS
+) if STATUS_REPORT_BUFFERED else None
+moodle_outbox = MoodleOutbox(
+    MOODLE_OUTBOX_DB, batch_size=MOODLE_BATCH_SIZE, flush_interval=MOODLE_OUTBOX_FLUSH_SECONDS,
+    max_attempts=MOODLE_OUTBOX_MAX_ATTEMPTS, on_abandoned=lambda submission, error: report_undelivered_grade(submission, error)
+) if MOODLE_OUTBOX else None
+assignment_cache = AssignmentCache(ASSIGNMENT_CACHE_MAX_ENTRIES)
+review_cache = create_review_cache(
+    REVIEW_CACHE_BACKEND, ttl_seconds=REVIEW_CACHE_TTL,
+    max_entries=REVIEW_CACHE_MAX_ENTRIES, path=REVIEW_CACHE_PATH
+)
+
+# ---------------------------------------------------------
+# Submission Processing
+# ---------------------------------------------------------
+
+# Define expected LLM response format
+OUTPUT_TEMPLATE = """{
+    "criteria_results": [ 
+        {
+            "criteria": "<criteriondescription>",
+            "criterionid": "<criterionid>",
+            "remark": "<remarks>",
+            "levelid": "<levelid>"
+        },
+        # // ... more criterions
+    ],
+    "feedback_comment": "<overall-feedback-comment>"
+}"""
+
+
+def create_repository(github_link: str) -> GitHubRepository:
+    """
+    Create a GitHubRepository configured from the environment.
+
+    Args:
+        github_link (str): The sanitized repository URL from the submission.
+
+    Returns:
+        GitHubRepository: The repository, sharing the process-wide cache and file filter.
+    """
+    return GitHubRepository(
+        github_link, GITHUB_TOKEN,
+        fetch_mode=GITHUB_FETCH_MODE, api_url=GITHUB_API_URL, cache=repo_cache,
+        file_filter=file_filter, max_workers=GITHUB_MAX_CONCURRENCY, max_total_bytes=REPO_MAX_BYTES or None
+    )
+
+
+def analyze(repo_files: list[dict], activity_instruction: str) -> dict | None:
+    """
+    Run the static analysis stage if it is enabled. Failures are logged, never raised.
+
+    Args:
+        repo_files (list[dict]): Files fetched from the student's repository.
+        activity_instruction (str): The sanitized activity instruction.
+
+    Returns:
+        dict | None: The result of `analyze_submission`, or None if disabled or failed.
+    """
+    if not STATIC_ANALYSIS:
+        return None
+    try:
+        with track_stage("static_analysis"):
+            analysis = analyze_submission(repo_files, activity_instruction, with_tests=STATIC_ANALYSIS_RUN_TESTS)
+    except Exception as e:
+        logger.warning("🔬 Static analysis failed; grading without it: %s", e)
+        return None
+
+    tests = analysis["tests"]
+    logger.info(
+        "🔬 Analyzed %d Python files; syntax errors: %d; missing names: %s; tests: %s",
+        len(analysis["files"]), sum(1 for outline in analysis["files"] if outline["syntax_error"]),
+        analysis["required"]["missing"] or "none",
+        f"{tests['passed']} passed, {tests['failed']} failed" if tests else "not run"
+    )
+    return analysis
+
+
+def load_assignment(submission_data: dict) -> AssignmentContext:
+    """
+    Return the static grading inputs of a submission's assignment, from the cache when its content is unchanged.
+
+    Args:
+        submission_data (dict): The parsed submission message.
+
+    Returns:
+        AssignmentContext: The sanitized instruction, rubric lookups and prompt prefix.
+
+    Raises:
+        KeyError: If the message has no rubric criteria.
+    """
+    criteria = submission_data['assignmentrubric']['criteria']
+    instruction = submission_data.get('assignmentactivity')
+    return assignment_cache.get(
+        submission_data.get('assignmentid'), AssignmentCache.content_hash(criteria, instruction),
+        lambda: AssignmentContext(criteria, sanitize(instruction), OUTPUT_TEMPLATE)
+    )
+
+
+def create_grader(repo_files: list[dict], assignment: AssignmentContext,
+                  previous_review: dict | None = None, changes: list[dict] | None = None,
+                  analysis: dict | None = None) -> LLMCodeGrader:
+    """
+    Build the LLM grader for a submission and log what went into its prompt.
+
+    Args:
+        repo_files (list[dict]): Files fetched from the student's repository
+            (only the changed ones for an incremental regrade).
+        assignment (AssignmentContext): The submission's assignment, from `load_assignment`.
+        previous_review (dict, optional): Review of the previously graded version, for an incremental regrade.
+        changes (list[dict], optional): Changed files from the compare API, for an incremental regrade.
+        analysis (dict, optional): Result of `analyze`, for a full grade.
+
+    Returns:
+        LLMCodeGrader: A grader with its prompt assembled.
+    """
+    with track_stage("prompt_build"):
+        code_grader = LLMCodeGrader(
+            files=repo_files, 
+            rubric=assignment.rubric,
+            activity_instruction=assignment.activity_instruction,
+            output_template=OUTPUT_TEMPLATE,
+            cache=review_cache,
+            token_budget=PROMPT_TOKEN_BUDGET,
+            file_filter=file_filter,
+            criteria=assignment.criteria,
+            previous_review=previous_review,
+            changes=changes,
+            analysis=analysis,
+            assignment=assignment
+        )
+    PROMPT_CHARS.observe(len(code_grader.prompt))
+    prompt_report = code_grader.prompt_report
+    logger.info(
+        "🧾 Prompt built with %d files (~%d tokens); truncated: %s; dropped: %s; outlined: %s",
+        len(prompt_report["included"]), prompt_report["tokens"],
+        prompt_report["truncated"] or "none",
+        [f"{d['path']} ({d['reason']})" for d in prompt_report["dropped"]] or "none",
+        prompt_report.get("outlined") or "none"
+    )
+    return code_grader
+
+
+def load_checkpoint(submission_data: dict) -> tuple[str | None, dict]:
+    """
+    Look up the stages already completed for a submission.
+
+    Args:
+        submission_data (dict): The parsed submission message.
+
+    Returns:
+        tuple[str | None, dict]: The job key (None if checkpointing is unavailable)
+            and the completed stages mapped to their recorded outputs.
+    """
+    job_key = JobStateStore.make_key(submission_data) if job_store else None
+    if job_key is None:
+        return None, {}
+    return job_key, job_store.completed_stages(job_key)
+
+
+def save_checkpoint(job_key: str | None, stage: str, output: dict | None = None) -> None:
+    """Record a completed stage. Failures are logged, never raised: checkpoints are an optimization."""
+    if job_key is None:
+        return
+    try:
+        job_store.record(job_key, stage, output)
+    except Exception as e:
+        logger.warning("Failed to record stage '%s' of job %s: %s", stage, job_key, e)
+
+
+def load_graded_state(submission_data: dict, github_link: str, context_hash: str) -> tuple[str | None, dict | None]:
+    """
+    Look up the last graded state of this student's work on the assignment.
+
+    Args:
+        submission_data (dict): The parsed submission message.
+        github_link (str): The sanitized repository URL of this submission.
+        context_hash (str): Fingerprint of the rubric and instruction this submission is graded against.
+
+    Returns:
+        tuple[str | None, dict | None]: The student key (None if incremental regrading
+            is unavailable) and the previous state, or None if it cannot be built on
+            because the repository, rubric or instruction changed.
+    """
+    student_key = RegradeStore.make_key(submission_data.get('assignmentid'), submission_data.get('userid')) if regrade_store else None
+    if student_key is None:
+        return None, None
+    try:
+        previous = regrade_store.get(student_key)
+    except Exception as e:
+        logger.warning("Failed to load graded state of %s: %s", student_key, e)
+        return student_key, None
+    if previous is None or previous.get("repo") != github_link or previous.get("context_hash") != context_hash:
+        return student_key, None
+    return student_key, previous
+
+
+def save_graded_state(student_key: str | None, state: dict) -> None:
+    """Record what was graded, as the base of the next incremental regrade. Failures are logged, never raised."""
+    if student_key is None or not state.get("commit_sha"):
+        return
+    try:
+        regrade_store.save(student_key, state)
+    except Exception as e:
+        logger.warning("Failed to save graded state of %s: %s", student_key, e)
+
+
+def fetch_submission_files(repo: GitHubRepository, previous: dict | None) -> dict:
+    """
+    Fetch what is needed to grade a submission, incrementally when possible.
+
+    With a previous graded state, GitHub's compare API lists the changes since
+    the graded commit and only the changed files are downloaded. The whole
+    repository is fetched when there is no usable previous state, when the
+    history was rewritten, or when the change exceeds the incremental threshold.
+
+    Args:
+        repo (GitHubRepository): The student's repository.
+        previous (dict | None): State from `load_graded_state`.
+
+    Returns:
+        dict: {"mode": REGRADE_*, "commit_sha": str | None, "files": files for the
+            prompt (all, or only the changed ones), "file_hashes": hashes of all
+            gradable files at the commit, "changes": compare API entries}
+    """
+    head_sha = repo.get_head_commit_sha() if regrade_store is not None else None
+    if previous is not None:
+        base_sha = previous["commit_sha"]
+        try:
+            status, changes = repo.compare_commits(base_sha, head_sha) if head_sha != base_sha else ("identical", [])
+        except Exception as e:
+            logger.warning("Failed to compare with the previously graded commit, regrading in full: %s", e)
+            status, changes = None, []
+
+        if status in ("ahead", "identical") and is_small_change(changes, INCREMENTAL_MAX_CHANGED_FILES, INCREMENTAL_MAX_CHANGED_LINES):
+            changed_files = repo.get_changed_files(changes, head_sha)
+            hashes = update_file_hashes(previous["files"], changes, changed_files)
+            mode = REGRADE_UNCHANGED if hashes == previous["files"] else REGRADE_INCREMENTAL
+            return {"mode": mode, "commit_sha": head_sha, "files": changed_files, "file_hashes": hashes,
+                    "changes": admitted_changes(changes, changed_files)}
+        logger.info("🔁 Change since the graded commit %s is too large or not linear (%s, %d files); regrading in full.",
+                    base_sha[:7], status, len(changes))
+
+    repo_files = repo.get_files(commit_sha=head_sha)
+    return {"mode": REGRADE_FULL, "commit_sha": repo.commit_sha, "files": repo_files,
+            "file_hashes": file_hashes(repo_files), "changes": []}
+
+
+def sanitize(html: str | None) -> str:
+    """
+    Strip potentially unsafe HTML from Moodle input.
+
+    bleach (and its html5lib parser) is imported on first use, or by `warm_up`.
+
+    Args:
+        html (str | None): Text from the submission message.
+
+    Returns:
+        str: The text with all tags removed.
+    """
+    import bleach  # Deferred to keep it off the startup path
+    return bleach.clean(html, strip=True)
+
+
+def warm_up(include_http: bool = True) -> dict[str, float]:
+    """
+    Prepare the first submission's dependencies before the worker reports ready.
+
+    Loads the sanitizer, checks the LLM backends (which imports their SDKs and
+    opens their channels), and opens pooled connections to GitHub, Moodle and
+    the dashboard. Steps run concurrently and are best effort: one that fails or
+    outlasts `WARMUP_TIMEOUT` is logged, and its cost moves to the first submission.
+
+    Args:
+        include_http (bool, optional): Also warm the shared requests sessions.
+            The asyncio worker passes False and warms its own clients.
+
+    Returns:
+        dict[str, float]: Seconds taken by each step that completed.
+    """
+    steps = {
+        "sanitizer": lambda: sanitize(""),
+        "llm": lambda: get_default_backend().warm_up(),
+    }
+    if include_http:
+        steps["github"] = lambda: get_session("github").head(GITHUB_API_URL, timeout=WARMUP_TIMEOUT)
+        if MOODLE_API_URL:
+            steps["moodle"] = lambda: get_session("moodle").head(
+                MOODLE_API_URL, timeout=WARMUP_TIMEOUT, verify=ENV != 'development'
+            )
+        if SUPABASE_API_URL:
+            steps["supabase"] = lambda: get_session("supabase").head(SUPABASE_API_URL, timeout=WARMUP_TIMEOUT)
+
+    def timed(step):
+        started = time.perf_counter()
+        step()
+        return time.perf_counter() - started
+
+    durations = {}
+    pool = ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="warm-up")
+    futures = {pool.submit(timed, step): name for name, step in steps.items()}
+    done, not_done = wait(futures, timeout=WARMUP_TIMEOUT)
+    pool.shutdown(wait=False)
+    for future in done:
+        try:
+            durations[futures[future]] = future.result()
+        except Exception as e:
+            logger.warning("🔥 Warm-up of %s failed: %s", futures[future], e)
+    for future in not_done:
+        logger.warning("🔥 Warm-up of %s did not finish within %.0fs.", futures[future], WARMUP_TIMEOUT)
+    return durations
+
+
+def send_status_report(submission_data: dict, status: str, details: str) -> None:
+    """
+    Report a submission's autograde status to the Autograder Dashboard.
+
+    With buffering enabled the report is only validated and queued for the
+    background bulk insert; otherwise it is POSTed right away. The details
+    name the worker that processed the submission.
+
+    Raises:
+        ValueError, TypeError: If the submission data is incomplete.
+        requests.HTTPError: If an unbuffered report is rejected.
+    """
+    details = f"{details} [worker: {WORKER_ID}]"
+    with track_stage("status_report"):
+        if status_reporter is not None:
+            status_reporter.report(submission_data, status, details)
+        else:
+            StatusReportService.send_report(submission_data, status, details)
+
+
+def save_grade(submission_data: dict, review_result: dict) -> None:
+    """
+    Save a grade in Moodle, or queue it in the outbox when `MOODLE_OUTBOX` is enabled.
+
+    A queued grade counts as saved: the outbox keeps retrying it across
+    restarts and reports it with `report_undelivered_grade` if it gives up.
+
+    Raises:
+        ValueError: If the grade results are invalid or Moodle API credentials are missing.
+        requests.HTTPError: If a direct POST to Moodle fails.
+    """
+    assignmentid, userid = submission_data.get('assignmentid'), submission_data.get('userid')
+    if moodle_outbox is not None:
+        moodle_outbox.enqueue(assignmentid, userid, review_result, context=submission_data)
+    else:
+        MoodleService.save_grade(assignmentid, userid, review_result)
+
+
+def report_undelivered_grade(submission_data: dict | None, error: Exception) -> None:
+    """Report a grade the Moodle outbox gave up on, so it can be entered manually."""
+    if submission_data is None:
+        return
+    send_status_report(submission_data, "fail", f"Grade could not be saved in Moodle. {error}")
+    SUBMISSIONS.labels("undelivered").inc()
+
+
+def process_submission(body: bytes) -> bool:
+    """
+    Grade a single submission and report its status.
+
+    This runs the whole grading pipeline (GitHub fetch, LLM review, Moodle update)
+    and is safe to call from a worker thread: it never touches the RabbitMQ channel.
+
+    Completed stages are checkpointed in the job state store. A redelivered
+    message resumes at the first incomplete stage: a stored review skips the
+    GitHub fetch and LLM call, and a grade already saved is not posted again.
+
+    With `INCREMENTAL_REGRADE`, a resubmission with small changes is graded
+    from the previous review and the diff (see `fetch_submission_files`).
+
+    Args:
+        body (bytes): The JSON-encoded submission data.
+
+    Returns:
+        bool: True if the message should be acknowledged, False if it should be requeued.
+    """
+    submission_data = None
+    try:
+        # Parse message from JSON
+        with track_stage("json_parse"):
+            submission_data = json.loads(body)
+
+        # Clean potentially unsafe HTML input from Moodle; the assignment's is only sanitized when it changes
+        with track_stage("sanitize"):
+            github_link = sanitize(submission_data.get('onlinetext'))
+            assignment = load_assignment(submission_data)
+        activity_instruction = assignment.activity_instruction
+
+        job_key, completed = load_checkpoint(submission_data)
+        if STAGE_REPORTED in completed:
+            logger.info("⏩ Submission %s was already graded and reported; acknowledging duplicate.", job_key)
+            STAGES_SKIPPED.labels("all").inc()
+            return True
+
+        review_result = completed.get(STAGE_REVIEW)
+        if review_result is not None:
+            logger.info("⏩ Resuming submission %s with its stored review; skipping GitHub fetch and AI review.", job_key)
+            STAGES_SKIPPED.labels("github_fetch").inc()
+            STAGES_SKIPPED.labels("llm").inc()
+        else:
+            context_hash = assignment.context_hash
+            student_key, previous = load_graded_state(submission_data, github_link, context_hash)
+
+            logger.info("🔍 Fetching repository files from url: %s", github_link)
+            repo = create_repository(github_link)
+            with track_stage("github_fetch"):
+                fetched = fetch_submission_files(repo, previous)
+            repo_files = fetched["files"]
+            record_repo_files(repo_files)
+            if repo.skipped_files:
+                logger.info("🗂️ Skipped %d files before download.", len(repo.skipped_files))
+            save_checkpoint(job_key, STAGE_FILES, {
+                "file_hash": fingerprint(fetched["file_hashes"]), "file_count": len(fetched["file_hashes"]),
+                "commit_sha": fetched["commit_sha"]
+            })
+
+            if fetched["mode"] == REGRADE_UNCHANGED:
+                logger.info("⏩ No gradable changes since the graded commit %s; reusing its review.", previous["commit_sha"][:7])
+                review_result = previous["review"]
+                valid = True
+            else:
+                if fetched["mode"] == REGRADE_INCREMENTAL:
+                    logger.info("🤖 Running incremental AI code review of %d changed files...", len(fetched["changes"]))
+                    code_grader = create_grader(repo_files, assignment,
+                                                previous_review=previous["review"], changes=fetched["changes"])
+                else:
+                    analysis = analyze(repo_files, activity_instruction)
+                    logger.info("🤖 Running AI code review...")
+                    code_grader = create_grader(repo_files, assignment, analysis=analysis)
+                if batch_grader is not None:
+                    review_result = batch_grader.grade(code_grader)
+                else:
+                    review_result = code_grader.get_structured_review()
+                valid = not code_grader.validate_review(review_result)
+
+            if valid:
+                REGRADES.labels(fetched["mode"]).inc()
+                save_checkpoint(job_key, STAGE_REVIEW, review_result)
+                save_graded_state(student_key, {
+                    "repo": github_link, "commit_sha": fetched["commit_sha"], "files": fetched["file_hashes"],
+                    "review": review_result, "context_hash": context_hash
+                })
+
+        review_hash = fingerprint(review_result)
+        if completed.get(STAGE_GRADE_SAVED, {}).get("review_hash") == review_hash:
+            logger.info("⏩ Grade for submission %s is already saved in Moodle; not posting it again.", job_key)
+            STAGES_SKIPPED.labels("moodle_post").inc()
+        else:
+            logger.info("🎓 Sending grading results to Moodle...")
+            with track_stage("moodle_post"):
+                save_grade(submission_data, review_result)
+            save_checkpoint(job_key, STAGE_GRADE_SAVED, {"review_hash": review_hash})
+        logger.info("✅ Submission processed successfully.")
+        SUBMISSIONS.labels("graded").inc()
+
+        try:
+            send_status_report(submission_data, "success", "Autograde completed successfully.")
+            save_checkpoint(job_key, STAGE_REPORTED, {"status": "success"})
+            logger.info("📝 Sent status report to Autograder Dashboard.")
+        except Exception as sub_e:
+            logger.warning("📝 Failed to send status report to Autograder Dashboard: %s", sub_e)
+
+        return True
+
+    except Exception as e:
+        logger.exception("❌ Error processing submission: %s", e)
+
+        # Send autograding report to Autograder Dashboard 
+        try:
+            send_status_report(submission_data, "fail", f"Error autograding submission. {e}")
+            logger.info("📝 Sent failure status report for manual intervention.")
+            SUBMISSIONS.labels("failed").inc()
+            return True
+        except Exception as sub_e:
+            logger.error("📝 Failed to send failure status report: %s", sub_e)
+            logger.info("🔄 Requeuing task...")
+            SUBMISSIONS.labels("requeued").inc()
+            return False
+
+
 # ---------------------------------------------------------
 # Main Application Logic
 # ---------------------------------------------------------
@@ -43,13 +640,44 @@ def main() -> None:
     """
     Connects to RabbitMQ and continuously listens for new assignment submissions.
 
+    Up to `WORKER_CONCURRENCY` submissions are processed at a time on a pool of
+    worker threads, so slow GitHub, Gemini and Moodle calls overlap instead of
+    running back to back. The connection thread only dispatches messages and
+    settles them; acks and nacks are marshalled back onto it because pika
+    channels are not thread-safe.
+
+    Submissions that fail to settle are retried with exponential backoff via
+    TTL'd retry queues and end up in a dead-letter queue after
+    `RETRY_MAX_ATTEMPTS` attempts (see `retry_topology`).
+
+    On SIGTERM the worker drains: it stops consuming, lets in-flight
+    submissions finish and settles them (for up to `DRAIN_TIMEOUT` seconds),
+    then closes the connection. Anything still unfinished is redelivered to
+    another replica and resumes from its checkpoints.
+
+    Startup opens the metrics endpoint first (alive, not yet ready), connects
+    to RabbitMQ, runs `warm_up` and only then starts consuming and reports
+    ready, so the first submission does not pay for cold connections.
+
+    With `FAIR_SCHEDULING`, up to `SCHEDULER_PREFETCH` messages are held and
+    each free worker thread takes the next one from a `FairScheduler`
+    (highest priority first, round-robin across courses). Messages not yet
+    started are requeued when draining.
+
     When a message is received, it processes the submission by:
     - Cleaning and parsing the submission data.
     - Fetching the student’s GitHub repository.
     - Running an LLM-based code review using the provided rubric.
     - Sending structured grading feedback back to Moodle.
     """
+    started = time.perf_counter()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)  # /healthz answers while starting; /readyz waits for consuming
+        logger.info("📈 Serving metrics on port %d at /metrics", METRICS_PORT)
+
     try:
+        import pika  # Deferred: only the threaded worker needs it
+
         # Connect to RabbitMQ
         connection = pika.BlockingConnection(pika.ConnectionParameters(
             host=MQ_HOST,
@@ -59,11 +687,90 @@ def main() -> None:
         channel = connection.channel()
 
         # Ensure the target queue exists
-        channel.queue_declare(queue=QUEUE, durable=True)
+        channel.queue_declare(queue=QUEUE, durable=True, arguments=queue_arguments())
+        if RETRY_MAX_ATTEMPTS > 0:
+            declare_retry_topology(channel, QUEUE)
+            channel.confirm_delivery()  # Only ack a failed message once its retry copy is safely queued
+
+        # Never hold more unacknowledged messages than we can work on (or schedule among)
+        channel.basic_qos(prefetch_count=SCHEDULER_PREFETCH if FAIR_SCHEDULING else WORKER_CONCURRENCY)
         logger.info(f"✅ Connected to RabbitMQ at %s, listening on queue: %s", MQ_HOST, QUEUE)
     except Exception as e:
         logger.exception(f"Failed to connect to RabbitMQ: {e}")
         sys.exit(1)
+    STARTUP_SECONDS.labels("connect").set(time.perf_counter() - started)
+
+    if WARMUP:
+        warm_up_started = time.perf_counter()
+        durations = warm_up()
+        STARTUP_SECONDS.labels("warm_up").set(time.perf_counter() - warm_up_started)
+        logger.info("🔥 Warm-up done: %s",
+                    ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(durations.items())) or "nothing")
+
+    executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix="grader")
+    worker_status.configure(WORKER_ID, WORKER_CONCURRENCY, liveness_timeout=max(60.0, 4 * QUEUE_DEPTH_INTERVAL))
+    unsettled = set()  # Delivery tags handed to the executor and not yet acked/nacked; connection thread only
+    scheduler = FairScheduler() if FAIR_SCHEDULING else None
+    if status_reporter is not None:
+        status_reporter.start()  # Replays reports left unsent by a previous run
+    if moodle_outbox is not None:
+        moodle_outbox.start()  # Resumes grades left undelivered by a previous run
+
+    def retry_later(delivery_tag: int, properties, body: bytes):
+        """Move a failed message to its delayed retry queue, or the dead-letter queue. Runs on the connection thread."""
+        destination, headers = failure_destination(QUEUE, properties.headers)
+        try:
+            channel.basic_publish(
+                exchange="", routing_key=destination, body=body, mandatory=True,
+                properties=pika.BasicProperties(
+                    content_type=properties.content_type, delivery_mode=2, headers=headers,
+                    priority=properties.priority
+                )
+            )
+        except Exception as e:
+            logger.error("Failed to schedule retry of delivery %s, requeuing it: %s", delivery_tag, e)
+            channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+            return
+        channel.basic_ack(delivery_tag=delivery_tag)
+
+        if destination == dead_letter_queue_name(QUEUE):
+            logger.error("☠️ Submission failed %d times; moved to dead-letter queue %s.", RETRY_MAX_ATTEMPTS, destination)
+            SUBMISSIONS.labels("dead_lettered").inc()
+        else:
+            logger.info("⏳ Submission will be retried via %s (attempt %d of %d).",
+                        destination, headers[ATTEMPT_HEADER] + 1, RETRY_MAX_ATTEMPTS)
+
+    def settle(delivery_tag: int, success: bool, properties, body: bytes):
+        """Acknowledge or retry a message. Must run on the connection thread."""
+        unsettled.discard(delivery_tag)
+        if not channel.is_open:
+            logger.warning("Channel closed before delivery %s could be settled; it will be redelivered.", delivery_tag)
+            return
+        if success:
+            channel.basic_ack(delivery_tag=delivery_tag)
+        elif RETRY_MAX_ATTEMPTS > 0:
+            retry_later(delivery_tag, properties, body)
+        else:
+            channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+
+    def work(delivery_tag: int, properties, body: bytes):
+        """Process a submission on a worker thread and hand the outcome back to the connection thread."""
+        worker_status.start_work()
+        try:
+            with track_peak_memory():
+                success = process_submission(body)
+        except Exception as e:
+            logger.exception("❌ Unexpected error in grading worker: %s", e)
+            success = False
+        finally:
+            worker_status.finish_work()
+        connection.add_callback_threadsafe(functools.partial(settle, delivery_tag, success, properties, body))
+
+    def work_next():
+        """Take the next submission from the fair scheduler; one call is queued per delivery."""
+        item = scheduler.get()
+        if item is not None:  # None if it was requeued by a drain
+            work(*item)
 
     def callback(channel, method, properties, body):
         """
@@ -75,80 +782,72 @@ def main() -> None:
             properties: Message properties.
             body (bytes): The JSON-encoded submission data.
         """
-
         logger.info("📦 New submission received...")
-        try:
-            # Parse message from JSON
-            submission_data = json.loads(body)
+        unsettled.add(method.delivery_tag)
+        if scheduler is not None:
+            course, priority = scheduling_key(body, properties.priority)
+            scheduler.put(course, (method.delivery_tag, properties, body), priority)
+            executor.submit(work_next)
+        else:
+            executor.submit(work, method.delivery_tag, properties, body)
 
-            # Extract relevant fields
-            assignmentid = submission_data.get('assignmentid')
-            userid = submission_data.get('userid')
-            assignment_rubric = submission_data['assignmentrubric']['criteria']
-
-            # Clean potentially unsafe HTML input from Moodle
-            github_link = bleach.clean(submission_data.get('onlinetext'), strip=True)
-            activity_instruction = bleach.clean(submission_data.get('assignmentactivity'), strip=True)
-
-            # Define expected LLM response format
-            output_template = """{
-                "criteria_results": [ 
-                    {
-                        "criteria": "<criteriondescription>",
-                        "criterionid": "<criterionid>",
-                        "remark": "<remarks>",
-                        "levelid": "<levelid>"
-                    },
-                    # // ... more criterions
-                ],
-                "feedback_comment": "<overall-feedback-comment>"
-            }"""
-
-            logger.info("🔍 Fetching repository files from url: %s", github_link)
-            repo = GitHubRepository(github_link, GITHUB_TOKEN)
-            repo_files = repo.get_files()
-
-            logger.info("🤖 Running AI code review...")
-            code_grader = LLMCodeGrader(
-                files=repo_files, 
-                rubric=json.dumps(assignment_rubric), 
-                activity_instruction=activity_instruction, 
-                output_template=output_template
-            )
-            review_result = code_grader.get_structured_review()
-
-            logger.info("🎓 Sending grading results to Moodle...")
-            MoodleService.save_grade(assignmentid, userid, review_result)
-
-            # Acknowledge message as processed successfully
-            channel.basic_ack(delivery_tag = method.delivery_tag)
-            logger.info("✅ Submission processed successfully.")
+    def sample_queue_depth():
+        """Record the number of ready messages with a passive declare, then reschedule itself."""
+        worker_status.heartbeat()  # Only runs while the connection thread is processing events
+        try:
+            declared = channel.queue_declare(queue=QUEUE, passive=True)
+            worker_status.set_queue_depth(declared.method.message_count)
+        except Exception as e:
+            logger.warning("Failed to sample queue depth: %s", e)
+        if channel.is_open:
+            connection.call_later(QUEUE_DEPTH_INTERVAL, sample_queue_depth)
 
-            try:
-                StatusReportService.send_report(submission_data, "success", "Autograde completed successfully.")
-                logger.info("📝 Sent status report to Autograder Dashboard.")
-            except Exception as sub_e:
-                logger.warning("📝 Failed to send status report to Autograder Dashboard: %s", sub_e)
+    def drain():
+        """Stop receiving new submissions; `start_consuming` returns once the consumer is cancelled."""
+        if worker_status.draining:
+            return
+        logger.info("🚰 SIGTERM received: draining %d in-flight submissions (timeout %.0fs)...",
+                    len(unsettled), DRAIN_TIMEOUT)
+        worker_status.start_draining()
+        channel.stop_consuming()
+        if scheduler is not None:
+            # Hand submissions that have not started back to the broker for other replicas
+            for delivery_tag, _, _ in scheduler.drain():
+                unsettled.discard(delivery_tag)
+                channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
 
+    # The handler runs between bytecodes on this thread; defer the channel work to the connection's own loop
+    signal.signal(signal.SIGTERM, lambda signum, frame: connection.add_callback_threadsafe(drain))
 
-        except Exception as e:
-            logger.exception("❌ Error processing submission: %s", e)
-
-            # Send autograding report to Autograder Dashboard 
-            try:
-                StatusReportService.send_report(submission_data, "fail", f"Error autograding submission. {e}")
-                channel.basic_ack(delivery_tag = method.delivery_tag)
-                logger.info("📝 Sent failure status report for manual intervention.")
-            except Exception as sub_e:
-                logger.error("📝 Failed to send failure status report: %s", sub_e)
-                logger.info("🔄 Requeuing task...")
-                channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+    if METRICS_PORT:
+        sample_queue_depth()
 
     # Start consuming messages 
-    logger.info("📡 Waiting for new submissions. Press CTRL+C to stop.")
-    channel.basic_consume(queue=QUEUE, on_message_callback=callback)
+    logger.info("📡 Waiting for new submissions (concurrency: %d). Press CTRL+C to stop.", WORKER_CONCURRENCY)
+    channel.basic_consume(queue=QUEUE, on_message_callback=callback, consumer_tag=f"autograder-{WORKER_ID}")
+    worker_status.set_connected(True)
+    STARTUP_SECONDS.labels("total").set(time.perf_counter() - started)
+    logger.info("🚀 Ready in %.2fs.", time.perf_counter() - started)
+
+    try:
+        channel.start_consuming()
 
-    channel.start_consuming()
+        # Draining: keep processing connection events so finished submissions get settled
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while unsettled and time.monotonic() < deadline and connection.is_open:
+            connection.process_data_events(time_limit=1)
+        if unsettled:
+            logger.warning("🚰 Drain timed out; %d submissions will be redelivered.", len(unsettled))
+        else:
+            logger.info("🚰 Drain complete; all in-flight submissions settled.")
+        connection.close()
+    finally:
+        worker_status.set_connected(False)
+        executor.shutdown(wait=False, cancel_futures=True)
+        if moodle_outbox is not None:
+            moodle_outbox.close()  # Before the status reporter, which may still get failure reports
+        if status_reporter is not None:
+            status_reporter.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,331 @@
+import json, time, threading, tracemalloc
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# ---------------------------------------------------------
+# Metric Definitions
+# ---------------------------------------------------------
+
+# Buckets span fast local steps (ms) up to slow LLM calls (minutes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000, 20_000_000)
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+STAGE_LATENCY = Histogram(
+    "autograder_stage_duration_seconds", "Time spent in each submission processing stage.",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter(
+    "autograder_stage_errors_total", "Stages that raised an exception.", ["stage"]
+)
+SUBMISSIONS = Counter(
+    "autograder_submissions_total", "Processed submissions by outcome (graded, failed, requeued, dead_lettered, undelivered).", ["outcome"]
+)
+REPO_FILES = Histogram(
+    "autograder_repo_files", "Files fetched per repository.", buckets=COUNT_BUCKETS
+)
+REPO_BYTES = Histogram(
+    "autograder_repo_bytes", "Bytes of file content fetched per repository.", buckets=SIZE_BUCKETS
+)
+PROMPT_CHARS = Histogram(
+    "autograder_prompt_chars", "Characters in the final LLM prompt.", buckets=SIZE_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "autograder_llm_tokens_total", "Tokens reported by the LLM provider.", ["kind"]
+)
+STAGES_SKIPPED = Counter(
+    "autograder_stages_skipped_total", "Stages skipped on redelivery because a checkpoint had completed them.",
+    ["stage"]
+)
+LLM_REQUESTS = Counter(
+    "autograder_llm_requests_total", "LLM backend calls by backend and outcome (success, error, rate_limited, timeout, tripped).",
+    ["backend", "outcome"]
+)
+LLM_EARLY_STOPS = Counter(
+    "autograder_llm_stream_early_stops_total", "Streamed LLM responses cut off once their JSON object was complete.",
+    ["backend"]
+)
+LLM_RETRIES = Counter(
+    "autograder_llm_retries_total", "LLM calls repeated for a submission, by reason (api_error, invalid_response).",
+    ["reason"]
+)
+REGRADES = Counter(
+    "autograder_regrades_total", "Graded submissions by regrade mode (full, incremental, unchanged).", ["mode"]
+)
+SCHEDULER_WAIT = Histogram(
+    "autograder_scheduler_wait_seconds", "Time prefetched submissions waited for a free worker slot, by priority.",
+    ["priority"], buckets=LATENCY_BUCKETS
+)
+SCHEDULER_PENDING = Gauge(
+    "autograder_scheduler_pending", "Prefetched submissions waiting for a free worker slot."
+)
+STATUS_REPORTS_PENDING = Gauge(
+    "autograder_status_reports_pending", "Dashboard status reports queued for the next bulk insert."
+)
+STATUS_REPORTS_DROPPED = Counter(
+    "autograder_status_reports_dropped_total",
+    "Dashboard status reports given up, by reason (rejected by Supabase, overflow of the buffer).", ["reason"]
+)
+ASSIGNMENT_CACHE_LOOKUPS = Counter(
+    "autograder_assignment_cache_lookups_total",
+    "Assignment context lookups by result (hit, miss, stale: rebuilt after the assignment changed).", ["result"]
+)
+MOODLE_OUTBOX_PENDING = Gauge(
+    "autograder_moodle_outbox_pending", "Grades waiting in the Moodle outbox, including those backing off."
+)
+MOODLE_GRADE_DELIVERIES = Counter(
+    "autograder_moodle_grade_deliveries_total",
+    "Grades sent from the Moodle outbox by request mode (batch, single) and outcome (sent, error, abandoned).",
+    ["mode", "outcome"]
+)
+IN_FLIGHT = Gauge(
+    "autograder_in_flight_submissions", "Submissions currently being processed by this worker."
+)
+QUEUE_DEPTH = Gauge(
+    "autograder_queue_depth", "Messages ready in the grading queue, as last seen by this worker."
+)
+WORKER_CAPACITY = Gauge(
+    "autograder_worker_capacity", "Submissions this worker can process at once."
+)
+WORKER_DRAINING = Gauge(
+    "autograder_worker_draining", "1 while the worker finishes in-flight work before shutting down."
+)
+SUBMISSION_PEAK_MEMORY = Histogram(
+    "autograder_submission_peak_memory_bytes",
+    "Peak Python heap growth while processing a submission (only with MEMORY_PROFILING).",
+    buckets=MEMORY_BUCKETS
+)
+STARTUP_SECONDS = Gauge(
+    "autograder_startup_seconds", "Time spent in each startup phase (connect, warm_up, total).", ["phase"]
+)
+
+
+# Callables invoked as listener(stage, seconds) after every tracked stage (e.g. by benchmarks)
+_stage_listeners = []
+
+
+def add_stage_listener(listener) -> None:
+    """
+    Register a callback that receives every stage timing as `listener(stage, seconds)`.
+
+    Prometheus histograms only keep bucket counts; listeners get the raw samples,
+    which the benchmark harness uses to compute exact percentiles.
+
+    Args:
+        listener (callable): Function taking the stage name and duration in seconds.
+    """
+    _stage_listeners.append(listener)
+
+
+@contextmanager
+def track_stage(stage: str):
+    """
+    Time a block of code as a named pipeline stage.
+
+    The duration is always recorded; exceptions are counted and re-raised.
+
+    Args:
+        stage (str): Stage name, e.g. "github_fetch" or "llm_call".
+
+    Example:
+        with track_stage("moodle_post"):
+            MoodleService.save_grade(assignmentid, userid, review_result)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage).observe(elapsed)
+        for listener in _stage_listeners:
+            listener(stage, elapsed)
+
+
+# Submissions inside track_peak_memory; the traced peak is only reset when none are
+_memory_lock = threading.Lock()
+_memory_tracked = 0
+
+
+@contextmanager
+def track_peak_memory():
+    """
+    Record how far the Python heap grew above its starting size while a block ran.
+
+    Only measures while `tracemalloc` is tracing (see MEMORY_PROFILING); a no-op
+    otherwise. The peak is exact when blocks do not overlap. Concurrent
+    submissions share the process-wide peak, so each then records an upper bound.
+
+    Example:
+        with track_peak_memory():
+            process_submission(body)
+    """
+    global _memory_tracked
+    if not tracemalloc.is_tracing():
+        yield
+        return
+
+    with _memory_lock:
+        if _memory_tracked == 0:
+            tracemalloc.reset_peak()
+        _memory_tracked += 1
+        baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        yield
+    finally:
+        with _memory_lock:
+            _memory_tracked -= 1
+            peak = tracemalloc.get_traced_memory()[1]
+        SUBMISSION_PEAK_MEMORY.observe(max(0, peak - baseline))
+
+
+def record_repo_files(files: list[dict]) -> None:
+    """Record the number and total size of files fetched for a submission."""
+    REPO_FILES.observe(len(files))
+    REPO_BYTES.observe(sum(len(file.get("content") or "") for file in files))
+
+
+def record_llm_usage(response) -> None:
+    """
+    Record token usage from an LLM response, if the provider reported it.
+
+    Args:
+        response: A `grader_backends.LLMResponse`.
+    """
+    for kind, count in (("prompt", response.prompt_tokens), ("output", response.output_tokens)):
+        if count:
+            LLM_TOKENS.labels(kind).inc(count)
+
+
+# ---------------------------------------------------------
+# Worker Status (health and load)
+# ---------------------------------------------------------
+class WorkerStatus:
+    """
+    Liveness, readiness and load of this worker process, for orchestrators
+    and autoscalers. Shared by the consumer loop and the HTTP endpoint.
+    """
+
+    def __init__(self):
+        self.worker_id = None
+        self.capacity = 1
+        self.in_flight = 0
+        self.queue_depth = None
+        self.connected = False
+        self.draining = False
+        self.liveness_timeout = 120.0  # Seconds without a heartbeat before the worker counts as stuck
+        self._last_heartbeat = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, worker_id: str, capacity: int, liveness_timeout: float | None = None) -> None:
+        """Set the worker's identity and how many submissions it processes at once."""
+        self.worker_id = worker_id
+        self.capacity = capacity
+        if liveness_timeout is not None:
+            self.liveness_timeout = liveness_timeout
+        WORKER_CAPACITY.set(capacity)
+
+    def start_work(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+        IN_FLIGHT.inc()
+
+    def finish_work(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        IN_FLIGHT.dec()
+
+    def set_queue_depth(self, depth: int) -> None:
+        self.queue_depth = depth
+        QUEUE_DEPTH.set(depth)
+
+    def set_connected(self, connected: bool) -> None:
+        self.connected = connected
+
+    def start_draining(self) -> None:
+        self.draining = True
+        WORKER_DRAINING.set(1)
+
+    def heartbeat(self) -> None:
+        """Called periodically by the consumer loop to show it is not stuck."""
+        self._last_heartbeat = time.monotonic()
+
+    def is_alive(self) -> bool:
+        return time.monotonic() - self._last_heartbeat < self.liveness_timeout
+
+    def is_ready(self) -> bool:
+        """Ready to receive work: consuming and not shutting down."""
+        return self.connected and not self.draining
+
+    def load(self) -> dict:
+        """Load signal for autoscaling."""
+        return {
+            "worker_id": self.worker_id,
+            "in_flight": self.in_flight,
+            "capacity": self.capacity,
+            "utilization": round(self.in_flight / self.capacity, 3) if self.capacity else None,
+            "queue_depth": self.queue_depth,
+            "ready": self.is_ready(),
+            "draining": self.draining,
+        }
+
+
+worker_status = WorkerStatus()
+
+
+# ---------------------------------------------------------
+# Metrics HTTP Endpoint
+# ---------------------------------------------------------
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the Prometheus text exposition format on GET /metrics, and:
+    - /healthz: liveness, 200 unless the consumer loop has stopped sending heartbeats.
+    - /readyz: readiness, 200 while connected to RabbitMQ and not draining.
+    - /load: JSON load signal (in-flight, capacity, utilization, queue depth).
+    """
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._send(200, generate_latest(), CONTENT_TYPE_LATEST)
+        elif path == "/healthz":
+            alive = worker_status.is_alive()
+            self._send(200 if alive else 503, b"ok" if alive else b"stuck", "text/plain")
+        elif path == "/readyz":
+            ready = worker_status.is_ready()
+            self._send(200 if ready else 503, b"ready" if ready else b"not ready", "text/plain")
+        elif path == "/load":
+            self._send(200, json.dumps(worker_status.load()).encode(), "application/json")
+        else:
+            self.send_error(404)
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes would otherwise flood the worker log
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve metrics on a background daemon thread.
+
+    Args:
+        port (int): Port to listen on.
+        host (str, optional): Interface to bind.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
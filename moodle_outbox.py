@@ -0,0 +1,238 @@
+import json, time, logging, sqlite3, threading
+from moodle_service import MoodleService, MoodleError
+from metrics import track_stage, MOODLE_OUTBOX_PENDING, MOODLE_GRADE_DELIVERIES
+
+logger = logging.getLogger(__name__)
+
+
+class MoodleOutbox:
+    """
+    Delivers grades to Moodle from a background thread.
+
+    Grades are validated and written to a local SQLite outbox, so grading
+    continues at its own pace however slow Moodle is. A background flusher
+    sends them every `flush_interval` seconds, or as soon as `batch_size`
+    grades are waiting. Grades of the same assignment go in one
+    `mod_assign_save_grades` request. If Moodle rejects such a batch (an
+    exception in the response), its grades are sent one by one with
+    `mod_assign_save_grade` to isolate the cause; if all of those succeed, the
+    assignment is taken to reject batches and gets single requests from then
+    on. A batch that fails otherwise (timeout, 5xx) is retried as a batch.
+
+    A grade that fails is retried with exponential backoff. After
+    `max_attempts` failures it is removed and handed to `on_abandoned`. A
+    newer grade for the same student replaces one still waiting. The outbox
+    survives restarts: use one database file per worker process.
+    """
+
+    def __init__(self, path: str, batch_size: int = 20, flush_interval: float = 2.0, max_attempts: int = 8,
+                 max_retry_delay: float = 300.0, on_abandoned=None):
+        """
+        Args:
+            path (str): Path of the SQLite database file. Created if missing.
+            batch_size (int, optional): Waiting grades that trigger a flush, and the maximum per request.
+            flush_interval (float, optional): Maximum seconds a grade waits before being sent.
+            max_attempts (int, optional): Failed deliveries after which a grade is given up.
+            max_retry_delay (float, optional): Upper bound in seconds of the backoff between attempts.
+            on_abandoned (callable, optional): Called as `on_abandoned(context, error)` for each grade
+                given up, with the context passed to `enqueue`.
+        """
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_attempts = max(1, max_attempts)
+        self.max_retry_delay = max_retry_delay
+        self.on_abandoned = on_abandoned
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closing = False
+        self._single_only = set()  # Assignments whose batch requests Moodle rejected while single ones succeeded
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS moodle_outbox ("
+                "assignmentid TEXT NOT NULL, userid TEXT NOT NULL, grade_results TEXT NOT NULL, context TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, last_error TEXT, "
+                "created_at REAL NOT NULL, PRIMARY KEY (assignmentid, userid))"
+            )
+        MOODLE_OUTBOX_PENDING.set(self.pending())
+
+    def start(self) -> None:
+        """Start the background flusher. Called automatically by the first `enqueue`."""
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="moodle-outbox", daemon=True)
+                self._thread.start()
+                pending = self.pending()
+                if pending:
+                    logger.info("🎓 Resuming delivery of %d grades left in %s.", pending, self.path)
+
+    def enqueue(self, assignmentid, userid, grade_results: dict, context: dict | None = None) -> None:
+        """
+        Queue a grade for delivery, replacing any grade of the same student still waiting.
+
+        Args:
+            assignmentid: The Moodle assignment ID.
+            userid: The Moodle user ID of the student being graded.
+            grade_results (dict): Grading results, as described in `MoodleService.save_grade`.
+            context (dict, optional): JSON-serializable data passed to `on_abandoned`, e.g. the submission.
+
+        Raises:
+            ValueError: If grade_results is not a dict or the Moodle API credentials are missing.
+        """
+        MoodleService.build_grade_params(assignmentid, userid, grade_results)  # Validate before accepting it
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO moodle_outbox "
+                "(assignmentid, userid, grade_results, context, attempts, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (str(assignmentid), str(userid), json.dumps(grade_results),
+                 json.dumps(context) if context is not None else None, now, now)
+            )
+        pending = self.pending()
+        MOODLE_OUTBOX_PENDING.set(pending)
+        self.start()
+        if pending >= self.batch_size:
+            with self._condition:
+                self._condition.notify()
+
+    def pending(self) -> int:
+        """Return the number of grades waiting for delivery."""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM moodle_outbox").fetchone()[0]
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Send what is waiting and stop the background thread.
+
+        Grades that still cannot be delivered stay in the outbox for the next start.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the final flush.
+        """
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def flush(self, include_delayed: bool = False) -> int:
+        """
+        Send the grades that are due, batched per assignment.
+
+        Args:
+            include_delayed (bool, optional): Also send grades still waiting out their retry backoff.
+
+        Returns:
+            int: Number of grades delivered.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT rowid, assignmentid, userid, grade_results, context, attempts FROM moodle_outbox "
+                "WHERE next_attempt_at <= ? ORDER BY created_at",
+                (float("inf") if include_delayed else time.time(),)
+            ).fetchall()
+        by_assignment = {}
+        for row in rows:
+            by_assignment.setdefault(row[1], []).append(row)
+
+        delivered = 0
+        for assignmentid, entries in by_assignment.items():
+            for start in range(0, len(entries), self.batch_size):
+                delivered += self._send(assignmentid, entries[start:start + self.batch_size])
+        MOODLE_OUTBOX_PENDING.set(self.pending())
+        return delivered
+
+    def _send(self, assignmentid: str, entries: list[tuple]) -> int:
+        """Deliver one chunk of an assignment's grades, falling back to one request per grade."""
+        if len(entries) > 1 and assignmentid not in self._single_only:
+            try:
+                with track_stage("moodle_outbox_flush"):
+                    MoodleService.save_grades(
+                        assignmentid, [(userid, json.loads(results)) for _, _, userid, results, _, _ in entries]
+                    )
+            except MoodleError as e:
+                MOODLE_GRADE_DELIVERIES.labels("batch", "error").inc(len(entries))
+                logger.warning("🎓 Moodle rejected a batch of %d grades for assignment %s, sending them one by one: %s",
+                               len(entries), assignmentid, e)
+            except Exception as e:
+                # Not a verdict on the batch (timeout, 5xx): back off and retry it as a batch
+                MOODLE_GRADE_DELIVERIES.labels("batch", "error").inc(len(entries))
+                for rowid, _, userid, _, context, attempts in entries:
+                    self._record_failure(rowid, assignmentid, userid, context, attempts + 1, e)
+                return 0
+            else:
+                MOODLE_GRADE_DELIVERIES.labels("batch", "sent").inc(len(entries))
+                self._delete([entry[0] for entry in entries])
+                logger.debug("🎓 Saved %d grades for assignment %s in Moodle.", len(entries), assignmentid)
+                return len(entries)
+
+            delivered = sum(self._send_one(entry) for entry in entries)
+            if delivered == len(entries):
+                self._single_only.add(assignmentid)
+                logger.info("🎓 Assignment %s accepts single grades but not batches; no longer batching it.",
+                            assignmentid)
+            return delivered
+
+        return sum(self._send_one(entry) for entry in entries)
+
+    def _send_one(self, entry: tuple) -> bool:
+        """Deliver one grade, or schedule its retry. Returns True if it was saved."""
+        rowid, assignmentid, userid, results, context, attempts = entry
+        try:
+            with track_stage("moodle_outbox_flush"):
+                MoodleService.save_grade(assignmentid, userid, json.loads(results))
+        except Exception as e:
+            MOODLE_GRADE_DELIVERIES.labels("single", "error").inc()
+            self._record_failure(rowid, assignmentid, userid, context, attempts + 1, e)
+            return False
+        MOODLE_GRADE_DELIVERIES.labels("single", "sent").inc()
+        self._delete([rowid])
+        return True
+
+    def _record_failure(self, rowid: int, assignmentid: str, userid: str, context: str | None,
+                        attempts: int, error: Exception) -> None:
+        """Back off a failed grade, or give it up after `max_attempts`."""
+        if attempts < self.max_attempts:
+            delay = min(self.max_retry_delay, self.flush_interval * 2 ** attempts)
+            logger.warning("🎓 Failed to save grade of user %s for assignment %s (attempt %d of %d), "
+                           "retrying in %.0fs: %s", userid, assignmentid, attempts, self.max_attempts, delay, error)
+            with self._lock, self._connection:
+                # Matching the rowid leaves a newer grade enqueued meanwhile untouched
+                self._connection.execute(
+                    "UPDATE moodle_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE rowid = ?",
+                    (attempts, time.time() + delay, str(error), rowid)
+                )
+            return
+
+        logger.error("🎓 Giving up on grade of user %s for assignment %s after %d attempts: %s",
+                     userid, assignmentid, attempts, error)
+        MOODLE_GRADE_DELIVERIES.labels("single", "abandoned").inc()
+        self._delete([rowid])
+        if self.on_abandoned is not None:
+            try:
+                self.on_abandoned(json.loads(context) if context else None, error)
+            except Exception as e:
+                logger.error("🎓 Failed to report undelivered grade: %s", e)
+
+    def _delete(self, rowids: list[int]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM moodle_outbox WHERE rowid = ?", [(rowid,) for rowid in rowids])
+
+    def _run(self) -> None:
+        """Flush whenever a batch is full, the interval elapses, or the outbox closes."""
+        while True:
+            with self._condition:
+                if not self._closing:
+                    self._condition.wait(self.flush_interval)
+                closing = self._closing
+            try:
+                self.flush(include_delayed=closing)
+            except Exception as e:  # e.g. the database is locked; the grades stay queued
+                logger.warning("🎓 Moodle outbox flush failed: %s", e)
+            if closing:
+                return
@@ -1,25 +1,170 @@
-import os, requests
-from dotenv import load_dotenv
+import os, json, requests
+from typing import TYPE_CHECKING
+from http_client import get_session
+import config  # noqa: F401 (loads .env before the settings below are read)
 
-# Load environment variables from .env file
-load_dotenv()
+if TYPE_CHECKING:
+    import httpx
 
 # Load Moodle API credentials from environment variables.
 MOODLE_API_URL = os.getenv('MOODLE_API_URL')
 MOODLE_API_TOKEN = os.getenv('MOODLE_API_TOKEN')
 ENV = os.getenv('ENV', 'development')
 
+
+class MoodleError(requests.HTTPError):
+    """Moodle processed a web service call and rejected it (an exception object in the response body)."""
+
+    def __init__(self, message: str, errorcode: str | None = None):
+        super().__init__(message)
+        self.errorcode = errorcode
+
+
 class MoodleService:
     """
     Service class for interacting with the Moodle web service API.
 
     This class provides a static interface to send grade data (including rubric feedback)
-    to a Moodle assignment using the `mod_assign_save_grade` function.
+    to a Moodle assignment using the `mod_assign_save_grade` function, or several grades
+    of one assignment at once with `mod_assign_save_grades`. Parameters are sent as a
+    POST form body, so long feedback is not limited by the URL length.
 
     The method assumes that the Moodle web services have been enabled and configured
     with an API token that has permissions to modify assignment grades.
     """
 
+    @staticmethod
+    def build_grade_params(assignmentid: int, userid: int, grade_results: dict) -> dict:
+        """
+        Build the `mod_assign_save_grade` request parameters for a student's grade.
+
+        Args:
+            assignmentid (int): The Moodle assignment ID.
+            userid (int): The Moodle user ID of the student being graded.
+            grade_results (dict): Grading results, as described in `save_grade`.
+
+        Returns:
+            dict: Flattened Moodle REST parameters.
+
+        Raises:
+            ValueError: If grade_results is not a dict or the Moodle API credentials are missing.
+        """
+        if not isinstance(grade_results, dict):
+            raise ValueError(f"Invalid grade_results. Expected a dictionary, but got: '{grade_results}'")
+        if not MOODLE_API_URL or not MOODLE_API_TOKEN:
+            raise ValueError("Missing Moodle API credentials (MOODLE_API_URL or MOODLE_API_TOKEN).")
+        
+        # Base parameters required for Moodle's REST API call
+        params = {
+            'wstoken': MOODLE_API_TOKEN,
+            'wsfunction': 'mod_assign_save_grade',
+            'moodlewsrestformat': 'json',
+            'assignmentid': assignmentid,
+            'userid': userid,
+            'applytoall': '0',
+        }
+        params.update(MoodleService._grade_fields(grade_results))
+        return params
+
+    @staticmethod
+    def build_grades_params(assignmentid: int, grades: list[tuple[int, dict]]) -> dict:
+        """
+        Build the `mod_assign_save_grades` request parameters for several students of one assignment.
+
+        Args:
+            assignmentid (int): The Moodle assignment ID.
+            grades (list[tuple[int, dict]]): (userid, grade_results) pairs, with grade_results
+                as described in `save_grade`.
+
+        Returns:
+            dict: Flattened Moodle REST parameters.
+
+        Raises:
+            ValueError: If a grade_results is not a dict or the Moodle API credentials are missing.
+        """
+        if not MOODLE_API_URL or not MOODLE_API_TOKEN:
+            raise ValueError("Missing Moodle API credentials (MOODLE_API_URL or MOODLE_API_TOKEN).")
+
+        params = {
+            'wstoken': MOODLE_API_TOKEN,
+            'wsfunction': 'mod_assign_save_grades',
+            'moodlewsrestformat': 'json',
+            'assignmentid': assignmentid,
+            'applytoall': '0',
+        }
+        for i, (userid, grade_results) in enumerate(grades):
+            if not isinstance(grade_results, dict):
+                raise ValueError(f"Invalid grade_results. Expected a dictionary, but got: '{grade_results}'")
+            params[f'grades[{i}][userid]'] = userid
+            params.update(MoodleService._grade_fields(grade_results, f'grades[{i}]'))
+        return params
+
+    @staticmethod
+    def _grade_fields(grade_results: dict, prefix: str = '') -> dict:
+        """
+        Build the grade, feedback and rubric fields of one student.
+
+        Args:
+            grade_results (dict): Grading results, as described in `save_grade`.
+            prefix (str, optional): Prepended to each field, e.g. "grades[0]" for `mod_assign_save_grades`.
+
+        Returns:
+            dict: Flattened Moodle REST parameters.
+        """
+        def field(name: str) -> str:
+            # Top-level fields are plain names; nested ones are wrapped in brackets after the prefix
+            if not prefix:
+                return name
+            head, bracket, rest = name.partition('[')
+            return f'{prefix}[{head}]{bracket}{rest}'
+
+        fields = {
+            field('grade'): '100',
+            field('attemptnumber'): '-1',
+            field('addattempt'): '0',
+            field('workflowstate'): 'graded',
+            field('plugindata[assignfeedbackcomments_editor][text]'): grade_results.get('feedback_comment', ''),
+            field('plugindata[assignfeedbackcomments_editor][format]'): '1',
+        }
+
+        # Populate rubric (advanced grading) data
+        for i, criterion in enumerate(grade_results.get('criteria_results') or []):
+            rubric = f'advancedgradingdata[rubric][criteria][{i}]'
+            fields[field(f'{rubric}[criterionid]')] = criterion.get('criterionid')
+            fields[field(f'{rubric}[fillings][{i}][criterionid]')] = criterion.get('criterionid')
+            fields[field(f'{rubric}[fillings][{i}][levelid]')] = criterion.get('levelid')
+            fields[field(f'{rubric}[fillings][{i}][remark]')] = criterion.get('remark')
+
+        return fields
+
+    @staticmethod
+    def raise_for_error(status_code: int, text: str) -> None:
+        """
+        Raise if a Moodle web service response reports a failure.
+
+        Moodle answers most errors (invalid token, invalid parameter, missing
+        capability) with HTTP 200 and an exception object in the body.
+
+        Args:
+            status_code (int): HTTP status of the response.
+            text (str): Response body.
+
+        Raises:
+            MoodleError: If Moodle rejected the call.
+            requests.HTTPError: If the request failed otherwise.
+        """
+        if not 200 <= status_code < 300:
+            raise requests.HTTPError(f"Moodle API request failed: {status_code} - {text}")
+        try:
+            body = json.loads(text) if text else None
+        except ValueError:
+            return
+        if isinstance(body, dict) and 'exception' in body:
+            raise MoodleError(
+                f"Moodle API request failed: {body.get('errorcode') or body['exception']} - {body.get('message')}",
+                errorcode=body.get('errorcode')
+            )
+
     @staticmethod
     def save_grade(assignmentid: int, userid: int, grade_results: dict) -> None:
         """
@@ -52,37 +197,53 @@ class MoodleService:
 
         """
 
-        if not isinstance(grade_results, dict):
-            raise ValueError(f"Invalid grade_results. Expected a dictionary, but got: '{grade_results}'")
-        if not MOODLE_API_URL or not MOODLE_API_TOKEN:
-            raise ValueError("Missing Moodle API credentials (MOODLE_API_URL or MOODLE_API_TOKEN).")
-        
-        # Base parameters required for Moodle's REST API call
-        params = {
-            'wstoken': MOODLE_API_TOKEN,
-            'wsfunction': 'mod_assign_save_grade',
-            'moodlewsrestformat': 'json',
-            'assignmentid': assignmentid,
-            'userid': userid,
-            'grade': '100',
-            'attemptnumber': '-1',
-            'addattempt': '0',
-            'workflowstate': 'graded',
-            'applytoall': '0',
-            'plugindata[assignfeedbackcomments_editor][text]': grade_results.get('feedback_comment', ''),
-            'plugindata[assignfeedbackcomments_editor][format]': '1',
-        }
+        params = MoodleService.build_grade_params(assignmentid, userid, grade_results)
 
-         # Populate rubric (advanced grading) data
-        for i, criterion in enumerate(grade_results.get('criteria_results') or []):
-            params[f'advancedgradingdata[rubric][criteria][{i}][criterionid]'] = criterion.get('criterionid')
-            params[f'advancedgradingdata[rubric][criteria][{i}][fillings][{i}][criterionid]'] = criterion.get('criterionid')
-            params[f'advancedgradingdata[rubric][criteria][{i}][fillings][{i}][levelid]'] = criterion.get('levelid')
-            params[f'advancedgradingdata[rubric][criteria][{i}][fillings][{i}][remark]'] = criterion.get('remark')
-        
-        # Perform the API request
+        # Perform the API request over the shared keep-alive connection pool
         verifySSL = False if ENV == 'development' else True
-        response = requests.post(MOODLE_API_URL, params=params, verify=verifySSL)
-        if not response.ok:
-            # Log error or raise exception if Moodle returns a failure
-            raise requests.HTTPError(f"Moodle API request failed: {response.status_code} - {response.text}")
+        response = get_session("moodle").post(MOODLE_API_URL, data=params, verify=verifySSL)
+        MoodleService.raise_for_error(response.status_code, response.text)
+
+    @staticmethod
+    def save_grades(assignmentid: int, grades: list[tuple[int, dict]]) -> None:
+        """
+        Save the grades of several students of one assignment in a single request.
+
+        Moodle applies the grades in one transaction: if any of them is
+        rejected, none is saved.
+
+        Args:
+            assignmentid (int): The Moodle assignment ID.
+            grades (list[tuple[int, dict]]): (userid, grade_results) pairs, with grade_results
+                as described in `save_grade`.
+
+        Raises:
+            requests.HTTPError: If the POST request to Moodle fails.
+            ValueError: If the grade results are invalid or Moodle API credentials are missing.
+        """
+        params = MoodleService.build_grades_params(assignmentid, grades)
+
+        verifySSL = False if ENV == 'development' else True
+        response = get_session("moodle").post(MOODLE_API_URL, data=params, verify=verifySSL)
+        MoodleService.raise_for_error(response.status_code, response.text)
+
+    @staticmethod
+    async def save_grade_async(assignmentid: int, userid: int, grade_results: dict, client: "httpx.AsyncClient") -> None:
+        """
+        Asynchronous version of `save_grade` for the asyncio worker.
+
+        Args:
+            assignmentid (int): The Moodle assignment ID.
+            userid (int): The Moodle user ID of the student being graded.
+            grade_results (dict): Grading results, as described in `save_grade`.
+            client (httpx.AsyncClient): Shared client whose connection pool is reused
+                across submissions. SSL verification is configured on the client.
+
+        Raises:
+            requests.HTTPError: If the POST request to Moodle fails.
+            ValueError: If the grade results are invalid or Moodle API credentials are missing.
+        """
+        params = MoodleService.build_grade_params(assignmentid, userid, grade_results)
+
+        response = await client.post(MOODLE_API_URL, data=params)
+        MoodleService.raise_for_error(response.status_code, response.text)
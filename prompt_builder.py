@@ -0,0 +1,264 @@
+import re, json, math
+from file_filter import FileFilter
+
+# Rough characters-per-token ratio for source code; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Don't bother including a truncated file if less than this many tokens of it would fit
+MIN_TRUNCATED_TOKENS = 200
+
+# Extensions that usually hold the code being graded, ranked ahead of docs and config
+SOURCE_EXTENSIONS = (
+    ".py", ".ipynb", ".js", ".jsx", ".ts", ".tsx", ".java", ".kt", ".c", ".h", ".cpp", ".hpp",
+    ".cs", ".go", ".rs", ".rb", ".php", ".swift", ".scala", ".sql", ".html", ".css", ".scss", ".sh",
+)
+
+_WORD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+
+
+PROMPT_INTRO = "You are an expert programming instructor and automatic grader."
+
+TASK_DEFINITION = """
+### Task definition
+- Grade the following student's code using the given rubric guide and the weightings set for each criterion.
+- Apply each criterion fairly.
+- You may simulate test cases mentally; do not run code.
+- Be concise and constructive.
+"""
+
+
+def build_prompt_prefix(rubric: str, activity_instruction: str, output_template: str) -> str:
+    """
+    Build the part of the grading prompt that comes before the student code.
+
+    The prefix only depends on the assignment, so it is identical for every
+    student of an assignment; keeping it byte-stable lets providers reuse
+    their cache of it across submissions.
+
+    Args:
+        rubric (str): Grading rubric text describing evaluation criteria.
+        activity_instruction (str): Instructions for the coding activity.
+        output_template (str): Expected format or JSON schema for output.
+
+    Returns:
+        str: The prompt prefix, ending with a newline.
+    """
+    return (
+        f"{PROMPT_INTRO}\n"
+        f"{TASK_DEFINITION}\n"
+        f"### Rubric\n{rubric}\n"
+        f"###Activity Instructions for the learner\n{activity_instruction}\n"
+        f"### Response Template\nRespond **only** using the following format:\n{output_template}\n"
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in a piece of text.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: Approximate token count.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_parts_tokens(parts: list[str]) -> int:
+    """Estimate the LLM tokens of text kept as a list of pieces, without joining them."""
+    return math.ceil(sum(map(len, parts)) / CHARS_PER_TOKEN)
+
+
+def file_parts(path: str, content: str) -> list[str]:
+    """
+    Split one file's prompt block into pieces that reference, rather than copy, its content.
+
+    Returns:
+        list[str]: Pieces that join to `format_file(path, content)`.
+    """
+    return ["\n\n", path, "\n```\n", content, "\n```\n"]
+
+
+def format_file(path: str, content: str) -> str:
+    """
+    Render one file as a Markdown-style block for the prompt.
+
+    Returns:
+        str: The block in the format "<path>\\n```\\n<content>\\n```".
+    """
+    return "".join(file_parts(path, content))
+
+
+def _keywords(text: str) -> set[str]:
+    """Extract lowercase identifiers/words (3+ characters) from text."""
+    words = set()
+    for word in _WORD_PATTERN.findall(text):
+        words.add(word.lower())
+        # Split snake_case so "divide_numbers" also matches "divide" and "numbers"
+        words.update(part.lower() for part in word.split("_") if len(part) > 2)
+    return words
+
+
+def rank_files(files: list[dict], activity_instruction: str) -> list[dict]:
+    """
+    Order files by how relevant they look to the activity instruction.
+
+    A file scores points for instruction keywords found in its path (weighted
+    highest) and its content, and for being a source code file. Ties keep the
+    original repository order, so ranking is deterministic.
+
+    Args:
+        files (list[dict]): Files as returned by `GitHubRepository.get_files`.
+        activity_instruction (str): The activity instruction shown to the learner.
+
+    Returns:
+        list[dict]: The same files, most relevant first.
+    """
+    instruction_words = _keywords(activity_instruction or "")
+
+    def score(indexed_file):
+        index, file = indexed_file
+        path = file.get("path") or ""
+        path_hits = len(instruction_words & _keywords(path))
+        content_hits = len(instruction_words & _keywords(file.get("content") or ""))
+        is_source = path.lower().endswith(SOURCE_EXTENSIONS)
+        return (-(path_hits * 3 + content_hits + (5 if is_source else 0)), index)
+
+    return [file for _, file in sorted(enumerate(files), key=score)]
+
+
+def code_section_parts(files: list[dict], activity_instruction: str = "",
+                       token_budget: int | None = None,
+                       file_filter: FileFilter | None = None) -> tuple[list[str], dict]:
+    """
+    Select and order the pieces of the "Student Code" part of the prompt within a token budget.
+
+    Files rejected by the filter or that look binary are skipped. The remaining
+    files are ranked by relevance and admitted until the budget is used up; the
+    file that crosses the budget is truncated if a useful part of it still fits.
+    Admitted files are rendered in their original repository order so the prompt
+    stays stable for identical submissions.
+
+    File contents are referenced, not copied, so the caller can join the pieces
+    straight into the final prompt with a single copy of the code.
+
+    Args:
+        files (list[dict]): Files as returned by `GitHubRepository.get_files`.
+        activity_instruction (str, optional): Used to rank files by relevance.
+        token_budget (int, optional): Maximum estimated tokens for the code section.
+            None means unlimited.
+        file_filter (FileFilter, optional): Rules for skipping files. None keeps every file.
+
+    Returns:
+        tuple[list[str], dict]: The pieces of the code section and a report of the form
+            {"included": [path, ...], "truncated": [path, ...],
+             "dropped": [{"path": path, "reason": reason}, ...], "tokens": int}
+    """
+    report = {"included": [], "truncated": [], "dropped": [], "tokens": 0}
+
+    candidates = []
+    for file in files:
+        path = file.get("path") or ""
+        content = file.get("content") or ""
+        reason = None
+        if file_filter is not None:
+            size = file.get("size")
+            if size is None:  # Files cached before sizes were recorded
+                size = len(content.encode("utf-8"))
+            reason = file_filter.exclusion_reason(path, size)
+            if reason is None and file_filter.is_binary(content):
+                reason = "binary"
+        if reason:
+            report["dropped"].append({"path": path, "reason": reason})
+        else:
+            candidates.append(file)
+
+    admitted = {}  # id(file) -> block pieces
+    remaining = token_budget
+    for file in rank_files(candidates, activity_instruction):
+        path = file.get("path") or ""
+        content = file.get("content") or ""
+        block = file_parts(path, content)
+        tokens = estimate_parts_tokens(block)
+
+        if remaining is None or tokens <= remaining:
+            admitted[id(file)] = block
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            overhead = len(format_file(path, ""))
+            keep_chars = max(0, remaining * CHARS_PER_TOKEN - overhead - 64)
+            omitted = len(content) - keep_chars
+            block = file_parts(path, content[:keep_chars])
+            block.insert(-1, f"\n... [truncated {omitted} characters]")  # Inside the code fence
+            tokens = estimate_parts_tokens(block)
+            admitted[id(file)] = block
+            report["truncated"].append(path)
+        else:
+            report["dropped"].append({"path": path, "reason": "token_budget"})
+            continue
+
+        report["tokens"] += tokens
+        if remaining is not None:
+            remaining -= tokens
+
+    parts = []
+    for file in candidates:
+        block = admitted.get(id(file))
+        if block is not None:
+            parts.extend(block)
+            report["included"].append(file.get("path"))
+
+    return parts, report
+
+
+INCREMENTAL_INSTRUCTIONS = """This is a resubmission. The student's previous version was already graded; \
+its review, the changes made since, and the full new content of the changed files follow. \
+Grade the current version: keep the result and remark of criteria the changes do not affect, \
+and update those they do. Respond with the complete review."""
+
+
+def format_change(change: dict) -> str:
+    """
+    Render one file's changes from the GitHub Compare API as a diff block.
+
+    Returns:
+        str: The block in the format "<path> (<status>)\\n```diff\\n<patch>\\n```".
+    """
+    path = change.get("filename") or ""
+    if change.get("previous_filename"):
+        path = f"{change['previous_filename']} -> {path}"
+    return f"\n\n{path} ({change.get('status')})\n```diff\n{change.get('patch') or ''}\n```\n"
+
+
+def incremental_section_parts(previous_review: dict, changes: list[dict], changed_files: list[dict],
+                              token_budget: int | None = None,
+                              file_filter: FileFilter | None = None) -> tuple[list[str], dict]:
+    """
+    Select the pieces of the "Student Code" part of a regrade prompt.
+
+    The diff is always included in full (its size is bounded by the incremental
+    regrade threshold); the new content of the changed files fills the rest of
+    the token budget as in `code_section_parts`.
+
+    Args:
+        previous_review (dict): The review of the previously graded commit.
+        changes (list[dict]): Changed files as returned by `GitHubRepository.compare_commits`.
+        changed_files (list[dict]): New content of the changed files.
+        token_budget (int, optional): Maximum estimated tokens for the section. None means unlimited.
+        file_filter (FileFilter, optional): Rules for skipping files. None keeps every file.
+
+    Returns:
+        tuple[list[str], dict]: The pieces of the section and a report in the format of `code_section_parts`.
+    """
+    header = (
+        f"{INCREMENTAL_INSTRUCTIONS}\n\n"
+        f"#### Previous Review\n```json\n{json.dumps(previous_review, indent=2, ensure_ascii=False)}\n```\n"
+        f"\n#### Changes Since the Previous Version"
+        f"{''.join(format_change(change) for change in changes)}"
+        f"\n#### Current Content of the Changed Files"
+    )
+    header_tokens = estimate_tokens(header)
+    remaining = None if token_budget is None else max(0, token_budget - header_tokens)
+    parts, report = code_section_parts(changed_files, token_budget=remaining, file_filter=file_filter)
+    report["tokens"] += header_tokens
+    return [header, *parts], report
@@ -0,0 +1,179 @@
+"""
+Incremental regrading of resubmissions.
+
+Students often push a small fix and resubmit. Instead of fetching the whole
+repository and grading it from scratch, the worker remembers what it last
+graded for each student and assignment (commit, file hashes and review). For a
+resubmission it asks GitHub's compare API what changed since that commit,
+downloads only the changed files and lets the model update the previous review
+from the diff. Large changes, rewritten history, or a changed rubric or
+instruction fall back to a full regrade.
+"""
+import json, time, hashlib, sqlite3, threading
+
+# How a submission was graded
+REGRADE_FULL = "full"                # whole repository fetched and graded
+REGRADE_INCREMENTAL = "incremental"  # previous review updated from the diff
+REGRADE_UNCHANGED = "unchanged"      # no gradable change; previous review reused
+
+
+def content_hash(content: str) -> str:
+    """Return the SHA-256 hex digest of a file's text content."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def file_hashes(files: list[dict]) -> dict[str, str]:
+    """
+    Map each file path to the hash of its content.
+
+    Args:
+        files (list[dict]): Files as returned by `GitHubRepository.get_files`.
+
+    Returns:
+        dict[str, str]: Path mapped to `content_hash` of its content.
+    """
+    return {file.get("path"): content_hash(file.get("content") or "") for file in files}
+
+
+def is_small_change(changes: list[dict], max_files: int, max_lines: int) -> bool:
+    """
+    Decide whether a set of changes is small enough to regrade from the diff.
+
+    Changes without a patch (binary or very large diffs) always need a full regrade.
+
+    Args:
+        changes (list[dict]): Compare API file entries, already filtered to gradable files.
+        max_files (int): Maximum number of changed files.
+        max_lines (int): Maximum added plus deleted lines over all files.
+
+    Returns:
+        bool: True if an incremental regrade is appropriate.
+    """
+    if len(changes) > max_files:
+        return False
+    if any(change.get("status") != "removed" and not change.get("patch") for change in changes):
+        return False
+    return sum(change.get("additions", 0) + change.get("deletions", 0) for change in changes) <= max_lines
+
+
+def update_file_hashes(previous: dict[str, str], changes: list[dict], changed_files: list[dict]) -> dict[str, str]:
+    """
+    Apply compare API changes to the file hashes of the previously graded commit.
+
+    A changed file missing from `changed_files` was skipped after download
+    (binary, too large) and is dropped, as a full fetch would leave it out.
+
+    Args:
+        previous (dict[str, str]): File hashes recorded for the previous commit.
+        changes (list[dict]): Compare API file entries, filtered to gradable files.
+        changed_files (list[dict]): New contents of the added and modified files.
+
+    Returns:
+        dict[str, str]: File hashes of the new commit.
+    """
+    hashes = dict(previous)
+    fetched = {file.get("path") for file in changed_files}
+    for change in changes:
+        if change.get("status") in ("removed", "renamed"):
+            hashes.pop(change.get("previous_filename") or change.get("filename"), None)
+        if change.get("status") != "removed" and change.get("filename") not in fetched:
+            hashes.pop(change.get("filename"), None)
+    hashes.update(file_hashes(changed_files))
+    return hashes
+
+
+def admitted_changes(changes: list[dict], changed_files: list[dict]) -> list[dict]:
+    """
+    Drop the compare API entries of files skipped after download, so their diff stays out of the prompt.
+
+    Args:
+        changes (list[dict]): Compare API file entries, filtered to gradable files.
+        changed_files (list[dict]): New contents of the added and modified files.
+
+    Returns:
+        list[dict]: Entries of removed files and of files present in `changed_files`, in order.
+    """
+    fetched = {file.get("path") for file in changed_files}
+    return [change for change in changes if change.get("status") == "removed" or change.get("filename") in fetched]
+
+
+class RegradeStore:
+    """
+    The last graded state of each (assignment, student) pair.
+
+    Each record holds the repository URL, graded commit SHA, file hashes,
+    the review and a fingerprint of the rubric and instruction it was graded
+    against. State lives in a SQLite file that several worker processes on the
+    same host can share.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float | None = None):
+        """
+        Args:
+            path (str): Path of the SQLite database file. Created if missing.
+            ttl_seconds (float, optional): How long a graded state is kept. None means forever.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS graded_state ("
+                "student_key TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+        self.purge_expired()
+
+    @staticmethod
+    def make_key(assignment_id, user_id) -> str | None:
+        """
+        Build the key of a student's work on an assignment.
+
+        Returns:
+            str | None: "<assignmentid>:<userid>", or None if either is missing.
+        """
+        if assignment_id in (None, "") or user_id in (None, ""):
+            return None
+        return f"{assignment_id}:{user_id}"
+
+    def get(self, student_key: str) -> dict | None:
+        """
+        Return the last graded state, or None if the student was not graded yet.
+
+        Returns:
+            dict | None: {"repo", "commit_sha", "files", "review", "context_hash"}.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT state FROM graded_state WHERE student_key = ?", (student_key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, student_key: str, state: dict) -> None:
+        """
+        Replace the graded state of a student's work.
+
+        Args:
+            student_key (str): Key from `make_key`.
+            state (dict): {"repo", "commit_sha", "files", "review", "context_hash"}.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO graded_state (student_key, state, updated_at) VALUES (?, ?, ?)",
+                (student_key, json.dumps(state), time.time())
+            )
+
+    def purge_expired(self) -> int:
+        """
+        Delete states older than the TTL.
+
+        Returns:
+            int: Number of states removed.
+        """
+        if self.ttl_seconds is None:
+            return 0
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM graded_state WHERE updated_at < ?", (time.time() - self.ttl_seconds,)
+            )
+        return cursor.rowcount
@@ -0,0 +1,117 @@
+import os, json, hashlib, threading, tempfile
+
+
+class RepositoryCache:
+    """
+    On-disk, content-addressed cache of repository file sets.
+
+    Entries are keyed by `owner/repo@commit-sha`, so a cached file set never goes
+    stale: a new push produces a new commit SHA and therefore a new key. The cache
+    is bounded by total size and entry count, evicting the least recently used
+    entries first (access time is tracked through each entry's mtime).
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, max_entries: int = 10000):
+        """
+        Initialize the repository cache.
+
+        Args:
+            cache_dir (str): Directory in which cache entries are stored. Created if missing.
+            max_bytes (int, optional): Maximum total size of all entries on disk.
+            max_entries (int, optional): Maximum number of cached repositories.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(owner: str, repo_name: str, commit_sha: str) -> str:
+        """
+        Build the cache key for a repository at a given commit.
+
+        GitHub owner and repository names are case-insensitive, so they are lowercased.
+
+        Returns:
+            str: The key in the form "owner/repo@sha".
+        """
+        return f"{owner.lower()}/{repo_name.lower()}@{commit_sha}"
+
+    def _entry_path(self, key: str) -> str:
+        """Return the file path of the entry for `key`."""
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def get(self, key: str) -> list[dict] | None:
+        """
+        Look up a cached file set.
+
+        Args:
+            key (str): Key built with `make_key`.
+
+        Returns:
+            list[dict] | None: The cached files, or None on a cache miss.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("key") != key:
+            return None
+        return entry.get("files")
+
+    def put(self, key: str, files: list[dict]) -> None:
+        """
+        Store a file set and evict old entries if the cache is over its limits.
+
+        The entry is written to a temporary file and atomically moved into place,
+        so concurrent readers never observe a partially written entry.
+
+        Args:
+            key (str): Key built with `make_key`.
+            files (list[dict]): Files as returned by `GitHubRepository.get_files`.
+        """
+        path = self._entry_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "files": files}, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the cache fits its limits."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            entries.sort()  # Oldest access first
+            total_bytes = sum(size for _, size, _ in entries)
+            count = len(entries)
+
+            for _, size, path in entries:
+                if total_bytes <= self.max_bytes and count <= self.max_entries:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total_bytes -= size
+                count -= 1
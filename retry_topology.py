@@ -0,0 +1,135 @@
+"""
+Delayed retries and dead-lettering for the grading queue.
+
+A submission that cannot be settled (e.g. Moodle and the status dashboard are
+both down) is not requeued at the head of the grading queue, where it would
+be redelivered immediately and spin. Instead it is published to a retry queue
+whose messages expire after a fixed delay and are then dead-lettered back to
+the grading queue. The delay doubles with every attempt; once the maximum
+number of attempts is reached the message is parked in a dead-letter queue
+for manual inspection.
+
+    grading_queue --(failure, attempt n)--> grading_queue.retry.<delay>s --(TTL)--> grading_queue
+    grading_queue --(failure, attempt > max)--> grading_queue.dead
+
+Retry queues are named after their delay, so changing the backoff settings
+declares new queues instead of conflicting with existing ones. The grading
+queue itself is not declared here: the workers declare it with
+`scheduling.queue_arguments()`, which adds `x-max-priority` when
+QUEUE_MAX_PRIORITY is set. Messages dead-lettered back to it keep their
+priority property.
+"""
+import os
+import config  # noqa: F401 (loads .env before the settings below are read)
+
+# Delivery attempts before a message is dead-lettered; 0 disables delayed retries (plain requeue)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "10"))   # seconds before the first retry, doubled per attempt
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "600"))    # seconds, upper bound of the backoff
+
+# Message header carrying the number of failed attempts so far
+ATTEMPT_HEADER = "x-attempt"
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    Return the delay in seconds before retrying after the given failed attempt.
+
+    Args:
+        attempt (int): Number of failed attempts, starting at 1.
+
+    Returns:
+        float: Exponential backoff capped at `RETRY_MAX_DELAY`.
+    """
+    return min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+
+
+def retry_queue_name(queue: str, attempt: int) -> str:
+    """Return the name of the retry queue used after the given failed attempt."""
+    return f"{queue}.retry.{retry_delay(attempt):g}s"
+
+
+def dead_letter_queue_name(queue: str) -> str:
+    """Return the name of the queue holding messages that exhausted their attempts."""
+    return f"{queue}.dead"
+
+
+def retry_queue_arguments(queue: str, attempt: int) -> dict:
+    """
+    Return the declaration arguments of a retry queue.
+
+    Messages expire after the attempt's delay and are dead-lettered through the
+    default exchange back to the grading queue.
+    """
+    return {
+        "x-message-ttl": int(retry_delay(attempt) * 1000),
+        "x-dead-letter-exchange": "",
+        "x-dead-letter-routing-key": queue,
+    }
+
+
+def get_attempt(headers: dict | None) -> int:
+    """
+    Read the number of failed attempts from message headers.
+
+    Args:
+        headers (dict | None): AMQP message headers.
+
+    Returns:
+        int: Failed attempts so far; 0 for a first delivery.
+    """
+    try:
+        return int((headers or {}).get(ATTEMPT_HEADER, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def failure_destination(queue: str, headers: dict | None) -> tuple[str, dict]:
+    """
+    Decide where a failed message goes next.
+
+    Args:
+        queue (str): The grading queue the message was consumed from.
+        headers (dict | None): The message's current headers.
+
+    Returns:
+        tuple[str, dict]: The queue to publish to (retry or dead-letter) and the
+            headers to publish with, carrying the incremented attempt count.
+    """
+    attempt = get_attempt(headers) + 1
+    new_headers = {**(headers or {}), ATTEMPT_HEADER: attempt}
+    if attempt >= RETRY_MAX_ATTEMPTS:
+        return dead_letter_queue_name(queue), new_headers
+    return retry_queue_name(queue, attempt), new_headers
+
+
+def declare_retry_topology(channel, queue: str) -> None:
+    """
+    Declare the retry and dead-letter queues on a pika channel.
+
+    Args:
+        channel: A `pika` blocking channel.
+        queue (str): The grading queue.
+    """
+    for attempt in range(1, RETRY_MAX_ATTEMPTS):
+        channel.queue_declare(
+            queue=retry_queue_name(queue, attempt), durable=True,
+            arguments=retry_queue_arguments(queue, attempt)
+        )
+    channel.queue_declare(queue=dead_letter_queue_name(queue), durable=True)
+
+
+async def declare_retry_topology_async(channel, queue: str) -> None:
+    """
+    Declare the retry and dead-letter queues on an aio-pika channel.
+
+    Args:
+        channel: An `aio_pika` channel.
+        queue (str): The grading queue.
+    """
+    for attempt in range(1, RETRY_MAX_ATTEMPTS):
+        await channel.declare_queue(
+            retry_queue_name(queue, attempt), durable=True,
+            arguments=retry_queue_arguments(queue, attempt)
+        )
+    await channel.declare_queue(dead_letter_queue_name(queue), durable=True)
@@ -0,0 +1,203 @@
+import json, time, sqlite3, hashlib, threading
+from collections import OrderedDict
+
+
+class ReviewCache:
+    """
+    Base class for caches of parsed LLM reviews.
+
+    Reviews are keyed by a hash of the model name and the exact prompt, so a hit
+    is only possible when the code, rubric, instructions and output template are
+    all byte-identical. Subclasses provide the storage backend.
+    """
+
+    def __init__(self, ttl_seconds: float | None = None):
+        """
+        Args:
+            ttl_seconds (float, optional): How long an entry stays valid. None means forever.
+        """
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def make_key(model: str, prompt: str) -> str:
+        """
+        Build the cache key for a prompt sent to a model.
+
+        Returns:
+            str: Hex SHA-256 digest of the model name and prompt.
+        """
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prompt.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _expires_at(self) -> float | None:
+        """Return the expiry timestamp for an entry stored now."""
+        return time.time() + self.ttl_seconds if self.ttl_seconds else None
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached review for `key`, or None if missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key: str, review: dict) -> None:
+        """Store a parsed review under `key`."""
+        raise NotImplementedError
+
+
+class InMemoryReviewCache(ReviewCache):
+    """
+    Process-local LRU cache of reviews. Thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float | None = None):
+        """
+        Args:
+            max_entries (int, optional): Number of reviews kept before the least recently used is evicted.
+            ttl_seconds (float, optional): How long an entry stays valid. None means forever.
+        """
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, review = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return json.loads(review)
+
+    def set(self, key: str, review: dict) -> None:
+        # Stored serialized so callers can never mutate a cached review
+        entry = (self._expires_at(), json.dumps(review))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteReviewCache(ReviewCache):
+    """
+    Review cache persisted in a SQLite file, so it survives restarts and can be
+    shared by several worker processes on the same host.
+
+    Like the in-memory backend it is bounded: every write evicts the least
+    recently used entries beyond `max_entries`. Expired entries are purged when
+    the cache is opened and every `PURGE_INTERVAL` writes, not only when read.
+    """
+
+    PURGE_INTERVAL = 100  # Writes between two purges of expired entries
+
+    def __init__(self, path: str, ttl_seconds: float | None = None, max_entries: int | None = None):
+        """
+        Args:
+            path (str): Path of the SQLite database file. Created if missing.
+            ttl_seconds (float, optional): How long an entry stays valid. None means forever.
+            max_entries (int, optional): Number of reviews kept before the least recently used
+                are evicted. None means unbounded.
+        """
+        super().__init__(ttl_seconds)
+        self.path = path
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS review_cache ("
+                "key TEXT PRIMARY KEY, review TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(review_cache)")}
+            if "accessed_at" not in columns:  # Databases created before LRU eviction
+                try:
+                    self._connection.execute(
+                        "ALTER TABLE review_cache ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0"
+                    )
+                except sqlite3.OperationalError:  # Another worker added it first
+                    pass
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS review_cache_accessed_at ON review_cache (accessed_at)"
+            )
+        self.purge_expired()
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT review, expires_at FROM review_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            review, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._connection.execute("DELETE FROM review_cache WHERE key = ?", (key,))
+                return None
+            self._connection.execute("UPDATE review_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(review)
+
+    def set(self, key: str, review: dict) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO review_cache (key, review, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(review), self._expires_at(), time.time())
+            )
+            if self.max_entries is not None:
+                self._connection.execute(
+                    "DELETE FROM review_cache WHERE key IN "
+                    "(SELECT key FROM review_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            self._writes += 1
+            purge = self._writes % self.PURGE_INTERVAL == 0
+        if purge:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """
+        Delete expired entries.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM review_cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+            )
+        return cursor.rowcount
+
+
+def create_review_cache(backend: str | None, ttl_seconds: float | None = None,
+                        max_entries: int = 1000, path: str = "review_cache.sqlite3") -> ReviewCache | None:
+    """
+    Build a review cache from configuration.
+
+    Args:
+        backend (str): "memory", "sqlite", or empty/"none" to disable caching.
+        ttl_seconds (float, optional): How long an entry stays valid. None means forever.
+        max_entries (int, optional): Number of reviews kept before the least recently used are evicted.
+        path (str, optional): Database file of the SQLite backend.
+
+    Returns:
+        ReviewCache | None: The configured cache, or None if caching is disabled.
+
+    Raises:
+        ValueError: If the backend name is unknown.
+    """
+    backend = (backend or "none").lower()
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return InMemoryReviewCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+    if backend == "sqlite":
+        return SQLiteReviewCache(path, ttl_seconds=ttl_seconds, max_entries=max_entries)
+    raise ValueError(f"Unknown review cache backend '{backend}'. Expected one of: none, memory, sqlite")
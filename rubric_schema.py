@@ -0,0 +1,113 @@
+"""
+Response schema and validation for rubric-based reviews.
+
+The grading response must select exactly one existing level for every
+criterion of the assignment rubric, otherwise Moodle rejects or misfiles the
+grade. The schema built here is passed to the model's native JSON output mode;
+`validate_review` then checks what the schema cannot express, such as a level
+belonging to the criterion it was chosen for.
+"""
+
+
+def levels_by_criterion(criteria: list[dict]) -> dict[str, set[str]]:
+    """Map each criterion ID to the set of its level IDs, all as strings."""
+    return {
+        str(criterion.get("criterionid")): {str(level.get("id")) for level in criterion.get("levels") or []}
+        for criterion in criteria
+    }
+
+
+def build_response_schema(criteria: list[dict]) -> dict:
+    """
+    Build a Gemini response schema for reviews of the given rubric.
+
+    Criterion and level IDs are restricted to the values present in the rubric.
+
+    Args:
+        criteria (list[dict]): Rubric criteria from the submission message, each with
+            "criterionid", "criteriondescription" and "levels" ([{"id", ...}]).
+
+    Returns:
+        dict: An OpenAPI-style schema accepted as `response_schema` by the Gemini API.
+    """
+    levels = levels_by_criterion(criteria)
+    criterion_ids = sorted(levels)
+    level_ids = sorted(set().union(*levels.values())) if levels else []
+
+    def string_enum(values):
+        return {"type": "string", "format": "enum", "enum": values} if values else {"type": "string"}
+
+    return {
+        "type": "object",
+        "properties": {
+            "criteria_results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "criteria": {"type": "string"},
+                        "criterionid": string_enum(criterion_ids),
+                        "remark": {"type": "string"},
+                        "levelid": string_enum(level_ids),
+                    },
+                    "required": ["criterionid", "levelid", "remark"],
+                },
+            },
+            "feedback_comment": {"type": "string"},
+        },
+        "required": ["criteria_results", "feedback_comment"],
+    }
+
+
+def validate_review(review, criteria: list[dict], levels: dict[str, set[str]] | None = None) -> list[str]:
+    """
+    Check a parsed review against the rubric.
+
+    Args:
+        review: The parsed model response.
+        criteria (list[dict]): Rubric criteria from the submission message.
+        levels (dict[str, set[str]], optional): `levels_by_criterion(criteria)`, if already computed.
+
+    Returns:
+        list[str]: Human-readable problems, empty if the review is valid.
+    """
+    if not isinstance(review, dict):
+        return [f"The response must be a JSON object, got {type(review).__name__}."]
+    if "error" in review:
+        return ["The response is not valid JSON."]
+
+    errors = []
+    if not isinstance(review.get("feedback_comment"), str):
+        errors.append('"feedback_comment" must be a string.')
+
+    results = review.get("criteria_results")
+    if not isinstance(results, list):
+        return errors + ['"criteria_results" must be a list.']
+
+    if levels is None:
+        levels = levels_by_criterion(criteria)
+    seen = set()
+    for i, result in enumerate(results):
+        if not isinstance(result, dict):
+            errors.append(f"criteria_results[{i}] must be an object.")
+            continue
+        criterion_id = str(result.get("criterionid"))
+        level_id = str(result.get("levelid"))
+        if criterion_id not in levels:
+            errors.append(f'criteria_results[{i}]: unknown criterionid "{criterion_id}".')
+            continue
+        if criterion_id in seen:
+            errors.append(f'criteria_results[{i}]: criterionid "{criterion_id}" is graded more than once.')
+        seen.add(criterion_id)
+        if level_id not in levels[criterion_id]:
+            errors.append(
+                f'criteria_results[{i}]: levelid "{level_id}" is not a level of criterion "{criterion_id}" '
+                f'(allowed: {", ".join(sorted(levels[criterion_id]))}).'
+            )
+        if not isinstance(result.get("remark"), str):
+            errors.append(f'criteria_results[{i}]: "remark" must be a string.')
+
+    missing = sorted(set(levels) - seen)
+    if missing:
+        errors.append(f"Missing criteria: {', '.join(missing)}.")
+    return errors
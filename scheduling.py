@@ -0,0 +1,168 @@
+"""
+Submission priorities and per-course fair scheduling.
+
+Without priorities the grading queue is strictly FIFO, so one instructor
+bulk-regrading a large course delays live submissions of every other course.
+Two mechanisms address this:
+
+- Broker priorities: with `QUEUE_MAX_PRIORITY` set, the grading queue is
+  declared with `x-max-priority` and RabbitMQ delivers higher-priority
+  messages first. Publishers set the message priority, e.g. with
+  `submission_priority`; the worker keeps it when scheduling retries.
+- Worker fairness: a worker that prefetches more messages than it processes
+  at once picks the next one with `FairScheduler`, highest priority first and
+  round-robin across courses, so a burst from one course cannot take every slot.
+"""
+import os, json, time, threading
+from collections import OrderedDict, deque
+import config  # noqa: F401 (loads .env before the settings below are read)
+from metrics import SCHEDULER_WAIT, SCHEDULER_PENDING
+
+# Maximum message priority of the grading queue (x-max-priority); 0 keeps a plain FIFO queue.
+# RabbitMQ cannot change this on an existing queue: it has to be deleted and declared again.
+QUEUE_MAX_PRIORITY = int(os.getenv("QUEUE_MAX_PRIORITY", "0"))
+
+# Submissions whose due date is at most this many seconds away (or just past) are graded first
+PRIORITY_DEADLINE_WINDOW = float(os.getenv("PRIORITY_DEADLINE_WINDOW", str(6 * 3600)))
+
+# Priority levels, on a 0-10 scale (RabbitMQ treats values above x-max-priority as the maximum)
+PRIORITY_BULK = 1       # instructor-triggered regrades
+PRIORITY_DRAFT = 3      # drafts and other non-final submissions
+PRIORITY_NORMAL = 5     # submitted for grading
+PRIORITY_DEADLINE = 8   # submitted close to the due date
+
+
+def is_regrade(submission: dict) -> bool:
+    """Return True for an instructor-triggered regrade (a truthy "regrade" field)."""
+    return str(submission.get("regrade") or "").lower() in ("1", "true", "yes")
+
+
+def submission_priority(submission: dict, now: float | None = None) -> int:
+    """
+    Derive the priority of a submission message.
+
+    Bulk regrades (a truthy "regrade" field) come last; final submissions
+    ("status": "submitted") come before drafts, and those close to their
+    "duedate" (Unix time, optional) come first.
+
+    Args:
+        submission (dict): The parsed submission message.
+        now (float, optional): Current Unix time, for testing.
+
+    Returns:
+        int: One of the PRIORITY_* levels.
+    """
+    if is_regrade(submission):
+        return PRIORITY_BULK
+    if submission.get("status") != "submitted":
+        return PRIORITY_DRAFT
+
+    try:
+        due_date = float(submission.get("duedate") or 0)
+    except (TypeError, ValueError):
+        due_date = 0
+    now = time.time() if now is None else now
+    if due_date and -PRIORITY_DEADLINE_WINDOW <= due_date - now <= PRIORITY_DEADLINE_WINDOW:
+        return PRIORITY_DEADLINE
+    return PRIORITY_NORMAL
+
+
+def scheduling_key(body: bytes, message_priority: int | None = None) -> tuple[str | None, int]:
+    """
+    Read the fairness key and priority of a raw submission message.
+
+    Args:
+        body (bytes): The JSON-encoded submission data.
+        message_priority (int, optional): The AMQP priority set by the publisher, which takes precedence.
+
+    Returns:
+        tuple[str | None, int]: The course ID (None if unreadable) and the priority.
+    """
+    try:
+        submission = json.loads(body)
+    except (TypeError, ValueError):
+        submission = None
+    if not isinstance(submission, dict):
+        return None, PRIORITY_NORMAL if message_priority is None else message_priority
+    priority = submission_priority(submission) if message_priority is None else message_priority
+    return submission.get("courseid"), priority
+
+
+def queue_arguments() -> dict | None:
+    """Return the declaration arguments of the grading queue, or None for a plain queue."""
+    return {"x-max-priority": QUEUE_MAX_PRIORITY} if QUEUE_MAX_PRIORITY > 0 else None
+
+
+class FairScheduler:
+    """
+    Picks the next submission to grade among those prefetched by a worker.
+
+    Higher priorities always go first. Within a priority, courses take turns:
+    each course's submissions stay in arrival order, and after a course is
+    served it moves to the back of the rotation. Thread-safe.
+    """
+
+    def __init__(self):
+        self._levels = {}  # priority -> OrderedDict[course -> deque[(enqueued_at, item)]]
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, course, item, priority: int = PRIORITY_NORMAL) -> None:
+        """
+        Add a submission.
+
+        Args:
+            course: Fairness key, usually the message's "courseid".
+            item: Anything identifying the submission; returned by `get`.
+            priority (int, optional): Higher values are served first.
+        """
+        with self._lock:
+            courses = self._levels.setdefault(priority, OrderedDict())
+            courses.setdefault(course, deque()).append((time.monotonic(), item))
+            self._size += 1
+            SCHEDULER_PENDING.set(self._size)
+
+    def get(self):
+        """
+        Remove and return the next submission.
+
+        Returns:
+            The item passed to `put`, or None if nothing is waiting.
+        """
+        with self._lock:
+            if not self._size:
+                return None
+            priority = max(self._levels)
+            courses = self._levels[priority]
+            course, items = next(iter(courses.items()))
+            enqueued_at, item = items.popleft()
+            if items:
+                courses.move_to_end(course)
+            else:
+                del courses[course]
+                if not courses:
+                    del self._levels[priority]
+            self._size -= 1
+            SCHEDULER_PENDING.set(self._size)
+        SCHEDULER_WAIT.labels(str(priority)).observe(time.monotonic() - enqueued_at)
+        return item
+
+    def drain(self) -> list:
+        """
+        Remove and return everything still waiting, e.g. to requeue it on shutdown.
+
+        Returns:
+            list: The waiting items, highest priority first.
+        """
+        with self._lock:
+            items = [
+                item for priority in sorted(self._levels, reverse=True)
+                for queue in self._levels[priority].values() for _, item in queue
+            ]
+            self._levels.clear()
+            self._size = 0
+            SCHEDULER_PENDING.set(0)
+        return items
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,397 @@
+"""
+Local analysis of a submission before it is sent to the LLM.
+
+Python files are parsed with `ast` for their function and class signatures,
+syntax errors and cyclomatic complexity, and the names the activity
+instruction asks for are looked up among the definitions. Optionally the
+submission's own tests are run in a subprocess with time and memory limits.
+
+The result is rendered as a compact section of the prompt: the findings are
+always included, and when the token budget cannot fit a file's code, its
+outline (signatures and complexity) takes its place.
+"""
+import os, re, sys, ast, shutil, builtins, keyword, tempfile, posixpath, subprocess, importlib.util
+from file_filter import FileFilter
+from prompt_builder import estimate_tokens, code_section_parts
+
+# Limits of the submission's own test run
+TEST_TIMEOUT = float(os.getenv("STATIC_ANALYSIS_TEST_TIMEOUT", "30"))         # seconds, wall clock
+TEST_MEMORY_MB = int(os.getenv("STATIC_ANALYSIS_TEST_MEMORY_MB", "512"))      # address space of the test process
+
+# Functions at least this complex are called out in the findings
+COMPLEXITY_WARNING = 10
+
+# Output lines kept from a failed test run
+MAX_FAILURE_LINES = 10
+
+# Share of the code budget set aside for outlines when not all code fits
+OUTLINE_BUDGET_SHARE = 0.2
+
+ANALYSIS_HEADER = "#### Local Analysis (computed by the grading service)"
+
+# Sets the resource limits, then replaces itself with the test command, so no
+# code runs between fork and exec in the (multi-threaded) worker process
+_LIMITED_EXEC = """
+import os, sys, resource
+memory, cpu = int(sys.argv[1]), int(sys.argv[2])
+resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+resource.setrlimit(resource.RLIMIT_FSIZE, (10 * 1024 * 1024, 10 * 1024 * 1024))
+os.execv(sys.executable, [sys.executable] + sys.argv[3:])
+"""
+
+_BRANCH_NODES = (
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler,
+    ast.With, ast.AsyncWith, ast.Assert, ast.comprehension,
+) + ((ast.match_case,) if hasattr(ast, "match_case") else ())
+
+_BACKTICK_NAME = re.compile(r"`([A-Za-z_][A-Za-z0-9_.]*)(?:\(\))?`")
+_CALL_NAME = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\(")
+_SNAKE_NAME = re.compile(r"\b([a-z][a-z0-9]*(?:_[a-z0-9]+)+)\b")
+_TEST_FILE = re.compile(r"(^|/)(test_[^/]*|[^/]*_test)\.py$")
+_IGNORED_NAMES = set(dir(builtins)) | set(keyword.kwlist)
+
+
+def cyclomatic_complexity(node: ast.AST) -> int:
+    """
+    Compute the cyclomatic complexity of a function: one plus its decision points.
+
+    Nested functions and classes are measured on their own and do not count.
+    """
+    complexity = 1
+    stack = list(ast.iter_child_nodes(node))
+    while stack:
+        child = stack.pop()
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            continue
+        if isinstance(child, _BRANCH_NODES):
+            complexity += 1
+        elif isinstance(child, ast.BoolOp):
+            complexity += len(child.values) - 1
+        stack.extend(ast.iter_child_nodes(child))
+    return complexity
+
+
+def _signature(node: ast.FunctionDef | ast.AsyncFunctionDef) -> str:
+    """Render a function's signature, e.g. "def add(a, b=0) -> int"."""
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns is not None else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def _summary_line(node: ast.AST) -> str:
+    """Return the first line of a node's docstring, shortened."""
+    docstring = ast.get_docstring(node) or ""
+    line = docstring.strip().split("\n", 1)[0]
+    return line if len(line) <= 80 else f"{line[:77]}..."
+
+
+def _function_entry(node: ast.FunctionDef | ast.AsyncFunctionDef) -> dict:
+    return {"signature": _signature(node), "complexity": cyclomatic_complexity(node), "doc": _summary_line(node)}
+
+
+def analyze_python(path: str, content: str) -> dict:
+    """
+    Outline one Python file.
+
+    Args:
+        path (str): File path relative to the repository root.
+        content (str): The file's source code.
+
+    Returns:
+        dict: {"path", "lines", "syntax_error" (str | None), "functions": [{"signature",
+            "complexity", "doc"}], "classes": [{"name", "bases", "doc", "methods": [...]}],
+            "defined": [top-level names]}
+    """
+    result = {"path": path, "lines": content.count("\n") + 1, "syntax_error": None,
+              "functions": [], "classes": [], "defined": []}
+    try:
+        tree = ast.parse(content, filename=path)
+    except SyntaxError as e:
+        result["syntax_error"] = f"line {e.lineno}: {e.msg}"
+        return result
+    except ValueError as e:  # e.g. NUL bytes
+        result["syntax_error"] = str(e)
+        return result
+
+    defined = set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            result["functions"].append(_function_entry(node))
+            defined.add(node.name)
+        elif isinstance(node, ast.ClassDef):
+            methods = [child for child in node.body if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            result["classes"].append({
+                "name": node.name,
+                "bases": [ast.unparse(base) for base in node.bases],
+                "doc": _summary_line(node),
+                "methods": [_function_entry(method) for method in methods],
+            })
+            defined.add(node.name)
+            defined.update(f"{node.name}.{method.name}" for method in methods)
+            defined.update(method.name for method in methods)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            defined.update(target.id for target in targets if isinstance(target, ast.Name))
+    result["defined"] = sorted(defined)
+    return result
+
+
+def required_names(activity_instruction: str) -> list[str]:
+    """
+    Guess the identifiers an activity instruction asks the student to define.
+
+    Picks up names in backticks (`area` or `area()`), names written as calls
+    (area(r)) and snake_case words (compute_area), leaving out Python
+    keywords and builtins.
+
+    Args:
+        activity_instruction (str): The sanitized activity instruction.
+
+    Returns:
+        list[str]: The names, without duplicates.
+    """
+    text = activity_instruction or ""
+    names = []
+    for pattern in (_BACKTICK_NAME, _CALL_NAME, _SNAKE_NAME):
+        for match in pattern.finditer(text):
+            name = match.group(1)
+            if name not in _IGNORED_NAMES and name not in names:
+                names.append(name)
+    return names
+
+
+def find_tests(files: list[dict]) -> list[str]:
+    """Return the paths of pytest/unittest-style test files (test_*.py, *_test.py)."""
+    return [file.get("path") for file in files if _TEST_FILE.search(file.get("path") or "")]
+
+
+def run_tests(files: list[dict], timeout: float = TEST_TIMEOUT, memory_mb: int = TEST_MEMORY_MB) -> dict | None:
+    """
+    Run the submission's own tests in a subprocess.
+
+    The files are written to a temporary directory and the tests run with
+    pytest (or unittest if pytest is not installed) under a wall-clock
+    timeout, CPU and address-space limits, and an environment without the
+    worker's credentials. This limits runaway tests; it is not a security
+    boundary, so only enable it where the worker itself is isolated.
+
+    Args:
+        files (list[dict]): Files as returned by `GitHubRepository.get_files`.
+        timeout (float, optional): Seconds before the run is killed.
+        memory_mb (int, optional): Address-space limit of the test process.
+
+    Returns:
+        dict | None: {"runner", "exit_code", "passed", "failed", "errors",
+            "timed_out", "failures": [lines]}, or None if there are no tests.
+    """
+    if not find_tests(files):
+        return None
+
+    workdir = tempfile.mkdtemp(prefix="autograder-tests-")
+    try:
+        for file in files:
+            path = posixpath.normpath(file.get("path") or "")
+            if path.startswith(("/", "..")) or not path.endswith(".py"):
+                continue  # Only Python sources are needed, and nothing may land outside the directory
+            target = os.path.join(workdir, *path.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "w", encoding="utf-8") as f:
+                f.write(file.get("content") or "")
+
+        if importlib.util.find_spec("pytest") is not None:
+            runner, command = "pytest", ["-m", "pytest", "-q", "-rfE", "-p", "no:cacheprovider", "--no-header"]
+        else:
+            runner, command = "unittest", ["-m", "unittest", "discover", "-p", "*test*.py"]
+        limits = [str(memory_mb * 1024 * 1024), str(int(timeout) + 1)]
+        env = {
+            "PATH": os.environ.get("PATH", ""), "HOME": workdir, "LANG": "C.UTF-8",
+            "PYTHONDONTWRITEBYTECODE": "1", "PYTHONHASHSEED": "0",
+        }
+
+        process = subprocess.Popen(
+            [sys.executable, "-c", _LIMITED_EXEC, *limits, *command], cwd=workdir, env=env,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True
+        )
+        timed_out = False
+        try:
+            output, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            os.killpg(process.pid, 9)  # The tests may have started processes of their own
+            output, _ = process.communicate()
+        return _parse_test_output(runner, process.returncode, timed_out, output.decode("utf-8", errors="replace"))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _parse_test_output(runner: str, exit_code: int, timed_out: bool, output: str) -> dict:
+    """Extract counts and failing tests from pytest or unittest output."""
+    def count(pattern):
+        match = re.search(pattern, output)
+        return int(match.group(1)) if match else 0
+
+    if runner == "pytest":
+        passed, failed, errors = count(r"(\d+) passed"), count(r"(\d+) failed"), count(r"(\d+) errors?\b")
+        failures = [line for line in output.splitlines() if line.startswith(("FAILED ", "ERROR "))]
+    else:
+        failed, errors = count(r"failures=(\d+)"), count(r"errors=(\d+)")
+        passed = max(0, count(r"Ran (\d+) tests?") - failed - errors)
+        failures = [line for line in output.splitlines() if line.startswith(("FAIL: ", "ERROR: "))]
+    return {
+        "runner": runner, "exit_code": exit_code, "timed_out": timed_out,
+        "passed": passed, "failed": failed, "errors": errors,
+        "failures": [line[:200] for line in failures[:MAX_FAILURE_LINES]],
+    }
+
+
+def analyze_submission(files: list[dict], activity_instruction: str = "", with_tests: bool = False) -> dict:
+    """
+    Analyze a submission's Python files and optionally run its tests.
+
+    Args:
+        files (list[dict]): Files as returned by `GitHubRepository.get_files`.
+        activity_instruction (str, optional): Used to check for required names.
+        with_tests (bool, optional): Run the submission's own tests (see `run_tests`).
+
+    Returns:
+        dict: {"files": [`analyze_python` results], "required": {"found", "missing"},
+            "tests": `run_tests` result or None}
+    """
+    outlines = [
+        analyze_python(file.get("path"), file.get("content") or "")
+        for file in files if (file.get("path") or "").endswith(".py")
+    ]
+    defined = {name for outline in outlines for name in outline["defined"]}
+    names = required_names(activity_instruction) if outlines else []
+    return {
+        "files": outlines,
+        "required": {
+            "found": [name for name in names if name in defined],
+            "missing": [name for name in names if name not in defined],
+        },
+        "tests": run_tests(files) if with_tests else None,
+    }
+
+
+def format_findings(analysis: dict) -> str:
+    """
+    Render the submission-wide findings: missing names, syntax errors, complex functions and test results.
+
+    Returns:
+        str: A short Markdown block, always included in the prompt.
+    """
+    lines = [f"\n\n{ANALYSIS_HEADER}"]
+    required = analysis["required"]
+    if required["found"] or required["missing"]:
+        lines.append(f"- Names from the instructions defined: {', '.join(required['found']) or 'none'}; "
+                     f"not found: {', '.join(required['missing']) or 'none'}")
+    for outline in analysis["files"]:
+        if outline["syntax_error"]:
+            lines.append(f"- Syntax error in {outline['path']}, {outline['syntax_error']}")
+        functions = outline["functions"] + [method for cls in outline["classes"] for method in cls["methods"]]
+        for function in functions:
+            if function["complexity"] >= COMPLEXITY_WARNING:
+                lines.append(f"- High complexity ({function['complexity']}) in {outline['path']}: {function['signature']}")
+
+    tests = analysis.get("tests")
+    if tests is not None:
+        status = "timed out" if tests["timed_out"] else f"exit code {tests['exit_code']}"
+        lines.append(f"- The student's tests ({tests['runner']}, {status}): {tests['passed']} passed, "
+                     f"{tests['failed']} failed, {tests['errors']} errors")
+        lines.extend(f"  - {failure}" for failure in tests["failures"])
+    if len(lines) == 1:
+        lines.append("- No syntax errors found.")
+    return "\n".join(lines) + "\n"
+
+
+def format_outlines(analysis: dict, paths: list[str], token_budget: int | None = None) -> tuple[str, list[str]]:
+    """
+    Render the outline of the given files, to stand in for code left out of the prompt.
+
+    Args:
+        analysis (dict): Result of `analyze_submission`.
+        paths (list[str]): Files to outline, most relevant first.
+        token_budget (int, optional): Maximum estimated tokens for the block. Outlines that
+            do not fit are skipped. None means unlimited.
+
+    Returns:
+        tuple[str, list[str]]: A Markdown block of signatures with their complexity
+            ("" if no outline applies) and the paths it covers.
+    """
+    outlines = {outline["path"]: outline for outline in analysis["files"]}
+    header, footer = "\n\n#### Outline of Files Not Shown in Full\n```\n", "```\n"
+    used = estimate_tokens(header + footer)
+    blocks, outlined = [], []
+    for path in paths:
+        outline = outlines.get(path)
+        if outline is None:
+            continue
+        lines = [f"{path} ({outline['lines']} lines)"]
+        if outline["syntax_error"]:
+            lines.append(f"  syntax error, {outline['syntax_error']}")
+        for cls in outline["classes"]:
+            bases = f"({', '.join(cls['bases'])})" if cls["bases"] else ""
+            lines.append(f"  class {cls['name']}{bases}" + (f"  # {cls['doc']}" if cls["doc"] else ""))
+            lines.extend(f"    {_format_function(method)}" for method in cls["methods"])
+        lines.extend(f"  {_format_function(function)}" for function in outline["functions"])
+        block = "\n".join(lines) + "\n"
+        tokens = estimate_tokens(block)
+        if token_budget is not None and used + tokens > token_budget:
+            continue
+        used += tokens
+        blocks.append(block)
+        outlined.append(path)
+    if not blocks:
+        return "", []
+    return header + "".join(blocks) + footer, outlined
+
+
+def _format_function(function: dict) -> str:
+    doc = f"; {function['doc']}" if function["doc"] else ""
+    return f"{function['signature']}  # complexity {function['complexity']}{doc}"
+
+
+def analysis_section_parts(analysis: dict, files: list[dict], activity_instruction: str = "",
+                           token_budget: int | None = None,
+                           file_filter: FileFilter | None = None) -> tuple[list[str], dict]:
+    """
+    Select the pieces of the "Student Code" part of the prompt, with the analysis.
+
+    The findings always come after the code and are taken off the budget first.
+    When code does not fit, up to OUTLINE_BUDGET_SHARE of the rest is set aside
+    for outlines of the files left out (dropped or truncated by
+    `code_section_parts`), most relevant first; outlines that still do not fit
+    are skipped, so the section never exceeds the budget.
+
+    Args:
+        analysis (dict): Result of `analyze_submission`.
+        files (list[dict]): Files as returned by `GitHubRepository.get_files`.
+        activity_instruction (str, optional): Used to rank files by relevance.
+        token_budget (int, optional): Maximum estimated tokens for the section. None means unlimited.
+        file_filter (FileFilter, optional): Rules for skipping files. None keeps every file.
+
+    Returns:
+        tuple[list[str], dict]: The pieces of the section and a report in the format of
+            `code_section_parts`, plus "outlined": [path, ...].
+    """
+    findings = format_findings(analysis)
+    code_budget = None if token_budget is None else max(0, token_budget - estimate_tokens(findings))
+    parts, report = code_section_parts(files, activity_instruction, code_budget, file_filter)
+    outlines, outlined = "", []
+    if code_budget is not None and _left_out(report):
+        # Give outlines a share of the budget; this may leave out more code, which is outlined too
+        reserve = int(code_budget * OUTLINE_BUDGET_SHARE)
+        parts, report = code_section_parts(files, activity_instruction, code_budget - reserve, file_filter)
+        outlines, outlined = format_outlines(analysis, _left_out(report), code_budget - report["tokens"])
+
+    report["tokens"] += estimate_tokens(findings + outlines)
+    report["outlined"] = outlined
+    return [*parts, findings, outlines], report
+
+
+def _left_out(report: dict) -> list[str]:
+    """Return the files `code_section_parts` truncated or dropped for the budget, most relevant first."""
+    truncated = set(report["truncated"])
+    dropped = [dropped["path"] for dropped in report["dropped"] if dropped["reason"] == "token_budget"]
+    return [path for path in report["included"] if path in truncated] + dropped
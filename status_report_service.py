@@ -1,9 +1,11 @@
 import requests, os
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING
+from http_client import get_session
+import config  # noqa: F401 (loads .env before the settings below are read)
 from datetime import datetime
 
-# Load environment variables from .env file
-load_dotenv()
+if TYPE_CHECKING:
+    import httpx
 
 # Get Supabase API credentials from environment variables
 SUPABASE_API_URL = os.getenv('SUPABASE_API_URL')
@@ -18,36 +20,30 @@ class StatusReportService:
     """
 
     @staticmethod
-    def send_report(submission: dict, status: str, details: str = ""):
+    def build_headers() -> dict:
+        """Return the Supabase request headers."""
+        return {
+            "apiKey": SUPABASE_API_KEY,
+            'Content-Type': 'application/json'
+        }
+
+    @staticmethod
+    def build_request(submission: dict, status: str, details: str = "") -> tuple[dict, dict]:
         """
-        Sends a status report to the Supabase API.
+        Validate the inputs and build the headers and JSON payload of a status report.
 
         Args:
             submission (dict): A dictionary containing submission metadata and assignment details.
             status (str): The current autograde status (e.g., "success", "failed", "pending").
             details (str, optional): Optional text providing additional information about the status.
 
-        Raises:
-            requests.HTTPError: If the API request fails or returns a non-200 response.
+        Returns:
+            tuple[dict, dict]: The request headers and the JSON payload.
 
-        Example:
-            submission = {
-                "submissionid": 123,
-                "userid": 45,
-                "status": "submitted",
-                "courseid": 10,
-                "cmid": 43,
-                "assignmentid": 55,
-                "assignmentname": "Basic Programming",
-                "assignmentintro": "Intro assignment for Python basics",
-                "assignmentactivity": "Write three simple Python programs",
-                "onlinetext": "https://github.com/student/basic-programming-project",
-                "timecreated": "1761309698"
-            }
-
-            StatusReportService.send_report(submission, status="success", details="Autograde completed successfully.")
+        Raises:
+            ValueError: If configuration or required submission fields are missing.
+            TypeError: If an argument has the wrong type.
         """
-
         # --- Basic Input Validation ---
         if not SUPABASE_API_URL or not SUPABASE_API_KEY:
             raise ValueError("Missing Supabase configuration. Check your .env file.")
@@ -74,10 +70,7 @@ class StatusReportService:
 
 
         # request headers
-        headers = {
-            "apiKey": SUPABASE_API_KEY,
-            'Content-Type': 'application/json'
-        }
+        headers = StatusReportService.build_headers()
 
         # Prepare the payload using data extracted from the submission dictionary
 
@@ -98,8 +91,83 @@ class StatusReportService:
             "autograde_status_details": details
         }
 
+        return headers, payload
+
+    @staticmethod
+    def send_report(submission: dict, status: str, details: str = ""):
+        """
+        Sends a status report to the Supabase API.
+
+        Args:
+            submission (dict): A dictionary containing submission metadata and assignment details.
+            status (str): The current autograde status (e.g., "success", "failed", "pending").
+            details (str, optional): Optional text providing additional information about the status.
+
+        Raises:
+            requests.HTTPError: If the API request fails or returns a non-200 response.
+
+        Example:
+            submission = {
+                "submissionid": 123,
+                "userid": 45,
+                "status": "submitted",
+                "courseid": 10,
+                "cmid": 43,
+                "assignmentid": 55,
+                "assignmentname": "Basic Programming",
+                "assignmentintro": "Intro assignment for Python basics",
+                "assignmentactivity": "Write three simple Python programs",
+                "onlinetext": "https://github.com/student/basic-programming-project",
+                "timecreated": "1761309698"
+            }
+
+            StatusReportService.send_report(submission, status="success", details="Autograde completed successfully.")
+        """
+
+        headers, payload = StatusReportService.build_request(submission, status, details)
+
         # Send the HTTP POST request to the Supabase API
-        response = requests.post(f"{SUPABASE_API_URL}/autograde_worker_log", json=payload, headers=headers)
+        response = get_session("supabase").post(f"{SUPABASE_API_URL}/autograde_worker_log", json=payload, headers=headers)
         if not response.ok:
             raise requests.HTTPError(f"Supabase API request failed: {response.status_code} - {response.text}")
-        
\ No newline at end of file
+
+    @staticmethod
+    async def send_report_async(submission: dict, status: str, details: str = "", *, client: "httpx.AsyncClient"):
+        """
+        Asynchronous version of `send_report` for the asyncio worker.
+
+        Args:
+            submission (dict): A dictionary containing submission metadata and assignment details.
+            status (str): The current autograde status (e.g., "success", "failed", "pending").
+            details (str, optional): Optional text providing additional information about the status.
+            client (httpx.AsyncClient): Shared client whose connection pool is reused across reports.
+
+        Raises:
+            requests.HTTPError: If the API request fails or returns a non-200 response.
+        """
+        headers, payload = StatusReportService.build_request(submission, status, details)
+
+        response = await client.post(f"{SUPABASE_API_URL}/autograde_worker_log", json=payload, headers=headers)
+        if not response.is_success:
+            raise requests.HTTPError(f"Supabase API request failed: {response.status_code} - {response.text}")
+
+    @staticmethod
+    def send_reports(payloads: list[dict]) -> None:
+        """
+        Insert several status reports with a single PostgREST bulk insert.
+
+        Args:
+            payloads (list[dict]): Report payloads as built by `build_request`.
+
+        Raises:
+            ValueError: If the Supabase configuration is missing.
+            requests.HTTPError: If the API request fails or returns a non-200 response.
+        """
+        if not SUPABASE_API_URL or not SUPABASE_API_KEY:
+            raise ValueError("Missing Supabase configuration. Check your .env file.")
+
+        # A JSON array inserts every row in one request; minimal return skips echoing them back
+        headers = {**StatusReportService.build_headers(), "Prefer": "return=minimal"}
+        response = get_session("supabase").post(f"{SUPABASE_API_URL}/autograde_worker_log", json=payloads, headers=headers)
+        if not response.ok:
+            raise requests.HTTPError(f"Supabase API request failed: {response.status_code} - {response.text}", response=response)
@@ -0,0 +1,202 @@
+import os, json, time, logging, threading
+from status_report_service import StatusReportService
+from metrics import track_stage, STATUS_REPORTS_PENDING, STATUS_REPORTS_DROPPED
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedStatusReporter:
+    """
+    Sends Autograder Dashboard status reports from a background thread.
+
+    Reports are validated and queued immediately, then written to Supabase in
+    bulk (one PostgREST insert of a JSON array) every `batch_size` reports or
+    `flush_interval` seconds, whichever comes first. Failed flushes are retried
+    with exponential backoff, so a slow or unavailable dashboard neither delays
+    grading nor causes submissions to be requeued. A batch Supabase rejects
+    outright (a 4xx other than auth or rate limiting) is split to isolate the
+    offending reports, which are logged and dropped instead of blocking the rest.
+
+    Pending reports are also appended to a local journal file, which is replayed
+    on startup, so reports queued before a crash or restart are not lost. Use one
+    journal file per worker process.
+    """
+
+    def __init__(self, journal_path: str | None = None, batch_size: int = 50, flush_interval: float = 5.0,
+                 max_pending: int = 10000, max_retry_delay: float = 60.0):
+        """
+        Args:
+            journal_path (str, optional): JSON-lines file holding unsent reports. None keeps them in memory only.
+            batch_size (int, optional): Pending reports that trigger a flush, and the maximum per request.
+            flush_interval (float, optional): Maximum seconds a report waits before being flushed.
+            max_pending (int, optional): Reports kept while Supabase is unreachable; the oldest are dropped beyond this.
+            max_retry_delay (float, optional): Upper bound in seconds of the backoff between failed flushes.
+        """
+        self.journal_path = journal_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retry_delay = max_retry_delay
+
+        self._pending = self._load_journal()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closing = False
+        STATUS_REPORTS_PENDING.set(len(self._pending))
+
+    def start(self) -> None:
+        """Start the background flusher. Called automatically by the first `report`."""
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-reporter", daemon=True)
+                self._thread.start()
+                if self._pending:
+                    logger.info("📝 Replaying %d unsent status reports from %s.", len(self._pending), self.journal_path)
+
+    def report(self, submission: dict, status: str, details: str = "") -> None:
+        """
+        Queue a status report for the next bulk insert.
+
+        Args:
+            submission (dict): A dictionary containing submission metadata and assignment details.
+            status (str): The current autograde status (e.g., "success", "fail").
+            details (str, optional): Optional text providing additional information about the status.
+
+        Raises:
+            ValueError: If configuration or required submission fields are missing.
+            TypeError: If an argument has the wrong type.
+        """
+        _, payload = StatusReportService.build_request(submission, status, details)
+        self.start()
+        with self._condition:
+            self._pending.append(payload)
+            self._append_journal(payload)
+            if len(self._pending) > self.max_pending:
+                dropped = len(self._pending) - self.max_pending
+                del self._pending[:dropped]
+                self._rewrite_journal()
+                STATUS_REPORTS_DROPPED.labels("overflow").inc(dropped)
+                logger.error("📝 Status report buffer full; dropped the %d oldest reports.", dropped)
+            STATUS_REPORTS_PENDING.set(len(self._pending))
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Flush what is pending and stop the background thread.
+
+        Reports that still cannot be sent stay in the journal for the next start.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the final flush.
+        """
+        with self._condition:
+            self._closing = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        """Flush whenever a batch is full, the interval elapses, or the reporter closes."""
+        retry_delay = 0.0
+        while True:
+            with self._condition:
+                if not self._closing:
+                    wait = retry_delay or self.flush_interval
+                    if retry_delay or len(self._pending) < self.batch_size:
+                        self._condition.wait(wait)
+                batch = self._pending[:self.batch_size]
+                closing = self._closing
+
+            if batch:
+                settled, error = self._deliver(batch)
+                if settled:
+                    # By identity: the overflow trim may have removed reports from the front meanwhile
+                    settled_ids = {id(payload) for payload in settled}
+                    with self._condition:
+                        self._pending = [payload for payload in self._pending if id(payload) not in settled_ids]
+                        self._rewrite_journal()
+                        STATUS_REPORTS_PENDING.set(len(self._pending))
+                    logger.debug("📝 Settled %d status reports for Autograder Dashboard.", len(settled))
+
+                if error is not None:
+                    retry_delay = min(self.max_retry_delay, max(1.0, retry_delay * 2))
+                    logger.warning("📝 Failed to send %d status reports, retrying in %.0fs: %s",
+                                   len(batch) - len(settled), retry_delay, error)
+                    if closing:
+                        return  # Leave them in the journal for the next start
+                    continue
+                retry_delay = 0.0
+
+            with self._condition:
+                if self._closing and not self._pending:
+                    return
+
+    def _deliver(self, batch: list[dict]) -> tuple[list[dict], Exception | None]:
+        """
+        Insert a batch, splitting it to isolate reports Supabase rejects.
+
+        Returns:
+            tuple[list[dict], Exception | None]: The reports settled (inserted, or dropped as
+                rejected), and the error that stopped delivery of the rest, if any.
+        """
+        try:
+            with track_stage("status_report_flush"):
+                StatusReportService.send_reports(batch)
+            return batch, None
+        except Exception as e:
+            if not _is_rejected(e):
+                return [], e
+            if len(batch) == 1:
+                STATUS_REPORTS_DROPPED.labels("rejected").inc()
+                logger.error("📝 Dropping status report of submission %s rejected by Supabase: %s",
+                             batch[0].get("submission_id"), e)
+                return batch, None
+
+        middle = len(batch) // 2
+        settled, error = self._deliver(batch[:middle])
+        if error is not None:
+            return settled, error
+        rest, error = self._deliver(batch[middle:])
+        return settled + rest, error
+
+    def _load_journal(self) -> list[dict]:
+        """Read reports left unsent by a previous run."""
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return []
+        pending = []
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    pending.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # A line cut short by a crash
+        return pending[-self.max_pending:]
+
+    def _append_journal(self, payload: dict) -> None:
+        if not self.journal_path:
+            return
+        try:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload) + "\n")
+        except OSError as e:
+            logger.warning("📝 Failed to journal status report: %s", e)
+
+    def _rewrite_journal(self) -> None:
+        """Replace the journal with the reports still pending (atomic)."""
+        if not self.journal_path:
+            return
+        tmp_path = f"{self.journal_path}.{time.time_ns()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(payload) + "\n" for payload in self._pending)
+            os.replace(tmp_path, self.journal_path)
+        except OSError as e:
+            logger.warning("📝 Failed to rewrite status report journal: %s", e)
+
+
+def _is_rejected(error: Exception) -> bool:
+    """Return True if Supabase refused the request itself, so sending it again cannot succeed."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status not in (401, 403, 408, 429)
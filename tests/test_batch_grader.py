@@ -0,0 +1,113 @@
+import re, json, time, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+from batch_grader import BatchGrader
+from grader_backends import LLMResponse
+
+
+class FakeBackend:
+    """Answers a batch prompt with a review for each submission key, or fails when told to."""
+
+    def __init__(self, fail: bool = False, skip: tuple = ()):
+        self.fail = fail
+        self.skip = skip
+        self.calls = []
+
+    def generate(self, prompt, json_output=False):
+        self.calls.append(threading.current_thread().name)
+        if self.fail:
+            raise RuntimeError("provider down")
+        reviews = {key: {"feedback_comment": code}
+                   for key, code in re.findall(r"=== SUBMISSION (\w+) ===\n(.*)", prompt) if key not in self.skip}
+        return LLMResponse(json.dumps(reviews), backend="fake")
+
+
+class FakeGrader:
+    def __init__(self, backend, code, prefix_key="assignment-1"):
+        self.backend = backend
+        self.code_content = code
+        self.prefix_key = prefix_key
+        self.prompt_prefix = "Grade this."
+        self.graded_alone_on = None
+
+    def get_cached_review(self):
+        return None
+
+    def parse_response_text(self, text):
+        return json.loads(text)
+
+    def validate_review(self, review):
+        return []
+
+    def store_review(self, review, backend_name=None):
+        pass
+
+    def get_structured_review(self):
+        self.graded_alone_on = threading.current_thread().name
+        return {"feedback_comment": f"alone: {self.code_content}"}
+
+    async def get_structured_review_async(self):
+        self.graded_alone_on = "event loop"
+        return {"feedback_comment": f"alone: {self.code_content}"}
+
+
+def grade_concurrently(batch_grader, graders):
+    with ThreadPoolExecutor(len(graders), thread_name_prefix="worker") as pool:
+        return list(pool.map(batch_grader.grade, graders))
+
+
+def test_full_batch_is_graded_in_one_call():
+    backend = FakeBackend()
+    graders = [FakeGrader(backend, f"code {i}") for i in range(3)]
+    reviews = grade_concurrently(BatchGrader(window_seconds=5, max_batch_size=3), graders)
+    assert reviews == [{"feedback_comment": f"code {i}"} for i in range(3)]
+    assert len(backend.calls) == 1
+
+
+def test_failed_batch_hands_each_submission_back_to_its_worker():
+    backend = FakeBackend(fail=True)
+    graders = [FakeGrader(backend, f"code {i}") for i in range(3)]
+    reviews = grade_concurrently(BatchGrader(window_seconds=5, max_batch_size=3), graders)
+    assert reviews == [{"feedback_comment": f"alone: code {i}"} for i in range(3)]
+    assert len({grader.graded_alone_on for grader in graders}) == 3  # Each on its own worker thread
+
+
+def test_submission_missing_from_the_answer_is_graded_alone():
+    backend = FakeBackend(skip=("submission_2",))
+    graders = [FakeGrader(backend, f"code {i}") for i in range(2)]
+    reviews = grade_concurrently(BatchGrader(window_seconds=5, max_batch_size=2), graders)
+    assert reviews == [{"feedback_comment": "code 0"}, {"feedback_comment": "alone: code 1"}]
+    assert graders[0].graded_alone_on is None and graders[1].graded_alone_on.startswith("worker")
+
+
+def test_window_flushes_a_partial_batch():
+    backend = FakeBackend()
+    batch_grader = BatchGrader(window_seconds=0.1, max_batch_size=8)
+    started = time.monotonic()
+    reviews = grade_concurrently(batch_grader, [FakeGrader(backend, "a"), FakeGrader(backend, "b")])
+    assert reviews == [{"feedback_comment": "a"}, {"feedback_comment": "b"}]
+    assert time.monotonic() - started >= 0.1
+
+
+def test_early_flush_does_not_cut_the_next_window_short():
+    backend = FakeBackend()
+    batch_grader = BatchGrader(window_seconds=0.4, max_batch_size=2)
+    first = [batch_grader.submit(FakeGrader(backend, code)) for code in ("a", "b")]  # Full: flushed at once
+    assert all(future.done() for future in first)
+
+    time.sleep(0.2)
+    late = batch_grader.submit(FakeGrader(backend, "c"))
+    time.sleep(0.35)  # The first batch's window has passed, the late one's has not
+    assert not late.done()
+    assert late.result(timeout=2) is None  # Alone in its window: its worker grades it
+
+
+def test_grade_async_grades_a_failed_batch_with_the_async_api():
+    backend = FakeBackend(fail=True)
+    graders = [FakeGrader(backend, f"code {i}") for i in range(2)]
+    batch_grader = BatchGrader(window_seconds=5, max_batch_size=2)
+
+    async def grade_all():
+        return await asyncio.gather(*(batch_grader.grade_async(grader) for grader in graders))
+
+    assert asyncio.run(grade_all()) == [{"feedback_comment": f"alone: code {i}"} for i in range(2)]
+    assert [grader.graded_alone_on for grader in graders] == ["event loop", "event loop"]
@@ -0,0 +1,69 @@
+import pytest
+from file_filter import FileFilter
+
+
+@pytest.mark.parametrize("path, reason", [
+    ("src/main.py", None),
+    ("node_modules/react/index.js", "excluded_dir"),
+    ("app/venv/lib/site.py", "excluded_dir"),
+    ("assets/logo.PNG", "excluded_type"),
+    ("static/app.min.js", "excluded_type"),
+    ("package-lock.json", "excluded_type"),
+    ("web/yarn.lock", "excluded_type"),
+])
+def test_default_rules(path, reason):
+    assert FileFilter().exclusion_reason(path) == reason
+
+
+def test_size_limit():
+    file_filter = FileFilter(max_file_bytes=100)
+    assert file_filter.exclusion_reason("a.py", 100) is None
+    assert file_filter.exclusion_reason("a.py", 101) == "too_large"
+    assert file_filter.exclusion_reason("a.py") is None  # Size unknown before the listing
+    assert FileFilter(max_file_bytes=None).should_include("a.py", 10 ** 9)
+
+
+@pytest.mark.parametrize("pattern, path, excluded", [
+    # A bare name or glob matches any path component
+    ("*.log", "debug.log", True),
+    ("*.log", "logs/2024/run.log", True),
+    ("*.log", "catalog.py", False),
+    ("secrets", "config/secrets/key.py", True),
+    # A trailing slash only matches directories
+    ("docs/", "docs/index.md", True),
+    ("docs/", "src/docs/notes.md", True),
+    ("docs/", "docs", False),
+    # Patterns with a slash are anchored at the repository root
+    ("src/generated", "src/generated/api.py", True),
+    ("src/generated", "lib/src/generated/api.py", False),
+    ("/setup.py", "setup.py", True),
+    ("/setup.py", "pkg/setup.py", False),
+    # "**" spans any number of directories, including none
+    ("data/**/*.json", "data/raw/2024/points.json", True),
+    ("data/**/*.json", "data/points.json", True),
+    ("data/**/*.json", "src/data/points.json", False),
+    ("**/fixtures", "tests/unit/fixtures/a.py", True),
+])
+def test_patterns(pattern, path, excluded):
+    assert FileFilter().should_include(path)
+    assert FileFilter(exclude_patterns=[pattern]).should_include(path) != excluded
+
+
+def test_excluded_dirs_are_pruned_before_listing():
+    file_filter = FileFilter.from_settings(0, "build-output/, docs/")
+    assert file_filter.is_excluded_dir("frontend/node_modules")
+    assert file_filter.is_excluded_dir("docs")
+    assert file_filter.is_excluded_dir("build-output/")
+    assert not file_filter.is_excluded_dir("src/app")
+
+
+def test_is_binary():
+    assert FileFilter.is_binary(b"\x89PNG\r\n\x1a\n\0\0")
+    assert FileFilter.is_binary("text\0more")
+    assert not FileFilter.is_binary("def f():\n    return 'ü'\n")
+
+
+def test_fingerprint_changes_with_the_rules():
+    assert FileFilter().fingerprint() == FileFilter().fingerprint()
+    assert FileFilter().fingerprint() != FileFilter(exclude_patterns=["*.md"]).fingerprint()
+    assert FileFilter().fingerprint() != FileFilter(max_file_bytes=10).fingerprint()
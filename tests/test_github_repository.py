@@ -0,0 +1,166 @@
+import io, time, asyncio, tarfile, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+import github_repository
+from benchmarks.fake_services import FakeGitHubServer
+from file_filter import FileFilter
+from github_repository import GitHubRepository, FETCH_MODE_CONTENTS, FETCH_MODE_TARBALL
+
+REPO_URL = "https://github.com/alice/homework"
+
+
+@pytest.fixture(scope="module")
+def github():
+    server = FakeGitHubServer(files_per_repo=20, file_size=500).start()
+    yield server
+    server.stop()
+
+
+def make_tarball(files: dict[str, bytes]) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        directory = tarfile.TarInfo("alice-homework-abc1234")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for path, data in files.items():
+            info = tarfile.TarInfo(f"alice-homework-abc1234/{path}")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+    return buffer
+
+
+def test_tarball_and_contents_modes_return_the_same_files(github):
+    by_mode = {}
+    for mode in (FETCH_MODE_CONTENTS, FETCH_MODE_TARBALL):
+        repo = GitHubRepository(REPO_URL, fetch_mode=mode, api_url=github.url)
+        by_mode[mode] = {file["path"]: file["content"] for file in repo.get_files()}
+
+    assert len(by_mode[FETCH_MODE_TARBALL]) == 20
+    assert by_mode[FETCH_MODE_TARBALL] == by_mode[FETCH_MODE_CONTENTS]
+
+
+def test_byte_cap_keeps_the_same_files_in_every_mode(github):
+    kept = []
+    for mode in (FETCH_MODE_CONTENTS, FETCH_MODE_TARBALL):
+        repo = GitHubRepository(REPO_URL, fetch_mode=mode, api_url=github.url, max_total_bytes=4000)
+        files = repo.get_files()
+        assert sum(file["size"] for file in files) <= 4000
+        assert {skip["reason"] for skip in repo.skipped_files} == {"repo_too_large"}
+        kept.append(sorted(file["path"] for file in files))
+
+    async def fetch_async():
+        repo = GitHubRepository(REPO_URL, api_url=github.url, max_total_bytes=4000)
+        async with httpx.AsyncClient() as client:
+            return await repo.get_files_async(client)
+
+    kept.append(sorted(file["path"] for file in asyncio.run(fetch_async())))
+    assert kept[0] == kept[1] == kept[2]
+
+
+def test_extract_tarball_strips_the_top_level_directory_and_filters():
+    repo = GitHubRepository(REPO_URL, file_filter=FileFilter(max_file_bytes=1000))
+    archive = make_tarball({
+        "main.py": b"print('hello')\n",
+        "src/util.py": b"def f():\n    return 1\n",
+        "node_modules/lib/index.js": b"module.exports = 1\n",
+        "logo.png": b"\x89PNG",
+        "data.txt": b"\0\1\2\3",
+        "big.py": b"x" * 2000,
+    })
+
+    files = repo._extract_tarball(archive)
+
+    assert [file["path"] for file in files] == ["main.py", "src/util.py"]
+    assert files[1] == {"name": "util.py", "path": "src/util.py", "size": 22, "content": "def f():\n    return 1\n"}
+    assert {skip["path"]: skip["reason"] for skip in repo.skipped_files} == {
+        "node_modules/lib/index.js": "excluded_dir",
+        "logo.png": "excluded_type",
+        "data.txt": "binary",
+        "big.py": "too_large",
+    }
+
+
+def test_changed_files_are_filtered_after_download():
+    contents = {"a.py": "print(1)\n", "big.py": "x" * 2000, "blob.py": "\0\1", "gone.py": None}
+
+    class Response:
+        status_code = 200
+
+        def __init__(self, path):
+            self.path = path
+
+        def json(self):
+            return {"name": self.path, "path": self.path, "size": len(contents[self.path]),
+                    "content": contents[self.path]}
+
+    repo = GitHubRepository(REPO_URL, file_filter=FileFilter(max_file_bytes=1000))
+    repo._get = lambda url, **kwargs: Response(url.rsplit("/", 1)[1])
+    changes = [{"filename": path, "status": "removed" if content is None else "modified"}
+               for path, content in contents.items()]
+
+    files = repo.get_changed_files(changes, "abc1234")
+
+    assert [file["path"] for file in files] == ["a.py"]
+    assert repo.skipped_files == [{"path": "big.py", "reason": "too_large"}, {"path": "blob.py", "reason": "binary"}]
+
+
+class RateLimitedHandler(BaseHTTPRequestHandler):
+    """Answers 429 with the class's Retry-After for the first `limited` requests, then 200."""
+
+    retry_after = "3600"
+    limited = 1
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests += 1
+        limited = cls.requests <= cls.limited
+        body = b'{"message": "secondary rate limit"}' if limited else b"{}"
+        self.send_response(429 if limited else 200)
+        if limited:
+            self.send_header("Retry-After", cls.retry_after)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def rate_limited(monkeypatch):
+    monkeypatch.setattr(github_repository, "_rate_limited_until", 0.0)
+    handler = type("Handler", (RateLimitedHandler,), {})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_rate_limit_longer_than_the_cap_fails_fast(rate_limited):
+    handler, url = rate_limited
+    handler.limited = 100
+    repo = GitHubRepository(REPO_URL, api_url=url)
+
+    started = time.monotonic()
+    response = repo._get(f"{repo.api_base}/commits/HEAD")
+
+    assert response.status_code == 429
+    assert time.monotonic() - started < github_repository.RATE_LIMIT_MAX_WAIT
+    assert handler.requests == 1  # Not retried inside the HTTP session either
+
+
+def test_short_rate_limit_is_waited_out(rate_limited):
+    handler, url = rate_limited
+    handler.retry_after = "1"
+    repo = GitHubRepository(REPO_URL, api_url=url)
+
+    started = time.monotonic()
+    response = repo._get(f"{repo.api_base}/commits/HEAD")
+
+    assert response.status_code == 200
+    assert 1 <= time.monotonic() - started < 5
+    assert handler.requests == 2
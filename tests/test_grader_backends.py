@@ -0,0 +1,103 @@
+import time
+import pytest
+import grader_backends
+from grader_backends import GraderBackend, JsonObjectScanner, LLMResponse, LLMTimeoutError, TokenBucketLimiter
+
+
+def scan(*chunks):
+    scanner = JsonObjectScanner()
+    for chunk in chunks:
+        end = scanner.feed(chunk)
+        if end is not None:
+            return end
+    return None
+
+
+def test_scanner_finds_the_end_of_the_first_object():
+    text = '```json\n{"a": {"b": [1, 2]}, "c": 3}\n```\nanything after'
+    assert text[:scan(text)] == '```json\n{"a": {"b": [1, 2]}, "c": 3}'
+
+
+def test_scanner_ignores_braces_and_escaped_quotes_in_strings():
+    text = '{"remark": "use {} and \\"}\\" carefully", "x": "\\\\"} trailing'
+    assert text[:scan(text)] == '{"remark": "use {} and \\"}\\" carefully", "x": "\\\\"}'
+
+
+def test_scanner_counts_offsets_across_chunks():
+    chunks = ['Here it is: {"a', '": "}"', ', "b": {}', "}", " bye"]
+    end = scan(*chunks)
+    assert "".join(chunks)[:end] == 'Here it is: {"a": "}", "b": {}}'
+
+
+def test_scanner_waits_for_an_unfinished_object():
+    assert scan('{"a": {"b": 1}', ', "c": "{"') is None
+    assert scan("no object at all }") is None
+
+
+def test_limiter_without_quota_never_waits():
+    limiter = TokenBucketLimiter()
+    assert all(limiter.acquire(10 ** 6) == 0 for _ in range(100))
+
+
+def test_limiter_waits_for_the_token_bucket_to_refill():
+    limiter = TokenBucketLimiter(tokens_per_minute=600)  # 10 tokens per second
+    assert limiter.acquire(600) == 0  # A full bucket admits a whole minute's worth at once
+    started = time.monotonic()
+    waited = limiter.acquire(3)
+    assert 0.2 <= waited <= time.monotonic() - started + 0.01
+
+
+def test_limiter_admits_a_prompt_larger_than_the_bucket_once_full():
+    limiter = TokenBucketLimiter(tokens_per_minute=100)
+    assert limiter.acquire(10_000) == 0
+
+
+def test_limiter_counts_requests():
+    limiter = TokenBucketLimiter(requests_per_minute=1200)  # 20 per second
+    for _ in range(1200):
+        assert limiter.acquire() == 0
+    assert limiter.acquire() > 0
+
+
+def test_limiter_pauses_and_slows_down_after_a_rate_limit():
+    limiter = TokenBucketLimiter(requests_per_minute=60_000)
+    limiter.on_rate_limited(retry_after=0.1)
+    assert limiter.is_paused()
+    assert limiter._scale == 0.5
+    assert limiter.acquire() >= 0.09
+    assert not limiter.is_paused()
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter._scale == 1.0
+
+
+class SlowBackend(GraderBackend):
+    """Streams its chunks with a pause before each one."""
+
+    provider = "slow"
+
+    def __init__(self, pause):
+        super().__init__("slow")
+        self.pause = pause
+
+    def _chunks(self):
+        for chunk in ('{"feedback_comment": ', '"ok"}'):
+            time.sleep(self.pause)
+            yield chunk
+
+    def _generate(self, prompt, json_output, response_schema, deadline):
+        text, _ = self._collect_stream(self._chunks(), json_output, deadline)
+        time.sleep(self.pause)  # Closing the stream after the whole answer arrived
+        return LLMResponse(text)
+
+
+def test_response_that_arrived_is_kept_past_the_deadline(monkeypatch):
+    monkeypatch.setattr(grader_backends, "LLM_TIMEOUT", 0.25)
+    response = SlowBackend(pause=0.1).generate("prompt")
+    assert response.text == '{"feedback_comment": "ok"}'
+
+
+def test_stream_still_in_flight_at_the_deadline_times_out(monkeypatch):
+    monkeypatch.setattr(grader_backends, "LLM_TIMEOUT", 0.05)
+    with pytest.raises(LLMTimeoutError):
+        SlowBackend(pause=0.1).generate("prompt", json_output=False)
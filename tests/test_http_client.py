@@ -0,0 +1,21 @@
+from http_client import create_session, get_session, RETRY_STATUS_CODES
+
+
+def retry_of(session):
+    return session.get_adapter("https://api.github.com").max_retries
+
+
+def test_github_session_leaves_rate_limits_to_the_caller():
+    retry = retry_of(get_session("github"))
+    assert retry.status_forcelist == (502, 503, 504)
+    assert not retry.respect_retry_after_header  # urllib3 would otherwise still sleep on a 429's Retry-After
+
+
+def test_other_sessions_retry_rate_limits():
+    assert retry_of(create_session()).status_forcelist == RETRY_STATUS_CODES
+    assert retry_of(get_session("supabase")).respect_retry_after_header
+
+
+def test_sessions_are_shared_per_service():
+    assert get_session("github") is get_session("github")
+    assert get_session("github") is not get_session("moodle")
@@ -0,0 +1,57 @@
+import os, json
+import pytest
+import main
+from job_state_store import JobStateStore, STAGE_REPORTED
+
+CORPUS = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "corpus", "submissions.jsonl")
+
+with open(CORPUS, encoding="utf-8") as corpus:
+    SUBMISSION = json.loads(corpus.readline())
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStateStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_job_keys():
+    assert JobStateStore.make_key({"submissionid": 5, "timecreated": 100}) == "5:100"
+    assert JobStateStore.make_key({"submissionid": 5}) is None
+    regrade = {"submissionid": 5, "timecreated": 100, "regrade": True}
+    assert JobStateStore.make_key(regrade) is None
+    assert JobStateStore.make_key({**regrade, "requestid": "r1"}) == "5:100:regrade:r1"
+
+
+def test_stages_are_recorded_per_job(store):
+    store.record("5:100", STAGE_REPORTED, {"status": "success"})
+    assert store.completed_stages("5:100") == {STAGE_REPORTED: {"status": "success"}}
+    assert store.completed_stages("5:100:regrade:r1") == {}
+
+
+@pytest.fixture
+def worker(monkeypatch, store):
+    """Runs `main.process_submission` up to the GitHub fetch, recording whether it got there."""
+    fetched = []
+
+    def create_repository(github_link):
+        fetched.append(github_link)
+        raise RuntimeError("stop before GitHub")
+
+    monkeypatch.setattr(main, "job_store", store)
+    monkeypatch.setattr(main, "create_repository", create_repository)
+    monkeypatch.setattr(main, "send_status_report", lambda *args: None)
+    return fetched
+
+
+def test_duplicate_of_a_reported_submission_is_not_graded_again(worker, store):
+    store.record(JobStateStore.make_key(SUBMISSION), STAGE_REPORTED, {"status": "success"})
+    assert main.process_submission(json.dumps(SUBMISSION).encode())
+    assert worker == []
+
+
+@pytest.mark.parametrize("request_fields", [{}, {"requestid": "regrade-1"}])
+def test_regrade_of_a_reported_submission_is_graded_again(worker, store, request_fields):
+    store.record(JobStateStore.make_key(SUBMISSION), STAGE_REPORTED, {"status": "success"})
+    regrade = {**SUBMISSION, "regrade": True, **request_fields}
+    main.process_submission(json.dumps(regrade).encode())
+    assert worker == ["https://github.com/student0/assignment-1"]
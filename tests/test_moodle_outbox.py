@@ -0,0 +1,98 @@
+import pytest
+import requests
+import moodle_service
+from moodle_service import MoodleService, MoodleError
+from moodle_outbox import MoodleOutbox
+
+
+class FakeMoodle:
+    """Records grade deliveries; `batch_error` / `single_error` make the next calls fail."""
+
+    def __init__(self):
+        self.calls = []
+        self.batch_error = None
+        self.single_error = None
+
+    def save_grades(self, assignmentid, grades):
+        self.calls.append(("batch", assignmentid, [userid for userid, _ in grades]))
+        if self.batch_error:
+            raise self.batch_error
+
+    def save_grade(self, assignmentid, userid, grade_results):
+        self.calls.append(("single", assignmentid, userid))
+        if self.single_error:
+            raise self.single_error
+
+
+@pytest.fixture
+def moodle(monkeypatch):
+    monkeypatch.setattr(moodle_service, "MOODLE_API_URL", "https://moodle.test/webservice/rest/server.php")
+    monkeypatch.setattr(moodle_service, "MOODLE_API_TOKEN", "secret")
+    fake = FakeMoodle()
+    monkeypatch.setattr(MoodleService, "save_grades", fake.save_grades)
+    monkeypatch.setattr(MoodleService, "save_grade", fake.save_grade)
+    return fake
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    abandoned = []
+    box = MoodleOutbox(str(tmp_path / "outbox.sqlite3"), batch_size=10, max_attempts=2,
+                       on_abandoned=lambda context, error: abandoned.append(context))
+    box.start = lambda: None  # Flushed explicitly by the tests
+    box.abandoned = abandoned
+    yield box
+    box._connection.close()
+
+
+def enqueue(outbox, assignmentid, *userids):
+    for userid in userids:
+        outbox.enqueue(assignmentid, userid, {"feedback_comment": f"user {userid}"}, context={"userid": userid})
+
+
+def test_grades_of_an_assignment_go_in_one_batch(moodle, outbox):
+    enqueue(outbox, 1, "a", "b")
+    enqueue(outbox, 2, "c")
+    assert outbox.flush() == 3
+    assert moodle.calls == [("batch", "1", ["a", "b"]), ("single", "2", "c")]
+    assert outbox.pending() == 0
+
+
+def test_newer_grade_replaces_a_waiting_one(moodle, outbox):
+    enqueue(outbox, 1, "a")
+    outbox.enqueue(1, "a", {"feedback_comment": "regraded"})
+    assert outbox.pending() == 1
+
+
+def test_transient_batch_failure_retries_the_batch(moodle, outbox):
+    enqueue(outbox, 1, "a", "b")
+    moodle.batch_error = requests.HTTPError("Moodle API request failed: 503 - down")
+    assert outbox.flush() == 0
+    assert moodle.calls == [("batch", "1", ["a", "b"])]
+    assert outbox.pending() == 2
+
+    moodle.batch_error = None
+    assert outbox.flush(include_delayed=True) == 2
+    assert moodle.calls[-1] == ("batch", "1", ["a", "b"])
+    assert "1" not in outbox._single_only
+
+
+def test_rejected_batch_falls_back_to_single_grades(moodle, outbox):
+    enqueue(outbox, 1, "a", "b")
+    moodle.batch_error = MoodleError("Moodle API request failed: invalidparameter", errorcode="invalidparameter")
+    assert outbox.flush() == 2
+    assert moodle.calls == [("batch", "1", ["a", "b"]), ("single", "1", "a"), ("single", "1", "b")]
+    assert outbox._single_only == {"1"}
+
+    enqueue(outbox, 1, "c", "d")
+    outbox.flush()
+    assert moodle.calls[-2:] == [("single", "1", "c"), ("single", "1", "d")]
+
+
+def test_grade_is_abandoned_after_max_attempts(moodle, outbox):
+    enqueue(outbox, 1, "a")
+    moodle.single_error = requests.HTTPError("Moodle API request failed: 500 - boom")
+    outbox.flush()
+    assert outbox.pending() == 1 and outbox.abandoned == []
+    outbox.flush(include_delayed=True)
+    assert outbox.pending() == 0 and outbox.abandoned == [{"userid": "a"}]
@@ -0,0 +1,71 @@
+import pytest
+import requests
+import moodle_service
+from moodle_service import MoodleService, MoodleError
+
+RESULTS = {
+    "feedback_comment": "Good work",
+    "criteria_results": [
+        {"criterionid": 1, "levelid": 10, "remark": "Correct"},
+        {"criterionid": 2, "levelid": 21, "remark": "Readable"},
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def credentials(monkeypatch):
+    monkeypatch.setattr(moodle_service, "MOODLE_API_URL", "https://moodle.test/webservice/rest/server.php")
+    monkeypatch.setattr(moodle_service, "MOODLE_API_TOKEN", "secret")
+
+
+def test_grade_fields_without_prefix():
+    fields = MoodleService._grade_fields(RESULTS)
+    assert fields["grade"] == "100"
+    assert fields["plugindata[assignfeedbackcomments_editor][text]"] == "Good work"
+    assert fields["advancedgradingdata[rubric][criteria][1][criterionid]"] == 2
+    assert fields["advancedgradingdata[rubric][criteria][1][fillings][1][levelid]"] == 21
+    assert fields["advancedgradingdata[rubric][criteria][1][fillings][1][remark]"] == "Readable"
+
+
+def test_grade_fields_with_prefix_nest_every_field():
+    plain = MoodleService._grade_fields(RESULTS)
+    prefixed = MoodleService._grade_fields(RESULTS, "grades[3]")
+
+    assert len(prefixed) == len(plain)
+    assert prefixed["grades[3][grade]"] == "100"
+    assert prefixed["grades[3][workflowstate]"] == "graded"
+    assert prefixed["grades[3][plugindata][assignfeedbackcomments_editor][text]"] == "Good work"
+    assert prefixed["grades[3][advancedgradingdata][rubric][criteria][0][fillings][0][levelid]"] == 10
+    assert all(key.startswith("grades[3][") for key in prefixed)
+
+
+def test_build_grades_params():
+    params = MoodleService.build_grades_params(9, [(41, RESULTS), (42, {"feedback_comment": "Missing"})])
+    assert params["wsfunction"] == "mod_assign_save_grades"
+    assert params["assignmentid"] == 9
+    assert (params["grades[0][userid]"], params["grades[1][userid]"]) == (41, 42)
+    assert params["grades[1][plugindata][assignfeedbackcomments_editor][text]"] == "Missing"
+    assert not any(key.startswith("grades[1][advancedgradingdata]") for key in params)
+
+
+def test_build_grade_params_validates():
+    params = MoodleService.build_grade_params(9, 41, RESULTS)
+    assert params["wsfunction"] == "mod_assign_save_grade" and params["userid"] == 41
+    with pytest.raises(ValueError):
+        MoodleService.build_grade_params(9, 41, "not a dict")
+
+
+def test_missing_credentials(monkeypatch):
+    monkeypatch.setattr(moodle_service, "MOODLE_API_TOKEN", None)
+    with pytest.raises(ValueError):
+        MoodleService.build_grades_params(9, [(41, RESULTS)])
+
+
+def test_raise_for_error_tells_rejections_from_failures():
+    MoodleService.raise_for_error(200, "null")
+    with pytest.raises(MoodleError) as rejected:
+        MoodleService.raise_for_error(200, '{"exception": "invalid_parameter_exception", "errorcode": "invalidparameter"}')
+    assert rejected.value.errorcode == "invalidparameter"
+    with pytest.raises(requests.HTTPError) as failed:
+        MoodleService.raise_for_error(503, "Service Unavailable")
+    assert not isinstance(failed.value, MoodleError)
@@ -0,0 +1,62 @@
+import time
+from regrade_store import RegradeStore, admitted_changes, content_hash, file_hashes, is_small_change, update_file_hashes
+
+
+def change(filename, status="modified", additions=1, deletions=1, patch="@@ -1 +1 @@", **extra):
+    return {"filename": filename, "status": status, "additions": additions, "deletions": deletions,
+            "patch": patch, **extra}
+
+
+def test_small_change_limits():
+    changes = [change("a.py", additions=10), change("b.py", deletions=5)]
+    assert is_small_change(changes, max_files=2, max_lines=17)
+    assert not is_small_change(changes, max_files=1, max_lines=100)
+    assert not is_small_change(changes, max_files=2, max_lines=16)
+    assert is_small_change([], max_files=0, max_lines=0)
+
+
+def test_change_without_patch_is_not_small():
+    # GitHub omits the patch of binary or very large diffs
+    assert not is_small_change([change("a.py", patch=None)], max_files=5, max_lines=100)
+    assert is_small_change([change("old.py", status="removed", patch=None)], max_files=5, max_lines=100)
+
+
+def test_update_file_hashes_applies_changes():
+    previous = {"keep.py": "k", "edit.py": "e", "old_name.py": "o", "gone.py": "g"}
+    changes = [
+        change("edit.py"),
+        change("new_name.py", status="renamed", previous_filename="old_name.py"),
+        change("gone.py", status="removed"),
+        change("added.py", status="added"),
+    ]
+    changed_files = [{"path": path, "content": path * 2} for path in ("edit.py", "new_name.py", "added.py")]
+
+    hashes = update_file_hashes(previous, changes, changed_files)
+
+    assert hashes == {"keep.py": "k", **file_hashes(changed_files)}
+    assert hashes["edit.py"] == content_hash("edit.pyedit.py")
+
+
+def test_files_skipped_after_download_leave_the_hashes_and_the_prompt():
+    previous = {"a.py": "a", "data.py": "d"}
+    changes = [change("a.py"), change("data.py"), change("gone.py", status="removed")]
+    changed_files = [{"path": "a.py", "content": "new"}]  # data.py grew over the size limit
+
+    assert update_file_hashes(previous, changes, changed_files) == {"a.py": content_hash("new")}
+    assert [c["filename"] for c in admitted_changes(changes, changed_files)] == ["a.py", "gone.py"]
+
+
+def test_store_round_trip_and_expiry(tmp_path):
+    store = RegradeStore(str(tmp_path / "regrade.sqlite3"), ttl_seconds=60)
+    key = RegradeStore.make_key(3, 42)
+    state = {"repo": "r", "commit_sha": "abc", "files": {"a.py": "h"}, "review": {}, "context_hash": "c"}
+
+    assert key == "3:42" and RegradeStore.make_key(3, None) is None
+    assert store.get(key) is None
+    store.save(key, state)
+    assert store.get(key) == state
+
+    store.ttl_seconds = 0.01
+    time.sleep(0.02)
+    assert store.purge_expired() == 1
+    assert store.get(key) is None
@@ -0,0 +1,40 @@
+import pytest
+import retry_topology
+from retry_topology import failure_destination, get_attempt, retry_queue_arguments, retry_queue_name, ATTEMPT_HEADER
+
+
+@pytest.fixture(autouse=True)
+def backoff(monkeypatch):
+    monkeypatch.setattr(retry_topology, "RETRY_MAX_ATTEMPTS", 4)
+    monkeypatch.setattr(retry_topology, "RETRY_BASE_DELAY", 10.0)
+    monkeypatch.setattr(retry_topology, "RETRY_MAX_DELAY", 30.0)
+
+
+def test_failures_go_to_retry_queues_with_growing_delays():
+    headers = {"trace": "abc"}
+    destinations = []
+    for _ in range(3):
+        destination, headers = failure_destination("grading", headers)
+        destinations.append(destination)
+    assert destinations == ["grading.retry.10s", "grading.retry.20s", "grading.retry.30s"]
+    assert headers == {"trace": "abc", ATTEMPT_HEADER: 3}
+
+
+def test_last_attempt_goes_to_the_dead_letter_queue():
+    assert failure_destination("grading", {ATTEMPT_HEADER: 3}) == ("grading.dead", {ATTEMPT_HEADER: 4})
+
+
+def test_first_delivery_without_headers():
+    assert failure_destination("grading", None) == ("grading.retry.10s", {ATTEMPT_HEADER: 1})
+
+
+def test_unreadable_attempt_header_counts_as_first_delivery():
+    assert get_attempt({ATTEMPT_HEADER: "many"}) == 0
+    assert get_attempt({ATTEMPT_HEADER: "2"}) == 2
+
+
+def test_retry_queue_dead_letters_back_to_the_grading_queue():
+    assert retry_queue_name("grading", 2) == "grading.retry.20s"
+    assert retry_queue_arguments("grading", 2) == {
+        "x-message-ttl": 20000, "x-dead-letter-exchange": "", "x-dead-letter-routing-key": "grading"
+    }
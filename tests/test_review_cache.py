@@ -0,0 +1,60 @@
+import time
+import pytest
+from review_cache import ReviewCache, InMemoryReviewCache, SQLiteReviewCache, create_review_cache
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(**kwargs):
+        return create_review_cache(request.param, path=str(tmp_path / "reviews.sqlite3"), **kwargs)
+    return make
+
+
+def test_make_key_depends_on_backend_and_prompt():
+    key = ReviewCache.make_key("gemini", "prompt")
+    assert key == ReviewCache.make_key("gemini", "prompt")
+    assert key != ReviewCache.make_key("openai", "prompt")
+    assert key != ReviewCache.make_key("gemini", "prompt ")
+
+
+def test_round_trip_returns_a_copy(make_cache):
+    cache = make_cache()
+    cache.set("k", {"feedback_comment": "ok"})
+    review = cache.get("k")
+    review["feedback_comment"] = "changed"
+    assert cache.get("k") == {"feedback_comment": "ok"}
+    assert cache.get("missing") is None
+
+
+def test_entries_expire(make_cache):
+    cache = make_cache(ttl_seconds=0.01)
+    cache.set("k", {})
+    time.sleep(0.02)
+    assert cache.get("k") is None
+
+
+def test_least_recently_used_entries_are_evicted(make_cache):
+    cache = make_cache(max_entries=2)
+    cache.set("a", {"n": 1})
+    cache.set("b", {"n": 2})
+    assert cache.get("a") == {"n": 1}  # "b" is now the least recently used
+    cache.set("c", {"n": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"n": 1} and cache.get("c") == {"n": 3}
+
+
+def test_sqlite_purges_expired_entries_without_reading_them(tmp_path):
+    path = str(tmp_path / "reviews.sqlite3")
+    cache = SQLiteReviewCache(path, ttl_seconds=0.01)
+    cache.set("old", {})
+    time.sleep(0.02)
+
+    reopened = SQLiteReviewCache(path)
+    assert reopened._connection.execute("SELECT COUNT(*) FROM review_cache").fetchone()[0] == 0
+
+
+def test_create_review_cache():
+    assert create_review_cache("none") is None
+    assert isinstance(create_review_cache("memory"), InMemoryReviewCache)
+    with pytest.raises(ValueError):
+        create_review_cache("redis")
@@ -0,0 +1,53 @@
+from rubric_schema import build_response_schema, levels_by_criterion, validate_review
+
+CRITERIA = [
+    {"criterionid": 1, "criteriondescription": "Correctness", "levels": [{"id": 10}, {"id": 11}]},
+    {"criterionid": 2, "criteriondescription": "Style", "levels": [{"id": 20}, {"id": 21}]},
+]
+
+
+def review(*results, feedback="Well done."):
+    return {"criteria_results": list(results), "feedback_comment": feedback}
+
+
+def result(criterionid, levelid, remark="ok"):
+    return {"criterionid": criterionid, "levelid": levelid, "remark": remark}
+
+
+def test_levels_by_criterion_uses_string_ids():
+    assert levels_by_criterion(CRITERIA) == {"1": {"10", "11"}, "2": {"20", "21"}}
+
+
+def test_schema_restricts_ids_to_the_rubric():
+    item = build_response_schema(CRITERIA)["properties"]["criteria_results"]["items"]["properties"]
+    assert item["criterionid"]["enum"] == ["1", "2"]
+    assert item["levelid"]["enum"] == ["10", "11", "20", "21"]
+
+
+def test_valid_review_accepts_numeric_or_string_ids():
+    assert validate_review(review(result(1, 10), result("2", "21")), CRITERIA) == []
+
+
+def test_level_must_belong_to_its_criterion():
+    problems = validate_review(review(result(1, 20), result(2, 21)), CRITERIA)
+    assert problems == ['criteria_results[0]: levelid "20" is not a level of criterion "1" (allowed: 10, 11).']
+
+
+def test_unknown_duplicate_and_missing_criteria():
+    problems = validate_review(review(result(1, 10), result(1, 11), result(3, 30)), CRITERIA)
+    assert problems == [
+        'criteria_results[1]: criterionid "1" is graded more than once.',
+        'criteria_results[2]: unknown criterionid "3".',
+        "Missing criteria: 2.",
+    ]
+
+
+def test_malformed_reviews():
+    assert validate_review("not json", CRITERIA) == ["The response must be a JSON object, got str."]
+    assert validate_review({"error": "Invalid JSON"}, CRITERIA) == ["The response is not valid JSON."]
+    assert validate_review({"feedback_comment": 1}, CRITERIA) == [
+        '"feedback_comment" must be a string.', '"criteria_results" must be a list.'
+    ]
+    assert validate_review(review(result(1, 10, remark=None), "x", result(2, 20)), CRITERIA) == [
+        'criteria_results[0]: "remark" must be a string.', "criteria_results[1] must be an object."
+    ]
@@ -0,0 +1,64 @@
+import json
+from scheduling import (
+    FairScheduler, scheduling_key, submission_priority,
+    PRIORITY_BULK, PRIORITY_DRAFT, PRIORITY_NORMAL, PRIORITY_DEADLINE, PRIORITY_DEADLINE_WINDOW,
+)
+
+
+def drain_in_order(scheduler):
+    items = []
+    while (item := scheduler.get()) is not None:
+        items.append(item)
+    return items
+
+
+def test_courses_take_turns_within_a_priority():
+    scheduler = FairScheduler()
+    for i in range(4):
+        scheduler.put("bulk-course", f"bulk-{i}")
+    scheduler.put("small-course", "small-0")
+    scheduler.put("other-course", "other-0")
+    scheduler.put("small-course", "small-1")
+
+    assert len(scheduler) == 7
+    assert drain_in_order(scheduler) == [
+        "bulk-0", "small-0", "other-0", "bulk-1", "small-1", "bulk-2", "bulk-3"
+    ]
+    assert len(scheduler) == 0
+
+
+def test_higher_priority_goes_first():
+    scheduler = FairScheduler()
+    scheduler.put("a", "regrade", PRIORITY_BULK)
+    scheduler.put("a", "normal", PRIORITY_NORMAL)
+    scheduler.put("b", "deadline", PRIORITY_DEADLINE)
+    scheduler.put("b", "draft", PRIORITY_DRAFT)
+    assert drain_in_order(scheduler) == ["deadline", "normal", "draft", "regrade"]
+
+
+def test_drain_returns_everything_highest_priority_first():
+    scheduler = FairScheduler()
+    scheduler.put("a", 1, PRIORITY_BULK)
+    scheduler.put("a", 2, PRIORITY_NORMAL)
+    scheduler.put("b", 3, PRIORITY_NORMAL)
+    assert scheduler.drain() == [2, 3, 1]
+    assert len(scheduler) == 0 and scheduler.get() is None
+
+
+def test_submission_priority():
+    now = 1_000_000.0
+    assert submission_priority({"status": "submitted", "regrade": "true"}, now) == PRIORITY_BULK
+    assert submission_priority({"status": "draft"}, now) == PRIORITY_DRAFT
+    assert submission_priority({"status": "submitted"}, now) == PRIORITY_NORMAL
+    assert submission_priority({"status": "submitted", "duedate": now + 60}, now) == PRIORITY_DEADLINE
+    assert submission_priority({"status": "submitted", "duedate": now - 60}, now) == PRIORITY_DEADLINE
+    far = now + PRIORITY_DEADLINE_WINDOW + 60
+    assert submission_priority({"status": "submitted", "duedate": far}, now) == PRIORITY_NORMAL
+    assert submission_priority({"status": "submitted", "duedate": "soon"}, now) == PRIORITY_NORMAL
+
+
+def test_scheduling_key():
+    body = json.dumps({"courseid": 7, "status": "draft"}).encode()
+    assert scheduling_key(body) == (7, PRIORITY_DRAFT)
+    assert scheduling_key(body, message_priority=9) == (7, 9)
+    assert scheduling_key(b"not json") == (None, PRIORITY_NORMAL)